@@ -0,0 +1,170 @@
+"""Нагрузочное сравнение синхронного и асинхронного режимов бота.
+
+Поднимает локальный поддельный API prices_for_dates с задержкой ответа и прогоняет
+через обработчики бота диалоги /low множества одновременных пользователей. Для каждого
+пользователя замеряется время от ввода месяца до получения первого рейса.
+
+Запуск из корня репозитория: python -m benchmarks.async_load [--users 200] [--latency 0.3]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import telebot
+from telebot import asyncio_filters, types
+from telebot.async_telebot import AsyncTeleBot
+
+from benchmarks.fake_servers import FakeServers, make_update
+from database.history import history_db
+from handlers import async_handlers
+from handlers.custom_handlers import low
+from utils.async_http import http_client
+from utils.aviasales import flight_cache
+from utils.http_client import aviasales_client
+
+FAKE_TOKEN: str = '1:benchmark'
+STEPS: List[str] = ['/low', 'Москва', 'Санкт-Петербург']
+
+
+def month_for(user: int) -> str:
+    # У каждого пользователя свой месяц, чтобы запросы не попадали в кэш друг друга
+    return f'{2000 + user // 12}-{user % 12 + 1:02d}'
+
+
+def report(name: str, users: int, started_month: Dict[int, float], first_flight: Dict[int, float],
+           elapsed: float) -> None:
+    """Печатает перцентили задержки; пользователи, не получившие рейсов, считаются ошибками."""
+    timings: List[float] = sorted(first_flight[user] - started_month[user]
+                                  for user in range(1, users + 1) if user in first_flight)
+    print(f'{name:<8} пользователей={users:<5} ошибок={users - len(timings):<4} '
+          f'p50={statistics.median(timings) * 1000:8.1f} мс  '
+          f'p99={timings[int(len(timings) * 0.99)] * 1000:8.1f} мс  '
+          f'всего={elapsed:6.2f} с')
+
+
+class TrackingTeleBot(telebot.TeleBot):
+    """TeleBot, который сообщает об окончании каждого обработчика.
+
+    Обработчик сначала отправляет ответ и только потом регистрирует следующий шаг,
+    поэтому следующее сообщение пользователя можно отправлять лишь после его завершения.
+    """
+
+    def __init__(self, token: str, users: int) -> None:
+        super().__init__(token)
+        self.done: Dict[int, threading.Semaphore] = {user: threading.Semaphore(0) for user in range(1, users + 1)}
+
+    def _exec_task(self, task, *args, **kwargs) -> None:
+        message: types.Message = args[0]
+
+        def run() -> None:
+            try:
+                task(*args, **kwargs)
+            finally:
+                self.done[message.chat.id].release()
+
+        self.worker_pool.put(run)
+
+
+def run_sync(users: int) -> None:
+    """Синхронный TeleBot с пулом потоков, как в режиме polling."""
+    bot: TrackingTeleBot = TrackingTeleBot(FAKE_TOKEN, users)
+    first_flight: Dict[int, float] = {}
+
+    def send_message(chat_id: int, text: str, *args, **kwargs) -> None:
+        if 'Стоимость' in text:
+            first_flight.setdefault(chat_id, time.perf_counter())
+
+    bot.send_message = send_message
+    bot.reply_to = lambda message, text, *args, **kwargs: send_message(message.chat.id, text)
+    low.registrate(bot)
+
+    started_month: Dict[int, float] = {}
+    counter: List[int] = [0]
+    counter_lock: threading.Lock = threading.Lock()
+
+    def next_id() -> int:
+        with counter_lock:
+            counter[0] += 1
+            return counter[0]
+
+    def user_flow(user: int) -> None:
+        for text in STEPS:
+            bot.process_new_updates([make_update(next_id(), user, text)])
+            bot.done[user].acquire()
+        started_month[user] = time.perf_counter()
+        bot.process_new_updates([make_update(next_id(), user, month_for(user))])
+        bot.done[user].acquire()
+
+    started: float = time.perf_counter()
+    threads: List[threading.Thread] = [threading.Thread(target=user_flow, args=(user,)) for user in range(1, users + 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed: float = time.perf_counter() - started
+    bot.worker_pool.close()
+    report('polling', users, started_month, first_flight, elapsed)
+
+
+async def run_async(users: int) -> None:
+    """AsyncTeleBot с общей сессией aiohttp, как в режиме async."""
+    bot: AsyncTeleBot = AsyncTeleBot(FAKE_TOKEN)
+    bot.add_custom_filter(asyncio_filters.StateFilter(bot))
+    first_flight: Dict[int, float] = {}
+
+    async def send_message(chat_id: int, text: str, *args, **kwargs) -> None:
+        if 'Стоимость' in text:
+            first_flight.setdefault(chat_id, time.perf_counter())
+
+    async def reply_to(message: types.Message, text: str, *args, **kwargs) -> None:
+        await send_message(message.chat.id, text)
+
+    bot.send_message = send_message
+    bot.reply_to = reply_to
+    async_handlers.flights.registrate(bot)
+
+    started_month: Dict[int, float] = {}
+    update_ids = iter(range(1, 10 ** 9))
+
+    async def user_flow(user: int) -> None:
+        for text in STEPS:
+            await bot.process_new_updates([make_update(next(update_ids), user, text)])
+        started_month[user] = time.perf_counter()
+        await bot.process_new_updates([make_update(next(update_ids), user, month_for(user))])
+
+    started: float = time.perf_counter()
+    await asyncio.gather(*(user_flow(user) for user in range(1, users + 1)))
+    elapsed: float = time.perf_counter() - started
+    await http_client.close()
+    report('async', users, started_month, first_flight, elapsed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200, help='количество одновременных пользователей')
+    parser.add_argument('--latency', type=float, default=0.3, help='задержка ответа API в секундах')
+    args = parser.parse_args()
+
+    # История команд пишется во временную базу, чтобы не засорять database/history.db
+    history_path: str = os.path.join(tempfile.mkdtemp(), 'history.db')
+    history_db.init(history_path)
+
+    upstream: FakeServers = FakeServers(args.latency)
+    upstream.start()
+    aviasales_client.base_url = upstream.url
+    print(f'Задержка API: {args.latency * 1000:.0f} мс')
+
+    flight_cache.clear()
+    run_sync(args.users)
+    flight_cache.clear()
+    asyncio.run(run_async(args.users))
+    print(f'Запросов к API: {upstream.calls["prices_for_dates"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Замер задержки поиска городов по всему справочнику.
+
+Запуск из корня репозитория: python -m benchmarks.city_search
+"""
+import random
+import statistics
+import time
+from typing import Callable, List
+
+from database.city_search import city_matcher
+from database.gazetteer import CityRecord, gazetteer
+
+
+def make_typo(text: str, rng: random.Random) -> str:
+    """Удаляет из названия один случайный символ."""
+    if len(text) < 4:
+        return text
+    position: int = rng.randrange(1, len(text) - 1)
+    return text[:position] + text[position + 1:]
+
+
+def measure(name: str, queries: List[str], lookup: Callable[[str], object]) -> None:
+    """Выполняет поиск по каждому запросу и печатает перцентили задержки в микросекундах."""
+    timings: List[float] = []
+    for query in queries:
+        started: float = time.perf_counter()
+        lookup(query)
+        timings.append((time.perf_counter() - started) * 1e6)
+    timings.sort()
+    print(f'{name:<28} n={len(timings):<6} '
+          f'p50={statistics.median(timings):8.1f} мкс  '
+          f'p99={timings[int(len(timings) * 0.99)]:8.1f} мкс  '
+          f'max={timings[-1]:8.1f} мкс')
+
+
+def main() -> None:
+    rng: random.Random = random.Random(42)
+
+    started: float = time.perf_counter()
+    gazetteer.reload()
+    print(f'Загрузка справочника: {(time.perf_counter() - started) * 1000:.1f} мс, городов: {len(gazetteer)}')
+    started = time.perf_counter()
+    city_matcher.suggest('Москва')
+    print(f'Построение индекса: {(time.perf_counter() - started) * 1000:.1f} мс')
+
+    cities: List[CityRecord] = [gazetteer.record(row) for row in range(len(gazetteer))]
+    measure('resolve: точное ru', [city.ru for city in cities], city_matcher.resolve)
+    measure('resolve: нижний регистр', [city.ru.lower() for city in cities], city_matcher.resolve)
+    measure('resolve: латиница (name)', [city.name for city in cities], city_matcher.resolve)
+    measure('suggest: префикс', [city.ru[:4] for city in cities], city_matcher.suggest)
+    measure('suggest: опечатка', [make_typo(city.ru, rng) for city in cities], city_matcher.suggest)
+
+    found: int = sum(1 for city in cities if city in city_matcher.suggest(make_typo(city.ru, rng)))
+    print(f'Город с опечаткой найден в подсказках: {found / len(cities):.1%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Память, которую занимают незавершенные диалоги поиска билетов.
+
+Открывает много диалогов /low, брошенных после ввода города отправления, и сравнивает
+прежнее хранение (обработчик следующего шага telebot с замыканием и объектом города)
+с автоматом диалогов utils.conversation, а затем проверяет, что брошенные диалоги
+удаляются по истечении срока жизни.
+
+Запуск из корня репозитория: python -m benchmarks.conversations [--users 10000]
+"""
+import argparse
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+import telebot
+from telebot import types
+
+from database.city_search import city_matcher
+from database.gazetteer import CityRecord, gazetteer
+from handlers.custom_handlers import low
+from utils import state_store
+from utils.conversation import ConversationMachine
+from utils.state_store import MemoryStateStore
+
+FAKE_TOKEN: str = '1:benchmark'
+
+
+def make_message(chat_id: int, text: str) -> types.Message:
+    message: dict = {'message_id': chat_id, 'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+                     'chat': {'id': chat_id, 'type': 'private'}, 'date': int(time.time()), 'text': text}
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+    return types.Message.de_json(message)
+
+
+def make_bot() -> telebot.TeleBot:
+    bot: telebot.TeleBot = telebot.TeleBot(FAKE_TOKEN, threaded=False)
+    bot.send_message = lambda *args, **kwargs: None
+    return bot
+
+
+def measure(name: str, users: int, open_conversation: Callable[[int], None]) -> None:
+    """Открывает диалоги и печатает прирост памяти на один диалог."""
+    tracemalloc.start()
+    before: int = tracemalloc.get_traced_memory()[0]
+    for chat_id in range(1, users + 1):
+        open_conversation(chat_id)
+    after: int = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f'{name:<28} диалогов={users:<7} памяти={(after - before) / 1024:9.1f} КБ  '
+          f'на диалог={(after - before) / users:7.1f} байт')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10_000, help='количество брошенных диалогов')
+    args = parser.parse_args()
+
+    # Замеряется только состояние диалогов: история команд не пишется, индекс городов строится заранее
+    low.add_to_history = lambda user_id, command: None
+    city_matcher.resolve('Москва')
+    moscow: CityRecord = gazetteer.get_by_ru('Москва')
+
+    # Прежняя схема: обработчик следующего шага хранит функцию и объект города в памяти процесса
+    legacy_bot: telebot.TeleBot = make_bot()
+
+    def process_date_departure(message: types.Message, departure_city: CityRecord) -> None:
+        pass
+
+    def legacy_open(chat_id: int) -> None:
+        # Как прежний process_second_city: в аргументах новый объект города из базы
+        legacy_bot.register_next_step_handler_by_chat_id(chat_id, process_date_departure,
+                                                         departure_city=CityRecord(*moscow))
+
+    measure('прежний next_step_handler', args.users, legacy_open)
+
+    bot: telebot.TeleBot = make_bot()
+    store: MemoryStateStore = MemoryStateStore()
+    bot.conversations = ConversationMachine(bot, store)
+    bot.register_message_handler(bot.conversations.handle, content_types=['text'], func=bot.conversations.is_reply)
+    low.registrate(bot)
+
+    def conversation_open(chat_id: int) -> None:
+        bot.process_new_messages([make_message(chat_id, '/low')])
+        bot.process_new_messages([make_message(chat_id, 'Москва')])
+
+    measure('ConversationMachine', args.users, conversation_open)
+    stats: Dict[str, float] = bot.conversations.stats()
+    print(f'stats(): активных={stats["active"]}, байт состояния в JSON={stats["state_bytes"]}, '
+          f'на диалог={stats["state_bytes_per_conversation"]:.1f} байт')
+
+    # Срок жизни истек: следующая запись удаляет все брошенные диалоги
+    store.ttl = 0.5
+    state_store.CLEANUP_INTERVAL = 0
+    time.sleep(store.ttl)
+    bot.process_new_messages([make_message(args.users + 1, '/low')])
+    stats = bot.conversations.stats()
+    print(f'После истечения срока жизни: активных={stats["active"]}, чатов в хранилище={len(store._records)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+"""Сквозной нагрузочный тест бота без сети и ключей.
+
+Поднимает поддельные Aviasales, Meteosource и Telegram Bot API (benchmarks.fake_servers),
+запускает настоящего бота из main.py в выбранном режиме и направляет его на них. Множество
+пользователей одновременно присылают /low, /high, /custom (командой с аргументами и диалогом),
+/weather (названием города или геопозицией) и /history; следующее сообщение пользователь
+отправляет, только получив ответ на предыдущее и подумав --think секунд (обработчики диалогов
+регистрируют следующий шаг после отправки вопроса, и мгновенный ответ мог бы его опередить). Для каждой команды печатаются количество,
+пропускная способность, перцентили времени от последнего сообщения пользователя до полного
+ответа и ошибки, а также число запросов к API, отправленных сообщений и повторов после 429.
+В конце по метрикам бота печатается, сколько в среднем занимает каждый шаг каждой команды
+и сколько из этого времени ушло на SQLite, справочники, запросы к API, разметку результатов
+и отправки в Telegram. С --profile PREFIX во время теста работает профилировщик (utils.profiler):
+стеки снимаются у указанной доли обновлений, а в PREFIX.stacks.folded и PREFIX.spans.folded
+записываются стеки и запросы сохраненных трасс для flamegraph.pl.
+
+Лимиты Telegram на отправку по умолчанию сняты, чтобы замерять обработку, а не очередь
+(один прогноз погоды - это 21 сообщение, и при лимите 1 сообщение в секунду на чат ответ
+занимает около 20 секунд); --telegram-limits оставляет лимиты из настроек.
+
+Запуск из корня репозитория: python -m benchmarks.end_to_end [--mode polling] [--users 100] [--rounds 5]
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from main import create_async_bot, create_bot
+from benchmarks.fake_servers import FORECAST_DAYS, FakeServers
+from config_data import config
+from database.history import history_db, history_writer
+from database.price_store import price_store
+from utils.async_http import http_client
+from utils.aviasales import flight_cache
+from utils.dispatcher import SendScheduler
+from utils.flight_pages import result_pages
+from utils.http_client import aviasales_client, meteosource_client
+from utils.metrics import HANDLER_OPERATION_SECONDS, HANDLER_SECONDS, registry
+from utils.profiler import profiler
+from utils.weather import forecast_cache
+
+FAKE_TOKEN: str = '1:benchmark'
+CITIES: Tuple[str, ...] = ('Москва', 'Санкт-Петербург', 'Самара', 'Казань', 'Новосибирск', 'Екатеринбург',
+                           'Калининград', 'Владивосток', 'Краснодар', 'Минеральные Воды')
+# Геопозиции для /weather: центр Москвы и Казани
+LOCATIONS: Tuple[Tuple[float, float], ...] = ((55.7558, 37.6173), (55.7963, 49.1088))
+# Ответ с такими словами завершает шаг досрочно и считается ошибкой
+ERROR_MARKERS: Tuple[str, ...] = ('Ошибка', 'ошибка', 'Что-то пошло не так', 'не найден', 'нет доступных')
+# Доли сценариев в нагрузке
+MIX: Dict[str, int] = {'/low': 3, '/low (диалог)': 1, '/high': 2, '/custom': 1, '/custom (диалог)': 1,
+                       '/weather': 3, '/history': 1}
+
+# Шаг сценария: сообщение пользователя (текст или геопозиция) и сколько ответов бота ждать
+Step = Tuple[object, int]
+
+
+def future_months(count: int) -> List[str]:
+    """Ближайшие месяцы, начиная со следующего."""
+    today: datetime.date = datetime.date.today()
+    return [f'{today.year + (today.month + i - 1) // 12}-{(today.month + i - 1) % 12 + 1:02d}'
+            for i in range(1, count + 1)]
+
+
+def make_scenario(name: str, rnd: random.Random, routes: List[Tuple[str, str, str]]) -> List[Step]:
+    """Сообщения пользователя для одного сценария нагрузки.
+
+    Args:
+        name (str): Название сценария из MIX.
+        rnd (random.Random): Генератор случайных чисел пользователя.
+        routes (List[Tuple[str, str, str]]): Направления и месяцы, из которых выбираются запросы.
+
+    Returns:
+        List[Step]: Шаги сценария.
+    """
+    origin, destination, month = rnd.choice(routes)
+    if name in ('/low', '/high'):
+        return [(f'{name} {origin} {destination} {month}', 1)]
+    if name == '/custom':
+        return [(f'/custom {origin} {destination} {month} 3000-9000', 1)]
+    if name in ('/low (диалог)', '/custom (диалог)'):
+        steps: List[Step] = [(name.split()[0], 1), (origin, 1), (destination, 1), (month, 1)]
+        return steps + [('3000-9000', 1)] if name.startswith('/custom') else steps
+    if name == '/weather':
+        place: object = rnd.choice(LOCATIONS) if rnd.random() < 0.2 else rnd.choice(CITIES)
+        return [('/weather', 1), (place, FORECAST_DAYS)]
+    return [('/history', 1)]
+
+
+class Replies:
+    """Ответы бота по чатам: драйвер пользователя ждет нужное количество сообщений."""
+
+    def __init__(self, chats: int) -> None:
+        self._conditions: Dict[int, threading.Condition] = {chat_id: threading.Condition()
+                                                            for chat_id in range(1, chats + 1)}
+        self._texts: Dict[int, List[str]] = {chat_id: [] for chat_id in range(1, chats + 1)}
+
+    def add(self, chat_id: int, text: str) -> None:
+        condition: threading.Condition = self._conditions[chat_id]
+        with condition:
+            self._texts[chat_id].append(text)
+            condition.notify()
+
+    def wait(self, chat_id: int, start: int, count: int, timeout: float) -> Tuple[str, int]:
+        """Ждет `count` ответов после `start`-го или ответа с ошибкой.
+
+        Returns:
+            Tuple[str, int]: Итог шага ('ok', 'error' или 'timeout') и сколько всего ответов получено.
+        """
+        condition: threading.Condition = self._conditions[chat_id]
+        texts: List[str] = self._texts[chat_id]
+        deadline: float = time.monotonic() + timeout
+        with condition:
+            while True:
+                if any(marker in text for text in texts[start:] for marker in ERROR_MARKERS):
+                    return 'error', len(texts)
+                if len(texts) >= start + count:
+                    return 'ok', len(texts)
+                left: float = deadline - time.monotonic()
+                if left <= 0:
+                    return 'timeout', len(texts)
+                condition.wait(left)
+
+
+class BotRunner:
+    """Настоящий бот из main.py, который в отдельном потоке опрашивает поддельный Telegram."""
+
+    def __init__(self, mode: str, telegram_limits: bool) -> None:
+        self.mode: str = mode
+        self.telegram_limits: bool = telegram_limits
+        self.bot = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self.bot = create_async_bot() if self.mode == 'async' else create_bot()
+        if not self.telegram_limits:
+            unlimited: float = 10 ** 6
+            self.bot.dispatcher.scheduler = SendScheduler(unlimited, unlimited, unlimited, unlimited)
+        target: Callable[[], None] = self._run_async if self.mode == 'async' else self._run_polling
+        self._thread = threading.Thread(target=target, name='bot', daemon=True)
+        self._thread.start()
+
+    def _run_polling(self) -> None:
+        self.bot.infinity_polling(timeout=10, long_polling_timeout=1)
+
+    def _run_async(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._task = self._loop.create_task(self.bot.infinity_polling(timeout=1))
+        self._loop.run_until_complete(self._task)
+        self._loop.run_until_complete(self._close_async())
+        self._loop.close()
+
+    async def _close_async(self) -> None:
+        await self.bot.dispatcher.stop()
+        await http_client.close()
+        await self.bot.close_session()
+
+    def stop(self) -> None:
+        """Останавливает опрос, дожидается отправки очереди и записи истории."""
+        if self.mode == 'async':
+            self._loop.call_soon_threadsafe(self._task.cancel)
+            self._thread.join()
+        else:
+            self.bot.stop_polling()
+            self._thread.join()
+            self.bot.dispatcher.stop()
+        history_writer.stop()
+
+    def metrics(self) -> Dict[str, float]:
+        return self.bot.dispatcher.metrics()
+
+
+def percentile(values: List[float], quantile: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * quantile))] if values else 0.0
+
+
+def report(results: Dict[str, List[Tuple[str, float]]], elapsed: float) -> None:
+    """Печатает по каждому сценарию количество, пропускную способность, задержки и ошибки."""
+    print(f'{"сценарий":<18} {"всего":>6} {"в сек":>7} {"p50 мс":>8} {"p95 мс":>8} {"p99 мс":>8} '
+          f'{"max мс":>8} {"ошибок":>7} {"таймаутов":>9}')
+    rows: List[Tuple[str, List[Tuple[str, float]]]] = sorted(results.items())
+    rows.append(('всего', [result for _, outcomes in rows for result in outcomes]))
+    for name, outcomes in rows:
+        latencies: List[float] = sorted(latency for status, latency in outcomes if status == 'ok')
+        errors: int = sum(status == 'error' for status, _ in outcomes)
+        timeouts: int = sum(status == 'timeout' for status, _ in outcomes)
+        print(f'{name:<18} {len(outcomes):>6} {len(outcomes) / elapsed:>7.1f} '
+              f'{percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.95) * 1000:>8.1f} '
+              f'{percentile(latencies, 0.99) * 1000:>8.1f} {percentile(latencies, 1.0) * 1000:>8.1f} '
+              f'{errors:>7} {timeouts:>9}')
+
+
+def report_breakdown() -> None:
+    """Из чего складывается обработка каждого шага по метрикам бота (utils.metrics).
+
+    Запросы к API по нескольким месяцам идут одновременно, поэтому время http может быть
+    больше времени обработки, а отправки из очереди выполняются уже после нее.
+    """
+    kinds: Tuple[str, ...] = ('sqlite', 'reference', 'http', 'render', 'telegram')
+    spent: Dict[Tuple[str, ...], float] = registry.counters(HANDLER_OPERATION_SECONDS)
+    print(f'\n{"команда":<12} {"шаг":<20} {"всего":>6} {"мс":>8}' + ''.join(f' {kind + " мс":>13}' for kind in kinds))
+    for (handler, step), histogram in sorted(registry.histograms(HANDLER_SECONDS).items()):
+        print(f'{handler:<12} {step:<20} {histogram.count:>6} {histogram.sum / histogram.count * 1000:>8.1f}'
+              + ''.join(f' {spent.get((handler, step, kind), 0.0) / histogram.count * 1000:>13.2f}'
+                        for kind in kinds))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=('polling', 'async'), default='polling', help='режим работы бота')
+    parser.add_argument('--users', type=int, default=100, help='количество одновременных пользователей')
+    parser.add_argument('--rounds', type=int, default=5, help='сколько сценариев выполняет каждый пользователь')
+    parser.add_argument('--routes', type=int, default=30, help='сколько разных направлений и месяцев запрашивать')
+    parser.add_argument('--latency', type=float, default=0.2, help='задержка ответов API в секундах')
+    parser.add_argument('--jitter', type=float, default=0.1, help='случайная добавка к задержке API в секундах')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов API с ошибкой 500')
+    parser.add_argument('--pages', type=int, default=2, help='страниц рейсов на месяц')
+    parser.add_argument('--telegram-latency', type=float, default=0.01, help='задержка ответов Telegram в секундах')
+    parser.add_argument('--telegram-error-rate', type=float, default=0.0, help='доля ответов 429 на отправку')
+    parser.add_argument('--telegram-limits', action='store_true', help='не снимать лимиты отправки сообщений')
+    parser.add_argument('--think', type=float, default=0.5,
+                        help='среднее время в секундах, за которое пользователь отвечает на сообщение бота')
+    parser.add_argument('--timeout', type=float, default=60, help='сколько секунд ждать ответа на шаг')
+    parser.add_argument('--profile', metavar='PREFIX', help='включить профилировщик и записать трассы в PREFIX.*')
+    parser.add_argument('--profile-rate', type=float, default=0.05, help='доля обновлений со снятием стеков')
+    args = parser.parse_args()
+
+    servers: FakeServers = FakeServers(args.latency, args.jitter, args.error_rate, args.pages,
+                                       args.telegram_latency, args.telegram_error_rate)
+    servers.start()
+    replies: Replies = Replies(args.users)
+    servers.on_message = replies.add
+    # Ключи не нужны поддельным сервисам, но без них запросы не собираются
+    config.BOT_TOKEN, config.TELEGRAM_API_URL = FAKE_TOKEN, servers.url
+    config.AVIASALES_API_KEY = config.RAPID_API_KEY = 'benchmark'
+    aviasales_client.base_url = meteosource_client.base_url = servers.url
+
+    # История команд и цен пишется во временные файлы, чтобы не засорять папку database
+    directory: str = tempfile.mkdtemp()
+    history_db.init(os.path.join(directory, 'history.db'))
+    price_store.path = os.path.join(directory, 'prices.bin')
+    for cache in (flight_cache, forecast_cache, result_pages):
+        cache.clear()
+
+    if args.profile:
+        profiler.configure(True, args.profile_rate)
+    runner: BotRunner = BotRunner(args.mode, args.telegram_limits)
+    runner.start()
+    while not servers.calls['getUpdates']:
+        time.sleep(0.01)
+
+    rnd: random.Random = random.Random(1)
+    routes: List[Tuple[str, str, str]] = [(*rnd.sample(CITIES, 2), rnd.choice(future_months(3)))
+                                          for _ in range(args.routes)]
+    names: List[str] = list(MIX)
+    results: Dict[str, List[Tuple[str, float]]] = defaultdict(list)
+    results_lock: threading.Lock = threading.Lock()
+
+    def user_flow(chat_id: int) -> None:
+        user_rnd: random.Random = random.Random(chat_id)
+        received: int = 0
+        for name in user_rnd.choices(names, weights=list(MIX.values()), k=args.rounds):
+            status: str = 'ok'
+            for message, count in make_scenario(name, user_rnd, routes):
+                time.sleep(user_rnd.uniform(0.5, 1.5) * args.think)
+                started: float = time.perf_counter()
+                if isinstance(message, tuple):
+                    servers.push_update(chat_id, location=message)
+                else:
+                    servers.push_update(chat_id, message)
+                status, total = replies.wait(chat_id, received, count, args.timeout)
+                # Лишние ответы после ошибки или таймаута не должны засчитываться следующему шагу
+                received = total
+                if status != 'ok':
+                    break
+            with results_lock:
+                results[name].append((status, time.perf_counter() - started))
+
+    print(f'режим={args.mode} пользователей={args.users} сценариев на пользователя={args.rounds} '
+          f'задержка API={args.latency * 1000:.0f}±{args.jitter * 1000:.0f} мс ошибок API={args.error_rate:.0%} '
+          f'лимиты Telegram={"да" if args.telegram_limits else "нет"}')
+    started: float = time.perf_counter()
+    threads: List[threading.Thread] = [threading.Thread(target=user_flow, args=(chat_id,))
+                                       for chat_id in range(1, args.users + 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed: float = time.perf_counter() - started
+    runner.stop()
+
+    report(results, elapsed)
+    metrics: Dict[str, float] = runner.metrics()
+    print(f'\nвремя={elapsed:.2f} с  запросов prices_for_dates={servers.calls["prices_for_dates"]} '
+          f'(500: {servers.calls["prices_for_dates_500"]})  запросов /daily={servers.calls["daily"]} '
+          f'(500: {servers.calls["daily_500"]})')
+    print(f'отправлено сообщений={servers.calls["sendMessage"]} (429: {servers.calls["sendMessage_429"]}) '
+          f'повторов отправки={metrics["retried"]:.0f} неотправленных={metrics["failed"]:.0f} '
+          f'ожидание в очереди p99={metrics["latency_p99"] * 1000:.1f} мс')
+    print(f'кэш рейсов: {flight_cache.stats()}\nкэш погоды: {forecast_cache.stats()}')
+    report_breakdown()
+    if args.profile:
+        for name, text in (('stacks', profiler.folded_stacks()), ('spans', profiler.folded_spans())):
+            with open(f'{args.profile}.{name}.folded', 'w', encoding='utf-8') as file:
+                file.write(text)
+        print(f'\nпрофилировщик: {profiler.status()}\n{profiler.format_traces(limit=1)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""Поддельные Aviasales, Meteosource и Telegram Bot API для запуска и замеров бота без ключей.
+
+Один HTTP-сервер отвечает на те же пути, что и настоящие сервисы:
+ - /aviasales/v3/prices_for_dates - рейсы с реалистичными полями, по `pages` страниц на месяц,
+   цены детерминированы направлением и месяцем;
+ - /daily - прогноз Meteosource на 21 день;
+ - /bot<токен>/<метод> - Telegram Bot API: getUpdates отдает обновления, добавленные через
+   push_update(), а sendMessage и другие методы отправки запоминают сообщения.
+Задержку ответов и долю ошибок (500 у API, 429 у Telegram) можно задать, а счетчики
+вызовов по каждому методу лежат в `calls`.
+
+Чтобы бот работал с ним, в keys.env указываются адрес сервера в AVIASALES_API_URL,
+METEOSOURCE_API_URL и TELEGRAM_API_URL.
+
+Запуск из корня репозитория: python -m benchmarks.fake_servers [--port 8081] [--latency 0.1] [--error-rate 0]
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import random
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from aiohttp import web
+from telebot import types
+
+from utils.aviasales import PAGE_LIMIT, PRICES_FOR_DATES_PATH
+from utils.weather import DAILY_FORECAST_PATH
+
+# Сколько дней в прогнозе /daily
+FORECAST_DAYS: int = 21
+# Методы Telegram, которые отправляют сообщение и возвращают его
+SEND_METHODS: Tuple[str, ...] = ('sendMessage', 'editMessageText', 'editMessageReplyMarkup')
+AIRLINES: Tuple[str, ...] = ('SU', 'S7', 'U6', 'DP', 'FV', 'UT')
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> types.Update:
+    """Обновление Telegram с текстовым сообщением пользователя (команды размечаются как bot_command)."""
+    return types.Update.de_json(message_update(update_id, chat_id, text))
+
+
+def message_update(update_id: int, chat_id: int, text: Optional[str] = None,
+                   location: Optional[Tuple[float, float]] = None) -> dict:
+    """Обновление Telegram в виде JSON: текст или геопозиция от пользователя `chat_id` в личном чате.
+
+    Args:
+        update_id (int): Номер обновления.
+        chat_id (int): Идентификатор пользователя и чата.
+        text (Optional[str]): Текст сообщения.
+        location (Optional[Tuple[float, float]]): Широта и долгота вместо текста.
+
+    Returns:
+        dict: Обновление в формате Bot API.
+    """
+    message: dict = {'message_id': update_id, 'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+                     'chat': {'id': chat_id, 'type': 'private'}, 'date': int(time.time())}
+    if location is not None:
+        message['location'] = {'latitude': location[0], 'longitude': location[1]}
+    else:
+        message['text'] = text
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+def month_flights(origin: str, destination: str, month: str, count: int) -> List[dict]:
+    """Рейсы направления за месяц по возрастанию цены; одинаковые для одинаковых аргументов."""
+    rnd: random.Random = random.Random(f'{origin}{destination}{month}')
+    base: int = rnd.randint(2500, 9000)
+    flights: List[dict] = []
+    for number in range(count):
+        departure: str = f'{month}-{rnd.randint(1, 28):02d}T{rnd.randint(0, 23):02d}:{rnd.choice((0, 15, 30, 45)):02d}:00'
+        airline: str = rnd.choice(AIRLINES)
+        flights.append({'origin': origin, 'destination': destination,
+                        'origin_airport': origin, 'destination_airport': destination,
+                        'price': base + rnd.randint(0, 120) * 50, 'airline': airline,
+                        'flight_number': str(rnd.randint(10, 9999)), 'departure_at': f'{departure}+03:00',
+                        'transfers': rnd.choice((0, 0, 1)), 'return_transfers': 0,
+                        'duration': rnd.randint(60, 600), 'duration_to': rnd.randint(60, 600),
+                        'link': f'/search/{origin}{departure[8:10]}{month[5:7]}{destination}1?t={airline}{number}'})
+    flights.sort(key=lambda flight: flight['price'])
+    return flights
+
+
+class FakeServers:
+    """Поддельные внешние сервисы бота в отдельном потоке со своим циклом событий."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, pages: int = 1,
+                 telegram_latency: float = 0.0, telegram_error_rate: float = 0.0, host: str = '127.0.0.1',
+                 port: int = 0, seed: int = 1) -> None:
+        """
+        Args:
+            latency (float): Задержка ответов Aviasales и Meteosource в секундах.
+            jitter (float): Случайная добавка к задержке, от 0 до `jitter` секунд.
+            error_rate (float): Доля ответов Aviasales и Meteosource с кодом 500.
+            pages (int): Сколько страниц рейсов отдавать на месяц; последняя страница неполная.
+            telegram_latency (float): Задержка ответов Telegram в секундах.
+            telegram_error_rate (float): Доля ответов 429 на отправку сообщений.
+            host (str): Адрес, который слушает сервер.
+            port (int): Порт; 0 - любой свободный.
+            seed (int): Начальное значение генератора задержек и ошибок.
+        """
+        self.latency: float = latency
+        self.jitter: float = jitter
+        self.error_rate: float = error_rate
+        self.pages: int = pages
+        self.telegram_latency: float = telegram_latency
+        self.telegram_error_rate: float = telegram_error_rate
+        self.host: str = host
+        self.port: int = port
+        self.url: str = ''
+        # Количество вызовов по методам, а также отданных ошибок: 'prices_for_dates', 'daily', 'sendMessage', ...
+        self.calls: Counter = Counter()
+        # Вызывается для каждого отправленного ботом сообщения: идентификатор чата и текст
+        self.on_message: Optional[Callable[[int, str], None]] = None
+        self._rnd: random.Random = random.Random(seed)
+        self._message_ids: itertools.count = itertools.count(1)
+        self._updates: List[dict] = []
+        self._update_ids: itertools.count = itertools.count(1)
+        self._started: threading.Event = threading.Event()
+        self._loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+        self._new_updates: Optional[asyncio.Condition] = None
+
+    def start(self) -> None:
+        """Запускает сервер и ждет, пока он начнет принимать соединения."""
+        threading.Thread(target=self._run, name='fake-servers', daemon=True).start()
+        self._started.wait()
+
+    def push_update(self, chat_id: int, text: Optional[str] = None,
+                    location: Optional[Tuple[float, float]] = None) -> None:
+        """Добавляет сообщение пользователя, которое бот получит через getUpdates; потокобезопасно.
+
+        Args:
+            chat_id (int): Идентификатор пользователя и чата.
+            text (Optional[str]): Текст сообщения.
+            location (Optional[Tuple[float, float]]): Геопозиция вместо текста.
+        """
+        self._loop.call_soon_threadsafe(self._push, chat_id, text, location)
+
+    def _push(self, chat_id: int, text: Optional[str], location: Optional[Tuple[float, float]]) -> None:
+        self._updates.append(message_update(next(self._update_ids), chat_id, text, location))
+        self._loop.create_task(self._notify_updates())
+
+    async def _notify_updates(self) -> None:
+        async with self._new_updates:
+            self._new_updates.notify_all()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._new_updates = asyncio.Condition()
+        app: web.Application = web.Application()
+        app.router.add_get(PRICES_FOR_DATES_PATH, self._prices_for_dates)
+        app.router.add_get(DAILY_FORECAST_PATH, self._daily)
+        app.router.add_route('*', '/bot{token}/{method}', self._telegram)
+        # Синхронный telebot передает текст сообщения в строке запроса, она бывает длиннее 8 КБ
+        runner: web.AppRunner = web.AppRunner(app, access_log=None, max_line_size=2 ** 20)
+        self._loop.run_until_complete(runner.setup())
+        site: web.TCPSite = web.TCPSite(runner, self.host, self.port)
+        self._loop.run_until_complete(site.start())
+        port: int = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://{"127.0.0.1" if self.host == "0.0.0.0" else self.host}:{port}'
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _upstream_delay(self) -> bool:
+        """Ждет задержку ответа API; True, если вместо ответа нужно вернуть ошибку."""
+        await asyncio.sleep(self.latency + self._rnd.uniform(0, self.jitter))
+        return self._rnd.random() < self.error_rate
+
+    async def _prices_for_dates(self, request: web.Request) -> web.Response:
+        self.calls['prices_for_dates'] += 1
+        if await self._upstream_delay():
+            self.calls['prices_for_dates_500'] += 1
+            return web.json_response({'success': False, 'error': 'internal error'}, status=500)
+        query = request.query
+        page: int = int(query.get('page', 1))
+        limit: int = int(query.get('limit', PAGE_LIMIT))
+        # Все страницы, кроме последней, заполнены целиком
+        total: int = limit * (self.pages - 1) + limit // 2
+        flights: List[dict] = month_flights(query['origin'], query['destination'], query['departure_at'], total)
+        return web.json_response({'success': True, 'currency': query.get('cy', 'rub'),
+                                  'data': flights[(page - 1) * limit:page * limit]})
+
+    async def _daily(self, request: web.Request) -> web.Response:
+        self.calls['daily'] += 1
+        if await self._upstream_delay():
+            self.calls['daily_500'] += 1
+            return web.json_response({'message': 'internal error'}, status=500)
+        lat: float = float(request.query['lat'])
+        rnd: random.Random = random.Random(f'{lat:.2f}{request.query["lon"]}')
+        today: datetime.date = datetime.date.today()
+        data: List[dict] = []
+        for offset in range(FORECAST_DAYS):
+            temperature: float = round(25 - abs(lat) / 3 + rnd.uniform(-5, 5), 1)
+            data.append({'day': (today + datetime.timedelta(days=offset)).isoformat(),
+                         'weather': rnd.choice(('sunny', 'mostly_cloudy', 'light_rain', 'overcast')),
+                         'temperature': temperature, 'temperature_min': round(temperature - 4, 1),
+                         'temperature_max': round(temperature + 4, 1),
+                         'wind': {'speed': round(rnd.uniform(0, 12), 1), 'dir': 'NW'},
+                         'precipitation': {'total': round(rnd.uniform(0, 5), 1), 'type': 'rain'}})
+        return web.json_response({'lat': request.query['lat'], 'lon': request.query['lon'], 'units': 'metric',
+                                  'daily': {'data': data}})
+
+    async def _telegram(self, request: web.Request) -> web.Response:
+        method: str = request.match_info['method']
+        self.calls[method] += 1
+        # Синхронный telebot передает параметры в строке запроса, асинхронный - в теле формы (даже у GET)
+        params: Dict[str, str] = {**request.query, **dict(parse_qsl((await request.read()).decode()))}
+        if method == 'getUpdates':
+            return web.json_response({'ok': True, 'result': await self._get_updates(params)})
+        if self.telegram_latency:
+            await asyncio.sleep(self.telegram_latency)
+        if method == 'getMe':
+            return web.json_response({'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'TravelBot',
+                                                             'username': 'fake_travel_bot'}})
+        if method not in SEND_METHODS:
+            return web.json_response({'ok': True, 'result': True})
+        if self._rnd.random() < self.telegram_error_rate:
+            self.calls[f'{method}_429'] += 1
+            return web.json_response({'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                                      'parameters': {'retry_after': 1}}, status=429)
+        chat_id: int = int(params['chat_id'])
+        text: str = params.get('text', '')
+        if self.on_message is not None:
+            self.on_message(chat_id, text)
+        return web.json_response({'ok': True, 'result': {
+            'message_id': next(self._message_ids), 'date': int(time.time()), 'text': text,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': 1, 'is_bot': True, 'first_name': 'TravelBot'}}})
+
+    async def _get_updates(self, params: Dict[str, str]) -> List[dict]:
+        offset: int = int(params.get('offset') or 0)
+        timeout: float = min(float(params.get('timeout') or 0), 1.0)
+        limit: int = int(params.get('limit') or 100)
+        # Подтвержденные ботом обновления больше не нужны
+        self._updates = [update for update in self._updates if update['update_id'] >= offset]
+        if not self._updates and timeout:
+            async with self._new_updates:
+                try:
+                    await asyncio.wait_for(self._new_updates.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        return self._updates[:limit]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1', help='адрес, который слушает сервер')
+    parser.add_argument('--port', type=int, default=8081, help='порт сервера')
+    parser.add_argument('--latency', type=float, default=0.1, help='задержка ответов API в секундах')
+    parser.add_argument('--jitter', type=float, default=0.05, help='случайная добавка к задержке в секундах')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов API с ошибкой 500')
+    parser.add_argument('--pages', type=int, default=2, help='страниц рейсов на месяц')
+    args = parser.parse_args()
+
+    servers: FakeServers = FakeServers(args.latency, args.jitter, args.error_rate, args.pages,
+                                       host=args.host, port=args.port)
+    servers.on_message = lambda chat_id, text: print(f'[{chat_id}] {text[:80]!r}')
+    servers.start()
+    print(f'Сервер запущен: {servers.url}\nДля бота: AVIASALES_API_URL={servers.url} '
+          f'METEOSOURCE_API_URL={servers.url} TELEGRAM_API_URL={servers.url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print(dict(servers.calls))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Поиск рейсов по диапазону месяцев: последовательные запросы против параллельных.
+
+Поддельный API prices_for_dates отвечает с задержкой и отдает по несколько полных
+страниц на месяц. Сравнивается время поиска по диапазону месяцев при запросах
+по очереди и при одновременных запросах utils.aviasales.get_prices_for_months
+(и его асинхронного варианта), а также проверяется, что порядок рейсов совпадает.
+
+Запуск из корня репозитория: python -m benchmarks.fanout [--months 6] [--pages 2] [--latency 0.1]
+"""
+import argparse
+import asyncio
+import time
+from operator import itemgetter
+from typing import List
+
+from benchmarks.fake_servers import FakeServers
+from config_data import config
+from utils.async_http import get_prices_for_months_async, http_client
+from utils.aviasales import fetch_month, flight_cache, get_prices_for_months, search_months
+from utils.http_client import aviasales_client
+
+
+def sequential(origin: str, destination: str, departure_at: str) -> List[dict]:
+    """Как было бы без параллельных запросов: месяцы по очереди, затем общая сортировка."""
+    flights: List[dict] = []
+    for month in search_months(departure_at):
+        flights.extend(fetch_month(origin, destination, month))
+    return sorted(flights, key=itemgetter('price'))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--months', type=int, default=6, help='количество месяцев в диапазоне')
+    parser.add_argument('--pages', type=int, default=2, help='страниц по 50 рейсов на месяц')
+    parser.add_argument('--latency', type=float, default=0.1, help='задержка ответа API в секундах')
+    args = parser.parse_args()
+
+    upstream: FakeServers = FakeServers(args.latency, pages=args.pages)
+    upstream.start()
+    aviasales_client.base_url = upstream.url
+    departure_at: str = f'2024-01..2024-{args.months:02d}' if args.months > 1 else '2024-01'
+    print(f'месяцев={args.months} страниц на месяц={min(args.pages, config.FLIGHT_MAX_PAGES)} '
+          f'задержка={args.latency * 1000:.0f} мс одновременно={config.FLIGHT_FANOUT_CONCURRENCY}')
+
+    def run(name: str, search) -> List[dict]:
+        flight_cache.clear()
+        upstream.calls.clear()
+        started: float = time.perf_counter()
+        flights: List[dict] = search()
+        elapsed: float = time.perf_counter() - started
+        print(f'{name:<22} запросов={upstream.calls["prices_for_dates"]:<4} рейсов={len(flights):<6} время={elapsed * 1000:8.1f} мс')
+        return flights
+
+    expected: List[dict] = run('по очереди', lambda: sequential('MOW', 'LED', departure_at))
+    fanout: List[dict] = run('параллельно (потоки)',
+                             lambda: list(get_prices_for_months('MOW', 'LED', departure_at)))
+
+    async def search_async() -> List[dict]:
+        try:
+            return list(await get_prices_for_months_async('MOW', 'LED', departure_at))
+        finally:
+            await http_client.close()
+
+    fanout_async: List[dict] = run('параллельно (asyncio)', lambda: asyncio.run(search_async()))
+    prices: List[int] = [flight['price'] for flight in expected]
+    print('Порядок совпадает:', [flight['price'] for flight in fanout] == prices
+          and [flight['price'] for flight in fanout_async] == prices)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""Замер записи и чтения истории команд на большой таблице.
+
+Заполняет временную базу миллионом записей истории и сравнивает прежнюю запись
+(подсчет, поиск самой старой, удаление, вставка без индекса) с текущей
+database.history.add_to_history после миграции.
+
+С флагом --crash вместо замеров проверяет, что история переживает падение процесса:
+дочерний процесс пишет историю пачками и убивается SIGKILL посреди записи, после чего
+база должна быть целой и содержать все пачки, о коммите которых он успел сообщить.
+
+Запуск из корня репозитория: python -m benchmarks.history [--rows 1000000] [--writes 200] [--crash]
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, List
+
+import peewee as pw
+
+from database.history import (MAX_HISTORY_ENTRIES, History, add_to_history, get_user_history, history_db,
+                              history_writer, migrate)
+
+# Сколько команд дочерний процесс пишет одной пачкой и после скольких записанных его убить
+CRASH_BATCH: int = 100
+CRASH_AFTER: int = 20_000
+
+
+def seed(path: str, rows: int) -> int:
+    """Создает базу истории со старой схемой и заполняет ее записями.
+
+    Returns:
+        int: Количество пользователей, у каждого MAX_HISTORY_ENTRIES записей.
+    """
+    users: int = rows // MAX_HISTORY_ENTRIES
+    db: pw.SqliteDatabase = pw.SqliteDatabase(path)
+    with History.bind_ctx(db), db:
+        History.create_table()
+        with db.atomic():
+            db.execute_sql('PRAGMA user_version = 1')
+            db.cursor().executemany(
+                'INSERT INTO history (user_id, command, timestamp) VALUES (?, ?, ?)',
+                ((str(user), '/low', f'2024-01-01 00:{entry:02d}:00')
+                 for entry in range(MAX_HISTORY_ENTRIES) for user in range(users)))
+    return users
+
+
+def legacy_add_to_history(user_id: str, command: str) -> None:
+    """Запись в историю так, как она была устроена в каждом обработчике до общего модуля."""
+    with History._meta.database:
+        count: int = History.select().where(History.user_id == user_id).count()
+        if count >= MAX_HISTORY_ENTRIES:
+            oldest_record: History = History.select().where(History.user_id == user_id).order_by(
+                History.timestamp.asc()).first()
+            oldest_record.delete_instance()
+        History.create(user_id=user_id, command=command)
+
+
+def legacy_get_user_history(user_id: str) -> List[str]:
+    with History._meta.database:
+        return [entry.command for entry in
+                History.select().where(History.user_id == user_id).order_by(History.timestamp)]
+
+
+def write_through(user_id: str, command: str) -> None:
+    """Запись без очереди: отдельная транзакция на каждую команду."""
+    add_to_history(user_id, command)
+    history_writer.flush()
+
+
+def crash_child(path: str) -> None:
+    """Бесконечно пишет историю пачками и после каждого коммита печатает число записанных команд."""
+    history_db.init(path)
+    # Пачки пишет только этот цикл, фоновый поток не должен записать часть пачки сам
+    history_writer.flush_interval, history_writer.batch_size = 3600, sys.maxsize
+    written: int = 0
+    while True:
+        for number in range(written, written + CRASH_BATCH):
+            # У каждой команды свой пользователь, чтобы ограничение длины истории ничего не удаляло
+            add_to_history(str(number), '/low')
+        written += history_writer.flush()
+        print(written, flush=True)
+
+
+def crash_check() -> bool:
+    """Убивает пишущий дочерний процесс и проверяет базу.
+
+    Returns:
+        bool: True, если база цела и в ней есть все подтвержденные записи.
+    """
+    directory: str = tempfile.mkdtemp()
+    path: str = os.path.join(directory, 'history.db')
+    try:
+        child: subprocess.Popen = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.history', '--crash-child', path],
+            stdout=subprocess.PIPE, text=True)
+        confirmed: int = 0
+        for line in child.stdout:
+            confirmed = int(line)
+            if confirmed >= CRASH_AFTER:
+                break
+        child.kill()
+        child.wait()
+
+        connection: sqlite3.Connection = sqlite3.connect(path)
+        integrity: str = connection.execute('PRAGMA integrity_check').fetchone()[0]
+        rows: int = connection.execute('SELECT COUNT(*) FROM history').fetchone()[0]
+        missing: int = connection.execute('SELECT ? - COUNT(*) FROM history WHERE CAST(user_id AS INTEGER) < ?',
+                                          (confirmed, confirmed)).fetchone()[0]
+        connection.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f'Подтверждено до SIGKILL: {confirmed}, в базе после: {rows}, '
+          f'потеряно: {missing}, integrity_check: {integrity}')
+    # Пачка, которая писалась в момент падения, должна оказаться в базе целиком или не оказаться вовсе
+    ok: bool = integrity == 'ok' and missing == 0 and (rows - confirmed) % CRASH_BATCH == 0
+    print('Проверка пройдена' if ok else 'Проверка НЕ пройдена')
+    return ok
+
+
+def measure(name: str, user_ids: List[str], call: Callable[[str], object]) -> None:
+    """Вызывает call для каждого пользователя и печатает перцентили задержки в миллисекундах."""
+    timings: List[float] = []
+    for user_id in user_ids:
+        started: float = time.perf_counter()
+        call(user_id)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(f'{name:<24} n={len(timings):<6} '
+          f'p50={statistics.median(timings):8.3f} мс  '
+          f'p99={timings[int(len(timings) * 0.99)]:8.3f} мс  '
+          f'max={timings[-1]:8.3f} мс')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000, help='количество записей в таблице')
+    parser.add_argument('--writes', type=int, default=200, help='количество замеряемых записей')
+    parser.add_argument('--crash', action='store_true', help='проверить сохранность истории при падении процесса')
+    parser.add_argument('--crash-child', metavar='PATH', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.crash_child:
+        crash_child(args.crash_child)
+        return
+    if args.crash:
+        sys.exit(0 if crash_check() else 1)
+
+    directory: str = tempfile.mkdtemp()
+    legacy_path: str = os.path.join(directory, 'legacy.db')
+    current_path: str = os.path.join(directory, 'history.db')
+    try:
+        started: float = time.perf_counter()
+        users: int = seed(legacy_path, args.rows)
+        shutil.copyfile(legacy_path, current_path)
+        print(f'Заполнение: {args.rows} записей, {users} пользователей, '
+              f'{time.perf_counter() - started:.1f} с')
+
+        rng: random.Random = random.Random(42)
+        user_ids: List[str] = [str(rng.randrange(users)) for _ in range(args.writes)]
+
+        legacy_db: pw.SqliteDatabase = pw.SqliteDatabase(legacy_path)
+        with History.bind_ctx(legacy_db):
+            measure('запись: прежняя', user_ids, lambda user_id: legacy_add_to_history(user_id, '/high'))
+            measure('чтение: прежнее', user_ids, legacy_get_user_history)
+
+        history_db.init(current_path)
+        started = time.perf_counter()
+        migrate()
+        print(f'Миграция (индекс user_id, timestamp): {time.perf_counter() - started:.1f} с')
+        measure('запись: add_to_history', user_ids, lambda user_id: add_to_history(user_id, '/high'))
+        started = time.perf_counter()
+        flushed: int = history_writer.flush()
+        print(f'Запись очереди в базу: {flushed} команд за {(time.perf_counter() - started) * 1000:.1f} мс')
+        measure('запись: по одной', user_ids, lambda user_id: write_through(user_id, '/high'))
+        measure('чтение: get_user_history', user_ids, get_user_history)
+
+        over_limit: int = history_db.execute_sql(
+            'SELECT COUNT(*) FROM (SELECT user_id FROM history GROUP BY user_id HAVING COUNT(*) > ?)',
+            (MAX_HISTORY_ENTRIES,)).fetchone()[0]
+        print(f'Пользователей с историей длиннее {MAX_HISTORY_ENTRIES}: {over_limit}')
+        history_writer.stop()
+        history_db.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
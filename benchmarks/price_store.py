@@ -0,0 +1,99 @@
+"""История цен для /trend: запись, загрузка, статистика и сжатие.
+
+Записывает в временный файл ответы prices_for_dates по множеству направлений, как
+при обычной работе бота, и замеряет дозапись, первую загрузку файла, запрос статистики
+/trend (векторно на NumPy против того же подсчета на чистом Python) и сжатие файла.
+Проверяет, что статистика совпадает.
+
+Запуск из корня репозитория: python -m benchmarks.price_store [--fetches 20000] [--routes 500]
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from database.price_store import RECORD_DTYPE, LAST_FETCH_WINDOW, PriceStore, TrendRow
+
+MONTHS: List[str] = ['2030-07', '2030-08', '2030-09']
+CODES: List[str] = ['MOW', 'LED', 'AER', 'KZN', 'OVB', 'SVX', 'KRR', 'MRV', 'KGD', 'UFA', 'IKT', 'VVO', 'ROV',
+                    'GOJ', 'KUF', 'CEK', 'TJM', 'PEE', 'SGC', 'MMK', 'AAQ', 'STW', 'OMS', 'KJA', 'BAX']
+
+
+def python_trend(rows: List[Tuple[str, str, int, int]], origin: str, destination: str,
+                 percentile: float) -> Dict[str, Tuple[int, int, int, int, int]]:
+    """Та же статистика перебором списка на Python."""
+    by_month: Dict[str, List[Tuple[int, int]]] = {}
+    for route, month, price, fetched in rows:
+        if route == origin + destination and month in MONTHS:
+            by_month.setdefault(month, []).append((price, fetched))
+    result: Dict[str, Tuple[int, int, int, int, int]] = {}
+    for month, points in by_month.items():
+        prices: List[int] = sorted(price for price, _ in points)
+        updated: int = max(fetched for _, fetched in points)
+        cut: List[float] = statistics.quantiles(prices, n=100, method='inclusive') if len(prices) > 1 else prices * 99
+        latest: int = min(price for price, fetched in points if fetched >= updated - LAST_FETCH_WINDOW)
+        high: float = prices[-1] if percentile >= 100 else cut[int(percentile) - 1]
+        result[month] = (len(prices), prices[0], round(statistics.median(prices)), round(high), latest)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--fetches', type=int, default=20000, help='сколько ответов API по 50 рейсов записать')
+    parser.add_argument('--routes', type=int, default=500, help='количество направлений')
+    parser.add_argument('--queries', type=int, default=200, help='количество запросов /trend')
+    args = parser.parse_args()
+
+    rnd: random.Random = random.Random(1)
+    routes: List[Tuple[str, str]] = rnd.sample([(a, b) for a in CODES for b in CODES if a != b], args.routes)
+    now: float = time.time()
+    directory: str = tempfile.mkdtemp()
+    store: PriceStore = PriceStore(os.path.join(directory, 'prices.bin'), retention_days=30)
+    rows: List[Tuple[str, str, int, int]] = []
+
+    started: float = time.perf_counter()
+    for _ in range(args.fetches):
+        origin, destination = rnd.choice(routes)
+        month: str = rnd.choice(MONTHS)
+        fetched: int = int(now - rnd.uniform(0, 60 * 86400))
+        base: int = rnd.randint(3000, 6000)
+        flights: List[dict] = [{'departure_at': f'{month}-{rnd.randint(1, 28):02d}T10:00:00+03:00',
+                                'price': base + rnd.randint(0, 50) * 100} for _ in range(50)]
+        store.record(origin, destination, flights, fetched)
+        rows.extend((origin + destination, month, flight['price'], fetched) for flight in flights)
+    elapsed: float = time.perf_counter() - started
+    size: int = os.path.getsize(store.path)
+    print(f'записей={len(rows)} направлений={args.routes} файл={size / 2 ** 20:.1f} МБ '
+          f'({RECORD_DTYPE.itemsize} байт на цену)')
+    print(f'{"дозапись ответа из 50 цен":<34} {elapsed / args.fetches * 1e6:10.1f} мкс')
+
+    started = time.perf_counter()
+    store.columns()
+    print(f'{"первая загрузка файла":<34} {(time.perf_counter() - started) * 1000:10.1f} мс')
+
+    queries: List[Tuple[str, str]] = [rnd.choice(routes) for _ in range(args.queries)]
+    started = time.perf_counter()
+    vectorized: List[List[TrendRow]] = [store.trend(origin, destination, MONTHS, 90) for origin, destination in queries]
+    print(f'{"/trend на NumPy":<34} {(time.perf_counter() - started) / args.queries * 1000:10.2f} мс на запрос')
+    started = time.perf_counter()
+    expected: List[Dict[str, tuple]] = [python_trend(rows, origin, destination, 90)
+                                        for origin, destination in queries[:max(1, args.queries // 20)]]
+    print(f'{"/trend перебором на Python":<34} '
+          f'{(time.perf_counter() - started) / len(expected) * 1000:10.2f} мс на запрос')
+    print('Статистика совпадает:', all(
+        {row.month: (row.count, row.min, row.median, row.percentile, row.latest) for row in result} == python
+        for result, python in zip(vectorized, expected)))
+
+    started = time.perf_counter()
+    before, after = store.compact(now)
+    print(f'{"сжатие файла":<34} {(time.perf_counter() - started) * 1000:10.1f} мс, '
+          f'записей {before} -> {after}, файл {os.path.getsize(store.path) / 2 ** 20:.1f} МБ')
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
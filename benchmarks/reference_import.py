@@ -0,0 +1,168 @@
+"""Обновление справочников из больших выгрузок Travelpayouts.
+
+Создает во временном каталоге выгрузки cities.json и airports.json в формате Travelpayouts
+(по умолчанию по 100 000 записей: все города и аэропорты из текущих баз с измененными
+координатами и названиями плюс новые) и копии баз, затем замеряет:
+ - разбор выгрузки целиком через json.load и потоком через iter_json_array: время и пик памяти;
+ - загрузку каждой выгрузки в базу: время, записей в секунду и (отдельным прогоном на новых
+   копиях баз, потому что tracemalloc замедляет код) пик памяти;
+ - поиск городов из другого потока во время загрузки, как у работающего бота: задержку поиска
+   и то, что справочник после замены файла перезагрузился с новыми городами.
+
+Запуск из корня репозитория: python -m benchmarks.reference_import [--records 100000] [--batch 10000]
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from database.gazetteer import CityRecord, Gazetteer
+from database.models import AIRPORTS_DB_PATH, CITIES_DB_PATH
+from database.reference_import import ImportStats, import_airports, import_cities, iter_json_array
+
+
+def new_code(number: int) -> str:
+    # Новые коды не пересекаются с трехбуквенными IATA-кодами справочника
+    digits: str = ''
+    while True:
+        number, rest = divmod(number, 36)
+        digits = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'[rest] + digits
+        if not number:
+            return 'N' + digits.rjust(4, '0')
+
+
+def city_items(records: int) -> Iterator[dict]:
+    rows: List[tuple] = sqlite3.connect(CITIES_DB_PATH).execute('SELECT name, ru, code, lon, lat FROM city').fetchall()
+    for number in range(records):
+        if number < len(rows):
+            name, ru, code, lon, lat = rows[number]
+            lon += 0.001
+        else:
+            code = new_code(number)
+            name, ru, lon, lat = f'Newtown {code}', f'Новгородок {code}', (number % 360) - 180.0, (number % 170) - 85.0
+        yield {'code': code, 'name': ru, 'coordinates': {'lon': lon, 'lat': lat}, 'time_zone': 'Europe/Moscow',
+               'name_translations': {'en': name}, 'cases': {'vi': f'в {ru}', 'da': ru, 'ro': f'{ru}а'},
+               'country_code': 'RU'}
+
+
+def airport_items(records: int) -> Iterator[dict]:
+    rows: List[tuple] = sqlite3.connect(AIRPORTS_DB_PATH).execute('SELECT name, code FROM airports').fetchall()
+    for number in range(records):
+        if number < len(rows):
+            name, code = rows[number]
+            name += ' (обновлено)'
+        else:
+            code = new_code(number)
+            name = f'Аэропорт {code}'
+        yield {'code': code, 'name': name, 'coordinates': {'lon': 37.0, 'lat': 55.0}, 'time_zone': 'Europe/Moscow',
+               'name_translations': {'en': f'Airport {code}'}, 'country_code': 'RU', 'city_code': code,
+               'iata_type': 'railway' if number % 20 == 19 else 'airport', 'flightable': True}
+
+
+def write_dump(path: str, items: Iterator[dict]) -> None:
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('[')
+        for number, item in enumerate(items):
+            file.write((',' if number else '') + json.dumps(item, ensure_ascii=False))
+        file.write(']')
+
+
+def timed(call: Callable[[], object]) -> Tuple[float, object]:
+    started: float = time.perf_counter()
+    result: object = call()
+    return time.perf_counter() - started, result
+
+
+def peak_memory(call: Callable[[], object]) -> float:
+    """Пик памяти Python-объектов (МБ) при вызове."""
+    tracemalloc.start()
+    call()
+    peak: int = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def parse_whole(path: str) -> int:
+    with open(path, encoding='utf-8') as file:
+        return len(json.load(file))
+
+
+def parse_stream(path: str) -> int:
+    with open(path, encoding='utf-8') as file:
+        return sum(1 for _ in iter_json_array(file))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=100_000, help='записей в каждой выгрузке')
+    parser.add_argument('--batch', type=int, default=10_000, help='записей в одной транзакции')
+    args = parser.parse_args()
+
+    directory: str = tempfile.mkdtemp()
+    cities_json, airports_json = os.path.join(directory, 'cities.json'), os.path.join(directory, 'airports.json')
+    cities_db, airports_db = os.path.join(directory, 'cities.db'), os.path.join(directory, 'airports.db')
+    try:
+        write_dump(cities_json, city_items(args.records))
+        write_dump(airports_json, airport_items(args.records))
+        shutil.copyfile(CITIES_DB_PATH, cities_db)
+        shutil.copyfile(AIRPORTS_DB_PATH, airports_db)
+        print(f'Выгрузки: cities.json {os.path.getsize(cities_json) / 2 ** 20:.1f} МБ, '
+              f'airports.json {os.path.getsize(airports_json) / 2 ** 20:.1f} МБ, по {args.records} записей')
+
+        print('Разбор cities.json:')
+        for name, parse in (('json.load целиком', parse_whole), ('iter_json_array потоком', parse_stream)):
+            elapsed, _ = timed(lambda: parse(cities_json))
+            print(f'  {name:<26} {elapsed:6.2f} с  пик {peak_memory(lambda: parse(cities_json)):7.1f} МБ')
+
+        gazetteer: Gazetteer = Gazetteer(cities_db, check_interval=0.05)
+        gazetteer.reload()
+        stop: threading.Event = threading.Event()
+        latencies: List[float] = []
+
+        def lookups() -> None:
+            # Поиск, как в обработчиках бота, пока идет загрузка
+            while not stop.is_set():
+                started: float = time.perf_counter()
+                assert gazetteer.get_by_ru('Москва') is not None
+                latencies.append(time.perf_counter() - started)
+                time.sleep(0.001)
+
+        reader: threading.Thread = threading.Thread(target=lookups)
+        reader.start()
+        print('Загрузка в базу:')
+        imports: List[Tuple[str, Callable[[str], ImportStats], str, str]] = [
+            ('cities.json', lambda path: import_cities(cities_json, path, args.batch), cities_db, CITIES_DB_PATH),
+            ('airports.json', lambda path: import_airports(airports_json, path, args.batch), airports_db,
+             AIRPORTS_DB_PATH)]
+        for name, run, path, _ in imports:
+            elapsed, result = timed(lambda: run(path))
+            print(f'  {name:<14} {elapsed:6.2f} с  {result.imported / elapsed:8.0f} записей/с  '
+                  f'записано {result.imported}, пропущено {result.skipped}, '
+                  f'строк {result.rows_before} -> {result.rows_after}')
+        time.sleep(0.2)
+        stop.set()
+        reader.join()
+        for name, run, _, source in imports:
+            path: str = os.path.join(directory, 'memory.db')
+            shutil.copyfile(source, path)
+            print(f'  {name:<14} пик памяти {peak_memory(lambda: run(path)):.1f} МБ')
+        latencies.sort()
+        new_city: Optional[CityRecord] = gazetteer.get_by_code(new_code(args.records - 1))
+        print(f'Поиск во время загрузки: {len(latencies)} запросов, '
+              f'p50 {latencies[len(latencies) // 2] * 1e6:.0f} мкс, max {latencies[-1] * 1000:.0f} мс '
+              f'(включая перезагрузку справочника после замены файла)')
+        print(f'Справочник после замены: {len(gazetteer)} городов, новый город найден: {new_city is not None}')
+        if new_city is None:
+            raise SystemExit(1)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Справочники городов и аэропортов: снимок в памяти против загрузки из SQLite.
+
+Собирает снимок из database/cities.db и database/airports.db во временный файл и сравнивает:
+ - холодный старт: в новом процессе загрузку обоих справочников и первый поиск, время
+   и сколько памяти Python-объектов приходится на каждый процесс (у снимка она в кэше
+   страниц и общая для всех процессов);
+ - стоимость одного поиска города по коду и по названию и названия аэропорта по коду:
+   запросом peewee на каждый поиск (как до загрузки справочников в память), по словарям
+   загруженного из SQLite справочника и по снимку. Ответы всех способов должны совпадать.
+
+Запуск из корня репозитория: python -m benchmarks.reference_snapshot [--lookups 20000] [--starts 5]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from database.airport_directory import AirportDirectory
+from database.gazetteer import CityRecord, Gazetteer
+from database.models import AIRPORTS_DB_PATH, CITIES_DB_PATH, Airport, City
+from database.reference_snapshot import build_snapshot
+
+
+def cold_start(snapshot_path: Optional[str]) -> Dict[str, float]:
+    """Загружает оба справочника в этом процессе и выполняет по одному поиску.
+
+    Returns:
+        Dict[str, float]: Время до первого ответа (мс) и пик памяти Python-объектов (КБ).
+    """
+    tracemalloc.start()
+    started: float = time.perf_counter()
+    gazetteer: Gazetteer = Gazetteer(snapshot_path=snapshot_path)
+    airports: AirportDirectory = AirportDirectory(snapshot_path=snapshot_path)
+    assert gazetteer.get_by_ru('Москва') is not None and airports.get_name('SVO') != 'SVO'
+    elapsed: float = time.perf_counter() - started
+    peak: int = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'ms': elapsed * 1000, 'kb': peak / 1024, 'snapshot': gazetteer.snapshot is not None}
+
+
+def measure_start(name: str, snapshot_path: Optional[str], starts: int) -> None:
+    results: List[Dict[str, float]] = []
+    for _ in range(starts):
+        output: str = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.reference_snapshot', '--cold', snapshot_path or ''],
+            check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+    assert all(result['snapshot'] == bool(snapshot_path) for result in results)
+    print(f'{name:<28} {statistics.median(result["ms"] for result in results):8.1f} мс  '
+          f'{statistics.median(result["kb"] for result in results):8.0f} КБ объектов на процесс')
+
+
+def measure(name: str, keys: List[str], lookup: Callable[[str], object]) -> List[object]:
+    started: float = time.perf_counter()
+    results: List[object] = [lookup(key) for key in keys]
+    elapsed: float = time.perf_counter() - started
+    print(f'  {name:<26} {elapsed / len(keys) * 1e6:8.2f} мкс на поиск')
+    return results
+
+
+def peewee_city(query) -> Optional[CityRecord]:
+    city: Optional[City] = query.first()
+    return city and CityRecord(city.name, city.ru, city.code, city.lon, city.lat)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lookups', type=int, default=20000, help='количество поисков каждого вида')
+    parser.add_argument('--starts', type=int, default=5, help='сколько раз замерять холодный старт')
+    parser.add_argument('--cold', metavar='SNAPSHOT', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold is not None:
+        print(json.dumps(cold_start(args.cold or None)))
+        return
+
+    directory: str = tempfile.mkdtemp()
+    snapshot_path: str = os.path.join(directory, 'reference.snap')
+    try:
+        started: float = time.perf_counter()
+        size: int = build_snapshot(snapshot_path)
+        print(f'Сборка снимка: {size / 1024:.0f} КБ за {(time.perf_counter() - started) * 1000:.0f} мс, '
+              f'базы SQLite: {(os.path.getsize(CITIES_DB_PATH) + os.path.getsize(AIRPORTS_DB_PATH)) / 1024:.0f} КБ')
+
+        print('Холодный старт (медиана):')
+        measure_start('  SQLite в словари', None, args.starts)
+        measure_start('  снимок', snapshot_path, args.starts)
+
+        sqlite: Gazetteer = Gazetteer()
+        snapshot: Gazetteer = Gazetteer(snapshot_path=snapshot_path)
+        sqlite_airports: AirportDirectory = AirportDirectory()
+        snapshot_airports: AirportDirectory = AirportDirectory(snapshot_path=snapshot_path)
+        sqlite.reload()
+        snapshot.reload()
+        sqlite_airports.reload()
+        snapshot_airports.reload()
+        assert snapshot.snapshot is not None and snapshot_airports.snapshot is not None
+
+        rng: random.Random = random.Random(1)
+        rows: List[int] = [rng.randrange(len(sqlite)) for _ in range(args.lookups)]
+        # Каждый десятый запрос - неизвестное значение, как опечатка пользователя
+        codes: List[str] = [sqlite.record(row).code if row % 10 else 'ZZ' + str(row % 7) for row in rows]
+        names: List[str] = [sqlite.record(row).ru if row % 10 else 'Неизвестный' for row in rows]
+        airport_codes: List[str] = list(sqlite_airports._get_names())
+        airport_keys: List[str] = [rng.choice(airport_codes) if row % 10 else 'ZZZ' for row in rows]
+
+        checks: Dict[str, List[List[object]]] = {}
+        with City._meta.database, Airport._meta.database:
+            print('Город по коду:')
+            checks['code'] = [
+                measure('peewee на каждый поиск', codes, lambda key: peewee_city(City.select().where(City.code == key))),
+                measure('словари из SQLite', codes, sqlite.get_by_code),
+                measure('снимок', codes, snapshot.get_by_code)]
+            print('Город по названию на русском:')
+            checks['ru'] = [
+                measure('peewee на каждый поиск', names, lambda key: peewee_city(City.select().where(City.ru == key))),
+                measure('словари из SQLite', names, sqlite.get_by_ru),
+                measure('снимок', names, snapshot.get_by_ru)]
+            print('Название аэропорта по коду:')
+            checks['airport'] = [
+                measure('peewee на каждый поиск', airport_keys,
+                        lambda key: getattr(Airport.select().where(Airport.code == key).first(), 'name', key)),
+                measure('словари из SQLite', airport_keys, sqlite_airports.get_name),
+                measure('снимок', airport_keys, snapshot_airports.get_name)]
+
+        mismatches: int = sum(results != variants[0] for variants in checks.values() for results in variants[1:])
+        print('Ответы совпадают' if not mismatches else f'Ответы НЕ совпадают: {mismatches} способов')
+        if mismatches:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
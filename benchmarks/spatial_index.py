@@ -0,0 +1,82 @@
+"""Поиск городов по координатам: пространственный индекс против полного перебора.
+
+Сравнивает database.spatial_index с перебором всех городов справочника (по одному
+на Python и векторно на NumPy) на запросах "ближайший город" и "все города в радиусе"
+для случайных точек рядом с городами и проверяет, что ответы совпадают.
+
+Запуск из корня репозитория: python -m benchmarks.spatial_index [--queries 2000] [--radius 300]
+"""
+import argparse
+import random
+import time
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+from database.gazetteer import EARTH_RADIUS_KM, distance_km, gazetteer
+from database.spatial_index import spatial_index
+
+
+def python_scan(lat_list: List[float], lon_list: List[float], lat: float, lon: float,
+                radius_km: float) -> List[Tuple[float, int]]:
+    """Перебор на Python: расстояние до каждого города."""
+    return sorted((distance, row) for row, distance in
+                  enumerate(distance_km(lat, lon, city_lat, city_lon) for city_lat, city_lon in zip(lat_list, lon_list))
+                  if distance <= radius_km)
+
+
+def numpy_scan(lat_rad: np.ndarray, lon_rad: np.ndarray, lat: float, lon: float) -> np.ndarray:
+    """Перебор на NumPy: расстояния до всех городов одним векторным вычислением."""
+    phi: float = np.radians(lat)
+    a: np.ndarray = (np.sin((lat_rad - phi) / 2) ** 2
+                     + np.cos(phi) * np.cos(lat_rad) * np.sin((lon_rad - np.radians(lon)) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def measure(name: str, points: List[Tuple[float, float]], query: Callable[[float, float], object]) -> List[object]:
+    started: float = time.perf_counter()
+    results: List[object] = [query(lat, lon) for lat, lon in points]
+    elapsed: float = time.perf_counter() - started
+    print(f'{name:<36} {elapsed / len(points) * 1e6:10.1f} мкс на запрос')
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, default=2000, help='количество запросов')
+    parser.add_argument('--radius', type=float, default=300, help='радиус поиска в километрах')
+    args = parser.parse_args()
+
+    random.seed(1)
+    rows: List[int] = [random.randrange(len(gazetteer)) for _ in range(args.queries)]
+    # Точки в окрестности случайных городов, как геопозиции пользователей
+    points: List[Tuple[float, float]] = [(max(-90.0, min(90.0, gazetteer.record(row).lat + random.uniform(-1, 1))),
+                                          gazetteer.record(row).lon + random.uniform(-1, 1)) for row in rows]
+    codes: List[str] = [gazetteer.record(row).code for row in range(len(gazetteer))]
+    lat_list: List[float] = [gazetteer.record(row).lat for row in range(len(gazetteer))]
+    lon_list: List[float] = [gazetteer.record(row).lon for row in range(len(gazetteer))]
+    lat_rad: np.ndarray = np.radians(np.array(lat_list))
+    lon_rad: np.ndarray = np.radians(np.array(lon_list))
+    # Индекс строится при первом запросе, его время в замер не входит
+    spatial_index.nearest(0.0, 0.0)
+    print(f'городов={len(gazetteer)} запросов={args.queries} радиус={args.radius:.0f} км')
+
+    print('Ближайший город:')
+    python_nearest = measure('перебор на Python', points[:args.queries // 10],
+                             lambda lat, lon: codes[python_scan(lat_list, lon_list, lat, lon, float('inf'))[0][1]])
+    numpy_nearest = measure('перебор на NumPy', points,
+                            lambda lat, lon: codes[int(np.argmin(numpy_scan(lat_rad, lon_rad, lat, lon)))])
+    index_nearest = measure('spatial_index.nearest', points, lambda lat, lon: spatial_index.nearest(lat, lon)[0].code)
+
+    print(f'Города в радиусе {args.radius:.0f} км:')
+    numpy_within = measure('перебор на NumPy', points, lambda lat, lon: sorted(
+        codes[row] for row in np.nonzero(numpy_scan(lat_rad, lon_rad, lat, lon) <= args.radius)[0]))
+    index_within = measure('spatial_index.within', points, lambda lat, lon: sorted(
+        city.code for city in spatial_index.within(lat, lon, args.radius)))
+
+    print('Ответы совпадают:', python_nearest == index_nearest[:len(python_nearest)]
+          and numpy_nearest == index_nearest and numpy_within == index_within)
+
+
+if __name__ == '__main__':
+    main()
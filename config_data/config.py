@@ -7,6 +7,135 @@ load_dotenv(find_dotenv('keys.env'))
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 RAPID_API_KEY = os.getenv('RAPID_API_KEY')
 AVIASALES_API_KEY = os.getenv('AVIASALES_API_KEY')
+
+# Адреса внешних API (без завершающего слэша)
+AVIASALES_API_URL = os.getenv('AVIASALES_API_URL', 'https://api.travelpayouts.com')
+METEOSOURCE_API_URL = os.getenv('METEOSOURCE_API_URL', 'https://ai-weather-by-meteosource.p.rapidapi.com')
+# Адрес Telegram Bot API (пусто - https://api.telegram.org), например локального сервера или заглушки
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '')
+
+# Запросы к внешним API: таймауты подключения и чтения (сек), количество повторов при
+# ошибках 429/5xx, базовая задержка перед повтором (сек) и размер пула соединений
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 5))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 15))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 2))
+HTTP_BACKOFF = float(os.getenv('HTTP_BACKOFF', 0.5))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 20))
+
+# После CIRCUIT_FAILURE_THRESHOLD неудачных запросов подряд сервис считается недоступным
+# и следующие CIRCUIT_RESET_TIMEOUT секунд запросы к нему не отправляются
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', 30))
+
+# Страницы результатов поиска для кнопок "Назад"/"Далее": сколько секунд хранятся и сколько поисков помнить
+RESULT_PAGES_TTL = int(os.getenv('RESULT_PAGES_TTL', 3600))
+RESULT_PAGES_SIZE = int(os.getenv('RESULT_PAGES_SIZE', 2048))
+
+# Лимиты отправки сообщений в Telegram: сообщений в секунду на бота, в один личный чат
+# (и сколько подряд без паузы), в одну группу; количество одновременных отправок
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', 30))
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', 1))
+TELEGRAM_CHAT_BURST = float(os.getenv('TELEGRAM_CHAT_BURST', 3))
+TELEGRAM_GROUP_RATE = float(os.getenv('TELEGRAM_GROUP_RATE', 20 / 60))
+TELEGRAM_SEND_WORKERS = int(os.getenv('TELEGRAM_SEND_WORKERS', 4))
+
+# История команд пишется в базу пачками: раз в HISTORY_FLUSH_INTERVAL сек
+# или сразу, как только в очереди накопится HISTORY_FLUSH_BATCH команд
+HISTORY_FLUSH_INTERVAL = float(os.getenv('HISTORY_FLUSH_INTERVAL', 0.2))
+HISTORY_FLUSH_BATCH = int(os.getenv('HISTORY_FLUSH_BATCH', 100))
+
+# Базы SQLite: размер кэша страниц базы истории на соединение и сколько файла отображать в память (МБ)
+SQLITE_CACHE_MB = int(os.getenv('SQLITE_CACHE_MB', 8))
+SQLITE_MMAP_MB = int(os.getenv('SQLITE_MMAP_MB', 64))
+
+# Снимок справочников городов и аэропортов (пусто - database/reference.snap), собирается командой
+# python -m database.reference_snapshot; если его нет или базы изменились, справочники читаются из SQLite
+REFERENCE_SNAPSHOT_PATH = os.getenv('REFERENCE_SNAPSHOT_PATH', '')
+
+# Обновление справочников из выгрузок Travelpayouts: сколько записей записывать одной транзакцией
+REFERENCE_IMPORT_BATCH = int(os.getenv('REFERENCE_IMPORT_BATCH', 10000))
+
+# Метрики в формате Prometheus: порт HTTP-сервера с /metrics (0 - не запускать; процессы режима
+# webhook слушают METRICS_PORT + номер процесса), его адрес и журнал обработанных обновлений
+# в JSON (пусто - не вести, '-' - в поток ошибок)
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_LOG = os.getenv('METRICS_LOG', '')
+
+# Профилирование (включается здесь или командой /profile): доля обновлений, у которых
+# раз в PROFILE_INTERVAL сек снимается стек обработчика, с какой длительности обработки (сек)
+# сохраняется трасса запросов обновления и сколько последних трасс хранить
+PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', '0') == '1'
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0.05))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.005))
+PROFILE_SLOW_THRESHOLD = float(os.getenv('PROFILE_SLOW_THRESHOLD', 2.0))
+PROFILE_TRACES = int(os.getenv('PROFILE_TRACES', 200))
+
+# Идентификаторы пользователей Telegram через запятую, которым доступны служебные команды (/profile)
+ADMIN_IDS = frozenset(int(user_id) for user_id in os.getenv('ADMIN_IDS', '').split(',') if user_id.strip())
+
+# Режим работы бота: polling - синхронный TeleBot с пулом потоков, async - AsyncTeleBot и aiohttp,
+# webhook - HTTP-сервер для обновлений от Telegram и несколько процессов-обработчиков
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
+# Режим webhook: публичный адрес для Telegram, адрес и порт, которые слушает сервер,
+# количество процессов-обработчиков и секрет, которым Telegram подписывает запросы
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8080))
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', os.cpu_count() or 1))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+
+# Где хранятся незавершенные шаги диалогов /low, /high, /custom и /weather: memory, sqlite
+# или file; путь к базе или каталогу (пусто - в папке database) и через сколько секунд шаг устаревает
+STATE_STORE = os.getenv('STATE_STORE', 'memory')
+STATE_STORE_PATH = os.getenv('STATE_STORE_PATH', '')
+STATE_TTL = int(os.getenv('STATE_TTL', 86400))
+# Через сколько секунд без ответа забывается диалог /low, /high или /custom
+CONVERSATION_TTL = int(os.getenv('CONVERSATION_TTL', 1800))
+
+# Кэш ответов prices_for_dates: время жизни (сек), сколько еще можно отдавать устаревший
+# ответ, пока он обновляется в фоне (сек), размер и файл для хранения между запусками
+FLIGHT_CACHE_TTL = int(os.getenv('FLIGHT_CACHE_TTL', 1800))
+FLIGHT_CACHE_STALE_TTL = int(os.getenv('FLIGHT_CACHE_STALE_TTL', 3600))
+FLIGHT_CACHE_SIZE = int(os.getenv('FLIGHT_CACHE_SIZE', 1024))
+FLIGHT_CACHE_PATH = os.getenv('FLIGHT_CACHE_PATH', '')
+
+# Поиск рейсов по диапазону месяцев: сколько месяцев можно указать, сколько страниц по 50 рейсов
+# запрашивать на месяц и сколько запросов к Aviasales выполнять одновременно
+FLIGHT_SEARCH_MAX_MONTHS = int(os.getenv('FLIGHT_SEARCH_MAX_MONTHS', 12))
+FLIGHT_MAX_PAGES = int(os.getenv('FLIGHT_MAX_PAGES', 3))
+FLIGHT_FANOUT_CONCURRENCY = int(os.getenv('FLIGHT_FANOUT_CONCURRENCY', 6))
+
+# Поиск /anywhere: сколько городов брать с каждой стороны (ближайшие в радиусе), сколько рейсов
+# показывать и сколько запросов к Aviasales (пары городов на месяцы) можно сделать за один поиск
+ANYWHERE_MAX_CITIES = int(os.getenv('ANYWHERE_MAX_CITIES', 10))
+ANYWHERE_TOP = int(os.getenv('ANYWHERE_TOP', 10))
+ANYWHERE_MAX_REQUESTS = int(os.getenv('ANYWHERE_MAX_REQUESTS', 120))
+
+# Подписки /watch: как часто (сек) проверять цену одного направления, на какую долю интервала
+# случайно сдвигать проверки, чтобы они не шли пачкой, и сколько подписок может быть у пользователя
+WATCH_INTERVAL = int(os.getenv('WATCH_INTERVAL', 1800))
+WATCH_JITTER = float(os.getenv('WATCH_JITTER', 0.1))
+WATCH_MAX_PER_USER = int(os.getenv('WATCH_MAX_PER_USER', 10))
+
+# История цен из ответов Aviasales для /trend: файл (пусто - database/prices.bin), сколько дней хранить
+# цены, как часто (сек) сжимать файл (0 - не сжимать) и какой перцентиль цены показывать
+PRICE_STORE_PATH = os.getenv('PRICE_STORE_PATH', '')
+PRICE_STORE_RETENTION_DAYS = int(os.getenv('PRICE_STORE_RETENTION_DAYS', 180))
+PRICE_STORE_COMPACT_INTERVAL = int(os.getenv('PRICE_STORE_COMPACT_INTERVAL', 86400))
+TREND_PERCENTILE = float(os.getenv('TREND_PERCENTILE', 90))
+
+# Геопозиция вместо названия города: ближайший город ищется не дальше этого расстояния (км)
+LOCATION_MAX_DISTANCE = float(os.getenv('LOCATION_MAX_DISTANCE', 300))
+
+# Кэш прогнозов погоды: время жизни (сек, но не дольше местной полуночи) и размер;
+# прогреватель раз в WEATHER_WARMER_INTERVAL сек обновляет WEATHER_WARMER_TOP популярных городов
+WEATHER_CACHE_TTL = int(os.getenv('WEATHER_CACHE_TTL', 10800))
+WEATHER_CACHE_SIZE = int(os.getenv('WEATHER_CACHE_SIZE', 512))
+WEATHER_WARMER_INTERVAL = int(os.getenv('WEATHER_WARMER_INTERVAL', 600))
+WEATHER_WARMER_TOP = int(os.getenv('WEATHER_WARMER_TOP', 20))
+
 DEFAULT_COMMANDS = (
     ('start', 'Запустить бота'),
     ('help', 'Вывести справку')
@@ -0,0 +1,84 @@
+from typing import Dict, Iterable, Mapping, Optional
+
+import peewee as pw
+
+from config_data import config
+from database.models import AIRPORT_ROWS_SQL, AIRPORTS_DB_PATH, airports_db, open_readonly
+from database.reference_snapshot import REFERENCE_SNAPSHOT_PATH, ReferenceSnapshot, ReloadingReference, load_snapshot
+from utils.metrics import timed
+
+
+class AirportDirectory(ReloadingReference):
+    """Справочник аэропортов "IATA-код -> название", загружаемый в память один раз.
+
+    Таблица airports небольшая (несколько тысяч строк) и меняется редко, только при обновлении
+    справочников, поэтому вместо двух запросов к SQLite на каждый рейс все названия берутся из словаря.
+    Если есть актуальный снимок справочников, вместо словаря используется его хэш-индекс.
+    При изменении файла базы или снимка справочник перечитывается (см. ReloadingReference).
+    """
+
+    def __init__(self, db_path: str = AIRPORTS_DB_PATH, check_interval: float = 60.0,
+                 snapshot_path: Optional[str] = None) -> None:
+        """
+        Args:
+            db_path (str): Путь к базе данных airports.db.
+            check_interval (float): Как часто (в секундах) проверять, не изменился ли файл базы или снимка.
+            snapshot_path (Optional[str]): Путь к снимку справочников; None - всегда читать SQLite.
+        """
+        super().__init__(db_path, check_interval, snapshot_path)
+        self.db: pw.SqliteDatabase = airports_db if db_path == AIRPORTS_DB_PATH else open_readonly(db_path)
+
+    def __len__(self) -> int:
+        return len(self._get_names())
+
+    def get_name(self, code: Optional[str]) -> str:
+        """Название аэропорта по IATA-коду.
+
+        Args:
+            code (Optional[str]): IATA-код аэропорта.
+
+        Returns:
+            str: Название аэропорта, а если код неизвестен - сам код.
+        """
+        if not code:
+            return 'неизвестен'
+        return self._get_names().get(code, code)
+
+    @timed('reference', 'airport')
+    def get_names(self, codes: Iterable[str]) -> Dict[str, str]:
+        """Названия сразу для нескольких аэропортов, например для всей страницы результатов.
+
+        Args:
+            codes (Iterable[str]): IATA-коды аэропортов.
+
+        Returns:
+            Dict[str, str]: Словарь "код -> название"; для неизвестных кодов название равно коду.
+        """
+        names: Mapping[str, str] = self._get_names()
+        return {code: names.get(code, code) for code in codes if code}
+
+    def _get_names(self) -> Mapping[str, str]:
+        # Словарь "код -> название" или такой же словарь только для чтения из снимка
+        return self._current()
+
+    def _open_snapshot(self) -> Optional[ReferenceSnapshot]:
+        return load_snapshot(self.snapshot_path, airports_path=self.db_path)
+
+    def _from_snapshot(self, snapshot: ReferenceSnapshot) -> Mapping[str, str]:
+        return snapshot.airport_names
+
+    def _read_database(self) -> Dict[str, str]:
+        # Соединение закрывается после чтения: если файл заменят, следующая загрузка откроет новый
+        with self.db.connection_context():
+            rows: list = self.db.execute_sql(AIRPORT_ROWS_SQL).fetchall()
+
+        names: Dict[str, str] = {}
+        for code, name in rows:
+            # При повторяющихся кодах побеждает первая запись, как и у Airports.get_or_none
+            names.setdefault(code, name)
+        return names
+
+
+# Общий экземпляр справочника для всех обработчиков
+airport_directory: AirportDirectory = AirportDirectory(
+    snapshot_path=config.REFERENCE_SNAPSHOT_PATH or REFERENCE_SNAPSHOT_PATH)
@@ -0,0 +1,205 @@
+import bisect
+import re
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from database.gazetteer import CityRecord, Gazetteer, gazetteer
+from utils.metrics import timed
+
+# Транслитерация русских названий, чтобы находить город по вводу латиницей ("Moskva")
+TRANSLIT: Dict[str, str] = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i',
+    'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's',
+    'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+
+# Вариант с кнопки подсказки: "Москва (MOW)"
+_CODE_SUFFIX: re.Pattern = re.compile(r'^(.*?)\s*\(([A-Za-z]{3})\)$')
+_SEPARATORS: re.Pattern = re.compile(r'[\s\-‐–—_.,\'’`]+')
+
+# Минимальная доля общих триграмм, при которой город попадает в подсказки
+MIN_SCORE: float = 0.3
+
+
+def normalize(text: str) -> str:
+    """Приводит название города к единому виду для сравнения.
+
+    Регистр, буквы ё/е, дефисы, тире и лишние пробелы не учитываются.
+
+    Args:
+        text (str): Исходное название.
+
+    Returns:
+        str: Нормализованное название.
+    """
+    return _SEPARATORS.sub(' ', text.lower().replace('ё', 'е')).strip()
+
+
+def transliterate(text: str) -> str:
+    """Переводит нормализованное русское название в латиницу.
+
+    Args:
+        text (str): Нормализованное название.
+
+    Returns:
+        str: Название латиницей.
+    """
+    return ''.join(TRANSLIT.get(char, char) for char in text)
+
+
+def trigrams(key: str) -> Set[str]:
+    """Множество триграмм ключа с пробелами по краям.
+
+    Args:
+        key (str): Нормализованный ключ.
+
+    Returns:
+        Set[str]: Триграммы ключа.
+    """
+    padded: str = f' {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _Index:
+    """Предвычисленные индексы поиска по одной версии справочника."""
+
+    def __init__(self, source: Gazetteer) -> None:
+        # Ключ -> номера строк справочника (одно название может быть у нескольких городов)
+        self.rows_by_key: Dict[str, List[int]] = {}
+        for row in range(len(source)):
+            city: CityRecord = source.record(row)
+            ru_key: str = normalize(city.ru)
+            for key in {ru_key, normalize(city.name), transliterate(ru_key)}:
+                if key:
+                    self.rows_by_key.setdefault(key, []).append(row)
+
+        self.keys: List[str] = sorted(self.rows_by_key)
+        self.trigram_counts: List[int] = []
+        self.postings: Dict[str, List[int]] = {}
+        for key_id, key in enumerate(self.keys):
+            key_trigrams: Set[str] = trigrams(key)
+            self.trigram_counts.append(len(key_trigrams))
+            for trigram in key_trigrams:
+                self.postings.setdefault(trigram, []).append(key_id)
+
+
+class CityMatcher:
+    """Нечеткий и префиксный поиск городов по справочнику.
+
+    Индекс строится один раз по всем записям справочника: нормализованные названия
+    (русское, английское и транслитерация русского), отсортированный список ключей для
+    поиска по префиксу и инвертированный индекс триграмм для поиска с опечатками.
+    """
+
+    def __init__(self, source: Gazetteer = gazetteer) -> None:
+        """
+        Args:
+            source (Gazetteer): Справочник городов, по которому строится индекс.
+        """
+        self.source: Gazetteer = source
+        self._lock: threading.Lock = threading.Lock()
+        self._index: Optional[_Index] = None
+        self._version: int = -1
+
+    @timed('reference', 'city')
+    def resolve(self, text: Optional[str]) -> Optional[CityRecord]:
+        """Однозначно определяет город по вводу пользователя.
+
+        Сначала ищется точное совпадение по `ru`, затем по нормализованному названию.
+        Если нормализованному вводу соответствуют разные города, возвращается None,
+        чтобы пользователь выбрал нужный из подсказок.
+
+        Args:
+            text (Optional[str]): Текст сообщения пользователя.
+
+        Returns:
+            Optional[CityRecord]: Найденный город или None.
+        """
+        if not text:
+            return None
+        city: Optional[CityRecord] = self.source.get_by_ru(text)
+        if city:
+            return city
+
+        with_code: Optional[re.Match] = _CODE_SUFFIX.match(text.strip())
+        if with_code:
+            return self.source.get_by_code(with_code.group(2).upper())
+
+        rows: List[int] = self._get_index().rows_by_key.get(normalize(text), [])
+        candidates: List[CityRecord] = [self.source.record(row) for row in rows]
+        if candidates and len({candidate.ru for candidate in candidates}) == 1:
+            return candidates[0]
+        return None
+
+    @timed('reference', 'city_suggest')
+    def suggest(self, text: Optional[str], limit: int = 5) -> List[CityRecord]:
+        """Подбирает наиболее похожие города для подсказки.
+
+        Точные совпадения идут первыми, затем названия, начинающиеся с введенного текста,
+        затем совпадения по доле общих триграмм.
+
+        Args:
+            text (Optional[str]): Текст сообщения пользователя.
+            limit (int): Максимальное количество подсказок.
+
+        Returns:
+            List[CityRecord]: Список городов, от наиболее подходящего к наименее.
+        """
+        if not text:
+            return []
+        query: str = normalize(text)
+        if not query:
+            return []
+        index: _Index = self._get_index()
+
+        # Оценка ключа: (приоритет, похожесть, -длина); больше - лучше
+        scores: Dict[int, Tuple[int, float, int]] = {}
+
+        position: int = bisect.bisect_left(index.keys, query)
+        while position < len(index.keys) and index.keys[position].startswith(query):
+            key: str = index.keys[position]
+            scores[position] = (2 if key == query else 1, 1.0, -len(key))
+            position += 1
+            if len(scores) >= limit * 4:
+                break
+
+        query_trigrams: Set[str] = trigrams(query)
+        common: Dict[int, int] = {}
+        for trigram in query_trigrams:
+            for key_id in index.postings.get(trigram, ()):
+                common[key_id] = common.get(key_id, 0) + 1
+        total: int = len(query_trigrams)
+        for key_id, count in common.items():
+            if key_id in scores:
+                continue
+            score: float = 2 * count / (total + index.trigram_counts[key_id])
+            if score >= MIN_SCORE:
+                scores[key_id] = (0, score, -len(index.keys[key_id]))
+
+        result: List[CityRecord] = []
+        seen: Set[int] = set()
+        for key_id in sorted(scores, key=scores.__getitem__, reverse=True):
+            for row in index.rows_by_key[index.keys[key_id]]:
+                if row not in seen:
+                    seen.add(row)
+                    result.append(self.source.record(row))
+            if len(result) >= limit:
+                break
+        return result[:limit]
+
+    def _get_index(self) -> _Index:
+        index: Optional[_Index] = self._index
+        if index is None or self._version != self.source.version:
+            with self._lock:
+                # len() заодно загружает справочник, если он еще не загружен
+                len(self.source)
+                if self._index is None or self._version != self.source.version:
+                    self._version = self.source.version
+                    self._index = _Index(self.source)
+                index = self._index
+        return index
+
+
+# Общий экземпляр поиска для всех обработчиков
+city_matcher: CityMatcher = CityMatcher()
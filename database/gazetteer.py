@@ -0,0 +1,176 @@
+import math
+from array import array
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import peewee as pw
+
+from config_data import config
+from database.models import CITIES_DB_PATH, CITY_ROWS_SQL, cities_db, open_readonly
+from database.reference_snapshot import REFERENCE_SNAPSHOT_PATH, ReferenceSnapshot, ReloadingReference, load_snapshot
+
+# Средний радиус Земли в километрах
+EARTH_RADIUS_KM: float = 6371.0
+
+
+class CityRecord(NamedTuple):
+    """Запись о городе из справочника."""
+    name: str
+    ru: str
+    code: str
+    lon: float
+    lat: float
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по поверхности Земли между двумя точками (формула гаверсинусов).
+
+    Args:
+        lat1 (float): Широта первой точки в градусах.
+        lon1 (float): Долгота первой точки в градусах.
+        lat2 (float): Широта второй точки в градусах.
+        lon2 (float): Долгота второй точки в градусах.
+
+    Returns:
+        float: Расстояние в километрах.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    half_dphi: float = (phi2 - phi1) / 2
+    half_dlambda: float = math.radians(lon2 - lon1) / 2
+    a: float = math.sin(half_dphi) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(half_dlambda) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class _Tables(NamedTuple):
+    """Загруженные колонки таблицы city и хэш-индексы по ним."""
+    names: List[str]
+    ru: List[str]
+    codes: List[str]
+    lon: array
+    lat: array
+    by_name: Dict[str, int]
+    by_ru: Dict[str, int]
+    by_code: Dict[str, int]
+
+    def row(self, index: int) -> Tuple[str, str, str, float, float]:
+        """Название, название на русском, код, долгота и широта города."""
+        return self.names[index], self.ru[index], self.codes[index], self.lon[index], self.lat[index]
+
+
+class Gazetteer(ReloadingReference):
+    """Справочник городов, целиком загруженный в память.
+
+    Таблица city хранится по колонкам (списки строк и массивы float), а поиск по
+    `ru`, `name` и `code` идет через словари "значение -> номер строки", поэтому
+    обращения к SQLite на каждом шаге диалога не нужны.
+
+    Если передан путь к снимку справочников (см. database/reference_snapshot.py) и снимок
+    собран из текущей базы, колонки и индексы читаются прямо из отображенного в память файла.
+    При изменении файла базы или снимка справочник перечитывается (см. ReloadingReference).
+    """
+
+    def __init__(self, db_path: str = CITIES_DB_PATH, check_interval: float = 60.0,
+                 snapshot_path: Optional[str] = None) -> None:
+        """
+        Args:
+            db_path (str): Путь к базе данных cities.db.
+            check_interval (float): Как часто (в секундах) проверять, не изменился ли файл базы или снимка.
+            snapshot_path (Optional[str]): Путь к снимку справочников; None - всегда читать SQLite.
+        """
+        super().__init__(db_path, check_interval, snapshot_path)
+        self.db: pw.SqliteDatabase = cities_db if db_path == CITIES_DB_PATH else open_readonly(db_path)
+
+    def __len__(self) -> int:
+        return len(self._get_tables().codes)
+
+    def get_by_ru(self, ru: Optional[str]) -> Optional[CityRecord]:
+        """Поиск города по названию на русском языке.
+
+        Args:
+            ru (Optional[str]): Название города на русском языке.
+
+        Returns:
+            Optional[CityRecord]: Найденный город или None.
+        """
+        return self._get(ru, 'by_ru')
+
+    def get_by_name(self, name: Optional[str]) -> Optional[CityRecord]:
+        """Поиск города по названию на английском языке.
+
+        Args:
+            name (Optional[str]): Название города на английском языке.
+
+        Returns:
+            Optional[CityRecord]: Найденный город или None.
+        """
+        return self._get(name, 'by_name')
+
+    def get_by_code(self, code: Optional[str]) -> Optional[CityRecord]:
+        """Поиск города по IATA-коду.
+
+        Args:
+            code (Optional[str]): IATA-код города.
+
+        Returns:
+            Optional[CityRecord]: Найденный город или None.
+        """
+        return self._get(code, 'by_code')
+
+    def record(self, index: int) -> CityRecord:
+        """Возвращает город по номеру строки в справочнике.
+
+        Args:
+            index (int): Номер строки.
+
+        Returns:
+            CityRecord: Запись о городе.
+        """
+        return CityRecord._make(self._get_tables().row(index))
+
+    def _get(self, value: Optional[str], index_name: str) -> Optional[CityRecord]:
+        if not value:
+            return None
+        tables: _Tables = self._get_tables()
+        index: Optional[int] = getattr(tables, index_name).get(value.strip())
+        if index is None:
+            return None
+        return CityRecord._make(tables.row(index))
+
+    def _get_tables(self) -> _Tables:
+        return self._current()
+
+    def _open_snapshot(self) -> Optional[ReferenceSnapshot]:
+        return load_snapshot(self.snapshot_path, cities_path=self.db_path)
+
+    def _from_snapshot(self, snapshot: ReferenceSnapshot) -> _Tables:
+        # Колонки снимка повторяют интерфейс _Tables: индексация колонок, row и get у индексов
+        return snapshot.city_columns
+
+    def _read_database(self) -> _Tables:
+        # Соединение закрывается после чтения: если файл заменят, следующая загрузка откроет новый
+        with self.db.connection_context():
+            rows: list = self.db.execute_sql(CITY_ROWS_SQL).fetchall()
+
+        names: List[str] = []
+        ru: List[str] = []
+        codes: List[str] = []
+        lon: array = array('d')
+        lat: array = array('d')
+        by_name: Dict[str, int] = {}
+        by_ru: Dict[str, int] = {}
+        by_code: Dict[str, int] = {}
+        for index, (name, ru_name, code, city_lon, city_lat) in enumerate(rows):
+            names.append(name)
+            ru.append(ru_name)
+            codes.append(code)
+            lon.append(city_lon)
+            lat.append(city_lat)
+            # При совпадении названий побеждает первая запись, как и у City.get_or_none
+            by_name.setdefault(name, index)
+            by_ru.setdefault(ru_name, index)
+            by_code.setdefault(code, index)
+
+        return _Tables(names, ru, codes, lon, lat, by_name, by_ru, by_code)
+
+
+# Общий экземпляр справочника для всех обработчиков
+gazetteer: Gazetteer = Gazetteer(snapshot_path=config.REFERENCE_SNAPSHOT_PATH or REFERENCE_SNAPSHOT_PATH)
@@ -0,0 +1,292 @@
+import datetime
+import threading
+from typing import Callable, List, NamedTuple, Optional, Union
+
+import peewee as pw
+from telebot import logger
+
+from config_data import config
+from database.models import History, Watch, history_db
+
+# Сколько последних команд хранится для каждого пользователя
+MAX_HISTORY_ENTRIES: int = 10
+# После стольких неудачных попыток подряд очередь истории записывается по одной команде
+FLUSH_ATTEMPTS: int = 3
+# Запросы, которые выполняются на каждую команду, - готовым текстом: он не собирается заново,
+# а подготовленное выражение берется из кэша соединения по этому тексту
+_USER_HISTORY_SQL: str = 'SELECT command FROM history WHERE user_id = ? ORDER BY timestamp, id'
+_TRIM_HISTORY_SQL: str = ('DELETE FROM history WHERE id IN ('
+                          'SELECT id FROM history WHERE user_id = ? '
+                          'ORDER BY timestamp DESC, id DESC LIMIT -1 OFFSET ?)')
+
+
+def _create_table(db: pw.SqliteDatabase) -> None:
+    History.create_table(safe=True)
+
+
+def _add_user_timestamp_index(db: pw.SqliteDatabase) -> None:
+    # Записи сверх лимита могли остаться от старого кода, который не был защищен от гонок
+    db.execute_sql('DELETE FROM history WHERE id IN ('
+                   'SELECT id FROM (SELECT id, ROW_NUMBER() OVER ('
+                   'PARTITION BY user_id ORDER BY timestamp DESC, id DESC) AS position FROM history) '
+                   'WHERE position > ?)', (MAX_HISTORY_ENTRIES,))
+    db.execute_sql('CREATE INDEX IF NOT EXISTS history_user_id_timestamp ON history (user_id, timestamp)')
+
+
+def _create_watch_table(db: pw.SqliteDatabase) -> None:
+    # Подписки /watch хранятся в той же базе
+    Watch.create_table(safe=True)
+
+
+# Миграции схемы по порядку; номер последней примененной хранится в PRAGMA user_version
+MIGRATIONS: List[Callable[[pw.SqliteDatabase], None]] = [
+    _create_table,
+    _add_user_timestamp_index,
+    _create_watch_table,
+]
+
+_migrated: bool = False
+_migrate_lock: threading.Lock = threading.Lock()
+
+
+def migrate(db: pw.SqliteDatabase = history_db) -> int:
+    """Применяет к базе истории миграции, которые еще не были применены.
+
+    Args:
+        db (pw.SqliteDatabase): База данных истории.
+
+    Returns:
+        int: Версия схемы после миграции.
+    """
+    with db.atomic('IMMEDIATE'):
+        version: int = db.execute_sql('PRAGMA user_version').fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(db)
+            # PRAGMA не поддерживает параметры, number - целое из enumerate
+            db.execute_sql(f'PRAGMA user_version = {number}')
+    return len(MIGRATIONS)
+
+
+def ensure_schema() -> None:
+    """Применяет миграции базы истории один раз за процесс, при первом обращении к ней.
+
+    Вызывается перед запросами к таблицам базы истории (history, watch), чтобы они работали
+    и без предварительного вызова migrate(), например в скриптах и тестах.
+    """
+    global _migrated
+    if _migrated:
+        return
+    with _migrate_lock:
+        if not _migrated:
+            migrate()
+            _migrated = True
+
+
+class PendingEntry(NamedTuple):
+    """Команда, принятая в историю, но еще не записанная в базу."""
+    user_id: str
+    command: str
+    timestamp: str
+
+
+class HistoryWriter:
+    """Отложенная запись истории команд.
+
+    add() только кладет команду в очередь в памяти. Фоновый поток записывает очередь в базу
+    одной транзакцией раз в `flush_interval` секунд или сразу, как только накопится
+    `batch_size` команд. Записи удаляются из очереди только после коммита, поэтому
+    pending() вместе с базой всегда дает полную историю пользователя.
+
+    Если очередь не записалась `FLUSH_ATTEMPTS` раз подряд, она записывается по одной
+    команде: команда, которую база не принимает (например, из-за недопустимого значения),
+    пишется в журнал и удаляется из очереди, чтобы не блокировать остальные. Если база
+    недоступна целиком (pw.OperationalError), команды остаются в очереди до следующей попытки.
+    """
+
+    def __init__(self, db: pw.SqliteDatabase, flush_interval: float = config.HISTORY_FLUSH_INTERVAL,
+                 batch_size: int = config.HISTORY_FLUSH_BATCH) -> None:
+        """
+        Args:
+            db (pw.SqliteDatabase): База данных истории.
+            flush_interval (float): Как часто записывать очередь, в секундах.
+            batch_size (int): Сколько команд в очереди вызывает запись, не дожидаясь интервала.
+        """
+        self.db: pw.SqliteDatabase = db
+        self.flush_interval: float = flush_interval
+        self.batch_size: int = batch_size
+        self._pending: List[PendingEntry] = []
+        self._condition: threading.Condition = threading.Condition()
+        # Держится на время записи очереди в базу, чтобы чтение не застало пачку
+        # одновременно и в базе, и в очереди
+        self.flush_lock: threading.Lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped: bool = False
+        self._failures: int = 0
+
+    def add(self, user_id: str, command: str) -> None:
+        """Ставит команду в очередь на запись.
+
+        Args:
+            user_id (str): Идентификатор пользователя.
+            command (str): Текст команды.
+        """
+        # Время берется в момент вызова, в том же формате и поясе (UTC), что и CURRENT_TIMESTAMP
+        timestamp: str = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        with self._condition:
+            self._pending.append(PendingEntry(user_id, command, timestamp))
+            if self._stopped:
+                flush_now: bool = True
+            else:
+                flush_now = False
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                    self._thread.start()
+                if len(self._pending) >= self.batch_size:
+                    self._condition.notify()
+        if flush_now:
+            # После остановки писать больше некому, пишем сразу
+            self._write(isolate=True)
+
+    def pending(self, user_id: str) -> List[str]:
+        """Команды пользователя, еще не записанные в базу, от старых к новым.
+
+        Args:
+            user_id (str): Идентификатор пользователя.
+
+        Returns:
+            List[str]: Тексты команд.
+        """
+        with self._condition:
+            return [entry.command for entry in self._pending if entry.user_id == user_id]
+
+    def flush(self) -> int:
+        """Записывает всю текущую очередь в базу одной транзакцией.
+
+        Returns:
+            int: Количество записанных команд.
+        """
+        with self.flush_lock:
+            with self._condition:
+                batch: List[PendingEntry] = list(self._pending)
+            if not batch:
+                return 0
+            self._insert(batch)
+            with self._condition:
+                del self._pending[:len(batch)]
+            return len(batch)
+
+    def flush_each(self) -> int:
+        """Записывает очередь по одной команде, каждую своей транзакцией.
+
+        Команда, которую база не принимает, пишется в журнал и удаляется из очереди.
+        При pw.OperationalError запись прекращается, и оставшиеся команды ждут следующей попытки.
+
+        Returns:
+            int: Количество записанных команд.
+        """
+        written: int = 0
+        with self.flush_lock:
+            with self._condition:
+                batch: List[PendingEntry] = list(self._pending)
+            for entry in batch:
+                try:
+                    self._insert([entry])
+                    written += 1
+                except pw.OperationalError:
+                    logger.exception('Не удалось записать историю команд')
+                    break
+                except Exception:
+                    logger.exception(f'Команда пользователя {entry.user_id} не записана в историю '
+                                     f'и удалена из очереди: {entry.command!r}')
+                with self._condition:
+                    # Очередь пополняется только с конца, поэтому эта команда - первая в ней
+                    del self._pending[0]
+        return written
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Останавливает фоновый поток и записывает все, что осталось в очереди.
+
+        Команды, добавленные после остановки, записываются сразу.
+
+        Args:
+            timeout (Optional[float]): Сколько секунд ждать завершения потока.
+        """
+        with self._condition:
+            self._stopped = True
+            thread: Optional[threading.Thread] = self._thread
+            self._condition.notify()
+        if thread is not None:
+            thread.join(timeout)
+        self._write(isolate=True)
+
+    def _insert(self, batch: List[PendingEntry]) -> None:
+        ensure_schema()
+        with self.db.atomic('IMMEDIATE'):
+            History.insert_many(batch, fields=[History.user_id, History.command, History.timestamp]).execute()
+            for user_id in {entry.user_id for entry in batch}:
+                _trim_history(user_id)
+
+    def _write(self, isolate: bool = False) -> None:
+        # Записывает очередь, не выпуская исключения: фоновый поток не должен завершиться из-за ошибки.
+        # isolate - записать по одной сразу после первой неудачи: следующей попытки не будет
+        try:
+            self.flush()
+            self._failures = 0
+            return
+        except Exception:
+            # Очередь не очищается, записи попадут в базу при следующей попытке
+            logger.exception('Не удалось записать историю команд')
+        self._failures += 1
+        if isolate or self._failures >= FLUSH_ATTEMPTS:
+            self._failures = 0
+            self.flush_each()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                if not self._stopped and len(self._pending) < self.batch_size:
+                    self._condition.wait(self.flush_interval)
+                stopped: bool = self._stopped
+            self._write()
+            if stopped:
+                return
+
+
+# Общая очередь записи истории команд для всех обработчиков
+history_writer: HistoryWriter = HistoryWriter(history_db)
+
+
+def _trim_history(user_id: str) -> None:
+    # Удаляет записи пользователя старше MAX_HISTORY_ENTRIES последних. Запрос идет по индексу
+    # (user_id, timestamp) и затрагивает не больше MAX_HISTORY_ENTRIES + 1 строк на пользователя
+    history_db.execute_sql(_TRIM_HISTORY_SQL, (user_id, MAX_HISTORY_ENTRIES))
+
+
+def add_to_history(user_id: Union[str, int], command: str) -> None:
+    """Добавление записи в историю команд пользователя.
+
+    Не обращается к базе: команда ставится в очередь history_writer и записывается
+    в фоне вместе с другими. get_user_history учитывает еще не записанные команды.
+
+    Args:
+        user_id (Union[str, int]): Идентификатор пользователя.
+        command (str): Текст команды.
+    """
+    history_writer.add(str(user_id), command)
+
+
+def get_user_history(user_id: Union[str, int]) -> List[str]:
+    """Последние команды пользователя, от старых к новым, включая еще не записанные в базу.
+
+    Args:
+        user_id (Union[str, int]): Идентификатор пользователя.
+
+    Returns:
+        List[str]: Тексты команд.
+    """
+    ensure_schema()
+    user_id = str(user_id)
+    with history_writer.flush_lock:
+        rows: List[tuple] = history_db.execute_sql(_USER_HISTORY_SQL, (user_id,)).fetchall()
+        commands: List[str] = [command for command, in rows] + history_writer.pending(user_id)
+    return commands[-MAX_HISTORY_ENTRIES:]
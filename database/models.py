@@ -0,0 +1,166 @@
+import os
+from typing import Dict, List, Set, Tuple, Type
+from urllib.parse import quote
+
+import peewee as pw
+
+from config_data import config
+from utils.metrics import TimedSqliteDatabase
+
+DATABASE_DIR: str = os.path.dirname(__file__)
+# Пути к базам данных: справочники городов и аэропортов (только чтение) и история команд с подписками
+CITIES_DB_PATH: str = os.path.join(DATABASE_DIR, 'cities.db')
+AIRPORTS_DB_PATH: str = os.path.join(DATABASE_DIR, 'airports.db')
+HISTORY_DB_PATH: str = os.path.join(DATABASE_DIR, 'history.db')
+
+# Сколько подготовленных запросов sqlite3 хранит на одно соединение (по тексту запроса)
+CACHED_STATEMENTS: int = 256
+
+# Справочники только читаются, и то целиком при загрузке в память: достаточно отображения файла в память
+STATIC_PRAGMAS: Dict[str, object] = {'mmap_size': config.SQLITE_MMAP_MB * 2 ** 20}
+# В режиме WAL чтение не ждет записи, а synchronous=NORMAL не вызывает fsync на каждую
+# транзакцию: после падения процесса закоммиченные записи сохраняются, при отключении
+# питания могут потеряться только последние транзакции. Отрицательный cache_size - в КиБ
+HISTORY_PRAGMAS: Dict[str, object] = {'journal_mode': 'wal', 'synchronous': 'normal',
+                                      'cache_size': -config.SQLITE_CACHE_MB * 1024,
+                                      'mmap_size': config.SQLITE_MMAP_MB * 2 ** 20, 'temp_store': 'memory'}
+
+
+class SchemaError(RuntimeError):
+    """В базе данных нет таблицы, колонки или индекса, без которых бот не может работать."""
+
+
+def open_readonly(path: str) -> pw.SqliteDatabase:
+    """База данных, открываемая только для чтения.
+
+    Отсутствующий файл не создается пустым, а вызывает ошибку при подключении.
+
+    Args:
+        path (str): Путь к файлу базы данных.
+
+    Returns:
+        pw.SqliteDatabase: Объект базы данных.
+    """
+    return TimedSqliteDatabase(f'file:{quote(os.path.abspath(path))}?mode=ro', uri=True, pragmas=STATIC_PRAGMAS,
+                               cached_statements=CACHED_STATEMENTS,
+                               metrics_name=os.path.splitext(os.path.basename(path))[0])
+
+
+# Единственные объекты баз данных для всех модулей. Соединения peewee привязаны к потоку:
+# каждый поток (пул обработчиков telebot, пул запросов к API, потоки asyncio.to_thread)
+# открывает соединение при первом запросе и дальше использует его же, без connect/close на каждом шаге
+cities_db: pw.SqliteDatabase = open_readonly(CITIES_DB_PATH)
+airports_db: pw.SqliteDatabase = open_readonly(AIRPORTS_DB_PATH)
+history_db: pw.SqliteDatabase = TimedSqliteDatabase(HISTORY_DB_PATH, pragmas=HISTORY_PRAGMAS,
+                                                    cached_statements=CACHED_STATEMENTS, metrics_name='history')
+
+
+class City(pw.Model):
+    """Город из справочника cities.db."""
+    name = pw.CharField()
+    ru = pw.CharField()
+    code = pw.CharField(unique=True)
+    lon = pw.FloatField()
+    lat = pw.FloatField()
+
+    class Meta:
+        database = cities_db
+        table_name = 'city'
+
+
+class Airport(pw.Model):
+    """Аэропорт из справочника airports.db."""
+    name = pw.CharField()
+    code = pw.CharField()
+
+    class Meta:
+        database = airports_db
+        table_name = 'airports'
+
+
+class History(pw.Model):
+    """Модель для хранения истории команд пользователя."""
+    user_id = pw.CharField()
+    command = pw.CharField()
+    timestamp = pw.DateTimeField(constraints=[pw.SQL('DEFAULT CURRENT_TIMESTAMP')])
+
+    class Meta:
+        database = history_db
+        indexes = (
+            (('user_id', 'timestamp'), False),
+        )
+
+
+class Watch(pw.Model):
+    """Подписка пользователя на снижение цены по направлению и месяцу."""
+    user_id = pw.CharField()
+    chat_id = pw.BigIntegerField()
+    origin = pw.CharField()
+    destination = pw.CharField()
+    month = pw.CharField()
+    threshold = pw.IntegerField()
+    # Цена, о которой пользователь уже получил уведомление; сбрасывается, когда цена поднимается выше порога
+    notified_price = pw.IntegerField(null=True)
+    created_at = pw.DateTimeField(constraints=[pw.SQL('DEFAULT CURRENT_TIMESTAMP')])
+
+    class Meta:
+        database = history_db
+        indexes = (
+            (('user_id', 'origin', 'destination', 'month'), True),
+            (('origin', 'destination', 'month'), False),
+        )
+
+
+# Все города и аэропорты по порядку строк: так справочники загружаются в память и собираются в снимок
+CITY_ROWS_SQL: str = City.select(City.name, City.ru, City.code, City.lon, City.lat).order_by(City.id).sql()[0]
+AIRPORT_ROWS_SQL: str = Airport.select(Airport.code, Airport.name).order_by(Airport.id).sql()[0]
+
+# Модели, схему которых бот проверяет при запуске
+SCHEMA_MODELS: Tuple[Type[pw.Model], ...] = (City, Airport, History, Watch)
+
+
+def required_indexes(model: Type[pw.Model]) -> List[Tuple[str, ...]]:
+    """Колонки индексов, которые объявлены у модели (по полям с unique/index и в Meta.indexes).
+
+    Args:
+        model (Type[pw.Model]): Модель.
+
+    Returns:
+        List[Tuple[str, ...]]: Колонки каждого индекса по порядку.
+    """
+    return [tuple(field.column_name for field in index._expressions) for index in model._meta.fields_to_index()]
+
+
+def check_schema(models: Tuple[Type[pw.Model], ...] = SCHEMA_MODELS) -> None:
+    """Проверяет, что в базах есть таблицы, колонки и индексы моделей.
+
+    Индекс считается найденным, если в таблице есть любой индекс по тем же колонкам
+    в том же порядке, как бы он ни назывался. База истории должна быть уже мигрирована.
+
+    Args:
+        models (Tuple[Type[pw.Model], ...]): Проверяемые модели.
+
+    Raises:
+        SchemaError: Если чего-то не хватает; в сообщении перечислены все недостающие объекты.
+    """
+    problems: List[str] = []
+    for model in models:
+        db: pw.Database = model._meta.database
+        table: str = model._meta.table_name
+        try:
+            with db.connection_context():
+                if not db.table_exists(table):
+                    problems.append(f'таблица {table} ({db.database})')
+                    continue
+                columns: Set[str] = {column.name for column in db.get_columns(table)}
+                indexes: Set[Tuple[str, ...]] = {tuple(index.columns) for index in db.get_indexes(table)}
+        except pw.OperationalError as e:
+            # Например, файла справочника нет: открытая только для чтения база не создается
+            problems.append(f'база {db.database} ({e})')
+            continue
+        problems.extend(f'колонка {table}.{field.column_name}' for field in model._meta.sorted_fields
+                        if field.column_name not in columns)
+        problems.extend(f'индекс {table} ({", ".join(index)})' for index in required_indexes(model)
+                        if index not in indexes)
+    if problems:
+        raise SchemaError('В базе данных не хватает: ' + '; '.join(problems))
@@ -0,0 +1,320 @@
+import contextlib
+import datetime
+import os
+import threading
+import time
+from typing import BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: файл цен блокируется только между потоками одного процесса
+    fcntl = None
+
+import numpy as np
+from telebot import logger
+
+from config_data import config
+
+# Путь к файлу цен по умолчанию
+PRICE_STORE_PATH: str = os.path.join(os.path.dirname(__file__), 'prices.bin')
+
+# Одна запись - 14 байт без выравнивания: направление, день вылета, цена и время получения
+RECORD_DTYPE: np.dtype = np.dtype([('route', '<u4'), ('departure', '<u2'), ('price', '<u4'), ('fetched_at', '<u4')])
+COLUMNS: Tuple[str, ...] = RECORD_DTYPE.names
+
+# Код города из трех латинских букв упаковывается в 15 бит, направление - в 30
+CODE_BITS: int = 15
+# День вылета хранится как число дней от 1970-01-01
+EPOCH_ORDINAL: int = datetime.date(1970, 1, 1).toordinal()
+# Цены из одного ответа API получены в пределах этого окна (сек) от последней проверки
+LAST_FETCH_WINDOW: int = 60
+
+
+def pack_code(code: str) -> Optional[int]:
+    """Код города в виде числа от 0 до 26^3 - 1 или None, если это не три латинские буквы."""
+    if len(code) != 3 or not code.isascii() or not code.isalpha():
+        return None
+    value: int = 0
+    for letter in code.upper():
+        value = value * 26 + ord(letter) - ord('A')
+    return value
+
+
+def pack_route(origin: str, destination: str) -> Optional[int]:
+    """Направление в виде одного 30-битного числа или None, если код города некорректный."""
+    origin_id, destination_id = pack_code(origin), pack_code(destination)
+    if origin_id is None or destination_id is None:
+        return None
+    return origin_id << CODE_BITS | destination_id
+
+
+def month_number(month: str) -> int:
+    """Номер месяца YYYY-MM от января 1970 года, как у numpy datetime64[M]."""
+    return int(month[:4]) * 12 + int(month[5:7]) - 1 - 1970 * 12
+
+
+class TrendRow(NamedTuple):
+    """Статистика цен по направлению за один месяц вылета."""
+    month: str
+    count: int
+    min: int
+    median: int
+    percentile: int
+    # Самая низкая цена из последней проверки направления
+    latest: int
+    updated_at: datetime.datetime
+
+
+class PriceStore:
+    """Локальная история цен из ответов prices_for_dates.
+
+    Каждая полученная цена дописывается в конец файла записью фиксированного размера
+    (RECORD_DTYPE), поэтому запись не требует чтения. Дозапись и замена файла при сжатии
+    выполняются под исключительной блокировкой файла `<path>.lock` (fcntl.flock), общей
+    для всех потоков и процессов бота. Чтение блокировку не берет. При запросе статистики
+    новые записи дочитываются с конца файла в отдельные массивы NumPy по столбцам,
+    а агрегаты считаются векторно, без запросов к API.
+
+    compact() удаляет записи старше `retention_days` дней и схлопывает одинаковые цены
+    одного рейса, полученные в один и тот же день, в одну запись.
+    """
+
+    def __init__(self, path: str, retention_days: int = config.PRICE_STORE_RETENTION_DAYS) -> None:
+        """
+        Args:
+            path (str): Путь к файлу цен.
+            retention_days (int): Сколько дней хранить полученные цены.
+        """
+        self.path: str = path
+        self.retention_days: int = retention_days
+        self._lock: threading.Lock = threading.Lock()
+        self._columns: Dict[str, np.ndarray] = {name: np.empty(0, dtype=RECORD_DTYPE[name]) for name in COLUMNS}
+        self._loaded_bytes: int = 0
+        self._inode: Optional[int] = None
+
+    def record(self, origin: str, destination: str, flights: Iterable[dict],
+               fetched_at: Optional[float] = None) -> int:
+        """Дописывает цены рейсов из ответа API.
+
+        Args:
+            origin (str): IATA-код города отправления из запроса.
+            destination (str): IATA-код города прибытия из запроса.
+            flights (Iterable[dict]): Рейсы из ответа prices_for_dates.
+            fetched_at (Optional[float]): Время получения, по умолчанию текущее.
+
+        Returns:
+            int: Количество записанных цен.
+        """
+        route: Optional[int] = pack_route(origin, destination)
+        if route is None:
+            return 0
+        fetched: int = int(time.time() if fetched_at is None else fetched_at)
+        rows: List[Tuple[int, int, int, int]] = []
+        for flight in flights:
+            try:
+                departure: int = datetime.date.fromisoformat(flight['departure_at'][:10]).toordinal() - EPOCH_ORDINAL
+                rows.append((route, departure, int(flight['price']), fetched))
+            except (KeyError, TypeError, ValueError):
+                continue
+        if not rows:
+            return 0
+        data: bytes = np.array(rows, dtype=RECORD_DTYPE).tobytes()
+        # Файл открывается под блокировкой на каждую запись: после compact() запись пойдет в новый файл
+        with self._exclusive(), open(self.path, 'ab') as file:
+            file.write(data)
+        return len(rows)
+
+    @contextlib.contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        """Исключительная блокировка файла цен в этом процессе и во всех остальных.
+
+        Блокируется отдельный файл `<path>.lock`, а не сам файл цен: compact() заменяет
+        файл цен, и блокировка старого файла не защищала бы запись в новый.
+        """
+        with self._lock, open(self.path + '.lock', 'ab') as lock_file:
+            if fcntl is not None:
+                # Блокировка снимается при закрытии файла
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Все записи файла по столбцам, включая дописанные с прошлого вызова.
+
+        Returns:
+            Dict[str, np.ndarray]: Массив значений по имени столбца RECORD_DTYPE.
+        """
+        with self._lock:
+            try:
+                stat: os.stat_result = os.stat(self.path)
+            except FileNotFoundError:
+                stat = None
+            if stat is None or stat.st_ino != self._inode or stat.st_size < self._loaded_bytes:
+                # Файл пересоздан при сжатии: читаем заново
+                self._columns = {name: np.empty(0, dtype=RECORD_DTYPE[name]) for name in COLUMNS}
+                self._loaded_bytes = 0
+                self._inode = stat.st_ino if stat else None
+            if stat is not None:
+                # Незаконченная запись в конце файла (ее прямо сейчас дописывают) пропускается
+                end: int = stat.st_size - stat.st_size % RECORD_DTYPE.itemsize
+                if end > self._loaded_bytes:
+                    with open(self.path, 'rb') as file:
+                        file.seek(self._loaded_bytes)
+                        tail: np.ndarray = np.frombuffer(file.read(end - self._loaded_bytes), dtype=RECORD_DTYPE)
+                    self._columns = {name: np.concatenate((self._columns[name], tail[name])) for name in COLUMNS}
+                    self._loaded_bytes += len(tail) * RECORD_DTYPE.itemsize
+            return self._columns
+
+    def trend(self, origin: str, destination: str, months: List[str],
+              percentile: float = config.TREND_PERCENTILE) -> List[TrendRow]:
+        """Статистика сохраненных цен по направлению для каждого месяца вылета.
+
+        Args:
+            origin (str): IATA-код города отправления.
+            destination (str): IATA-код города прибытия.
+            months (List[str]): Месяцы вылета в формате YYYY-MM.
+            percentile (float): Какой перцентиль цены считать, от 0 до 100.
+
+        Returns:
+            List[TrendRow]: Строки для месяцев, по которым есть цены, по порядку месяцев.
+        """
+        route: Optional[int] = pack_route(origin, destination)
+        columns: Dict[str, np.ndarray] = self.columns()
+        if route is None or not len(columns['route']):
+            return []
+        wanted: np.ndarray = np.array([month_number(month) for month in months], dtype=np.int64)
+        selected: np.ndarray = np.flatnonzero(columns['route'] == route)
+        month: np.ndarray = columns['departure'][selected].astype('datetime64[D]').astype('datetime64[M]').astype(
+            np.int64)
+        inside: np.ndarray = np.isin(month, wanted)
+        selected, month = selected[inside], month[inside]
+        if not len(selected):
+            return []
+        price: np.ndarray = columns['price'][selected].astype(np.int64)
+        fetched: np.ndarray = columns['fetched_at'][selected].astype(np.int64)
+
+        # Сортировка по месяцу и цене: каждая группа - непрерывный отрезок, цены в нем по возрастанию
+        order: np.ndarray = np.lexsort((price, month))
+        month, price, fetched = month[order], price[order], fetched[order]
+        starts: np.ndarray = np.flatnonzero(np.r_[True, month[1:] != month[:-1]])
+        counts: np.ndarray = np.diff(np.r_[starts, len(month)])
+        group: np.ndarray = np.repeat(np.arange(len(starts)), counts)
+
+        def quantile(q: float) -> np.ndarray:
+            # Линейная интерполяция между соседними ценами, как np.percentile по умолчанию
+            position: np.ndarray = starts + q * (counts - 1)
+            low: np.ndarray = np.floor(position).astype(np.int64)
+            high: np.ndarray = np.minimum(low + 1, starts + counts - 1)
+            return price[low] + (price[high] - price[low]) * (position - low)
+
+        updated: np.ndarray = np.maximum.reduceat(fetched, starts)
+        # Самая низкая цена среди полученных при последней проверке месяца
+        latest: np.ndarray = np.minimum.reduceat(
+            np.where(fetched >= updated[group] - LAST_FETCH_WINDOW, price, np.iinfo(np.int64).max), starts)
+        medians: np.ndarray = quantile(0.5)
+        percentiles: np.ndarray = quantile(percentile / 100)
+        return [TrendRow(month=f'{number // 12 + 1970:04d}-{number % 12 + 1:02d}', count=int(count), min=int(low),
+                         median=int(round(median)), percentile=int(round(high)), latest=int(last),
+                         updated_at=datetime.datetime.fromtimestamp(int(at), datetime.timezone.utc))
+                for number, count, low, median, high, last, at in zip(month[starts], counts, price[starts], medians,
+                                                                      percentiles, latest, updated)]
+
+    def compact(self, now: Optional[float] = None) -> Tuple[int, int]:
+        """Удаляет устаревшие записи и схлопывает повторы, переписывая файл.
+
+        Одинаковые цены одного рейса (направление, день вылета, цена), полученные в один
+        и тот же день UTC, остаются одной записью с последним временем получения. Основная
+        часть файла сжимается без блокировки. Затем под блокировкой записи (_exclusive)
+        дописанное за это время копируется в новый файл, и он заменяет старый, поэтому
+        дозапись из любого потока или процесса не теряется. Если файл за это время заменило
+        сжатие в другом процессе, файл не меняется.
+
+        Args:
+            now (Optional[float]): Текущее время, по умолчанию time.time().
+
+        Returns:
+            Tuple[int, int]: Количество записей до и после сжатия.
+        """
+        if not os.path.exists(self.path):
+            return 0, 0
+        expire_before: int = int((time.time() if now is None else now) - self.retention_days * 86400)
+        temporary: str = f'{self.path}.{os.getpid()}.tmp'
+        with open(self.path, 'rb') as file:
+            data: bytes = file.read()
+            # Незаконченная запись в конце файла дочитывается позже, под блокировкой
+            read_bytes: int = len(data) - len(data) % RECORD_DTYPE.itemsize
+            records: np.ndarray = np.frombuffer(data[:read_bytes], dtype=RECORD_DTYPE)
+            records = records[records['fetched_at'] >= expire_before]
+            if not len(records):
+                # Все записи устарели или файл пуст: остается только дописанное за время сжатия
+                return self._replace(file, read_bytes, records, temporary)
+            # В порядке (направление, день вылета, цена, время): повторы - соседние записи одного дня получения
+            records = records[np.lexsort((records['fetched_at'], records['price'], records['departure'],
+                                          records['route']))]
+            day: np.ndarray = records['fetched_at'] // 86400
+            last_of_run: np.ndarray = np.r_[(records['route'][1:] != records['route'][:-1])
+                                            | (records['departure'][1:] != records['departure'][:-1])
+                                            | (records['price'][1:] != records['price'][:-1])
+                                            | (day[1:] != day[:-1]), True]
+            return self._replace(file, read_bytes, records[last_of_run], temporary)
+
+    def _replace(self, file: BinaryIO, read_bytes: int, compacted: np.ndarray, temporary: str) -> Tuple[int, int]:
+        # Заменяет файл сжатыми записями и тем, что дописали после первых read_bytes байт
+        with self._exclusive():
+            if os.fstat(file.fileno()).st_ino != os.stat(self.path).st_ino:
+                return read_bytes // RECORD_DTYPE.itemsize, read_bytes // RECORD_DTYPE.itemsize
+            with open(temporary, 'wb') as output:
+                output.write(compacted.tobytes())
+                # Дописанное за время сжатия копируется как есть, целыми записями
+                file.seek(read_bytes)
+                tail: bytes = file.read()
+                output.write(tail[:len(tail) - len(tail) % RECORD_DTYPE.itemsize])
+            os.replace(temporary, self.path)
+        return read_bytes // RECORD_DTYPE.itemsize, len(compacted)
+
+
+class PriceCompactor(threading.Thread):
+    """Фоновый поток, сжимающий историю цен при запуске и раз в `interval` секунд."""
+
+    def __init__(self, store: PriceStore, interval: float) -> None:
+        """
+        Args:
+            store (PriceStore): История цен.
+            interval (float): Пауза между сжатиями в секундах.
+        """
+        super().__init__(name='price-compactor', daemon=True)
+        self.store: PriceStore = store
+        self.interval: float = interval
+        self._stopped: threading.Event = threading.Event()
+
+    def run(self) -> None:
+        while True:
+            try:
+                before, after = self.store.compact()
+                logger.info(f'История цен сжата: {before} -> {after} записей')
+            except Exception:
+                # Поток продолжает работать: следующее сжатие попробует снова
+                logger.exception('Не удалось сжать историю цен')
+            if self._stopped.wait(self.interval):
+                return
+
+    def stop(self) -> None:
+        """Останавливает поток после текущего сжатия."""
+        self._stopped.set()
+
+
+# Общая история цен для всех обработчиков
+price_store: PriceStore = PriceStore(config.PRICE_STORE_PATH or PRICE_STORE_PATH)
+
+
+def start_price_compactor() -> Optional[PriceCompactor]:
+    """Запускает сжатие истории цен, если оно включено в настройках.
+
+    Returns:
+        Optional[PriceCompactor]: Запущенный поток или None, если сжатие выключено.
+    """
+    if config.PRICE_STORE_COMPACT_INTERVAL <= 0:
+        return None
+    compactor: PriceCompactor = PriceCompactor(price_store, config.PRICE_STORE_COMPACT_INTERVAL)
+    compactor.start()
+    return compactor
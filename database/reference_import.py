@@ -0,0 +1,319 @@
+"""Обновление справочников городов и аэропортов из выгрузок Travelpayouts.
+
+Запуск: python -m database.reference_import [--cities ФАЙЛ_ИЛИ_URL] [--airports ФАЙЛ_ИЛИ_URL]
+
+Выгрузки cities.json и airports.json (по умолчанию с api.travelpayouts.com, на русском) читаются
+потоком: JSON-массив разбирается по одному элементу, поэтому память не зависит от размера файла.
+Записи добавляются или обновляются по коду большими транзакциями в копии базы, и готовая копия
+атомарно заменяет файл базы. Работающий бот замечает новый файл сам: справочники в памяти
+сверяют время изменения базы раз в минуту. Если рядом есть снимок справочников, он пересобирается.
+"""
+import argparse
+import io
+import json
+import os
+import re
+import shutil
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, TextIO, Tuple, Type
+
+import peewee as pw
+import requests as rq
+
+from config_data import config
+from database.airport_directory import airport_directory
+from database.gazetteer import gazetteer
+from database.models import AIRPORTS_DB_PATH, CITIES_DB_PATH, Airport, City
+from database.reference_snapshot import REFERENCE_SNAPSHOT_PATH, build_snapshot
+
+# Выгрузки справочников Travelpayouts: name - на русском, name_translations.en - на английском
+CITIES_DUMP_URL: str = f'{config.AVIASALES_API_URL}/data/ru/cities.json'
+AIRPORTS_DUMP_URL: str = f'{config.AVIASALES_API_URL}/data/ru/airports.json'
+
+# Города обновляются по уникальному индексу city_code. У таблицы airports уникального индекса нет
+# (в исходных данных код повторяется), поэтому сначала обновляются все строки с кодом, а новая
+# добавляется, только если строки с таким кодом не было; для этого нужен обычный индекс по коду
+_UPSERT_CITY_SQL: str = ('INSERT INTO city (name, ru, code, lon, lat) VALUES (?, ?, ?, ?, ?) '
+                         'ON CONFLICT (code) DO UPDATE SET '
+                         'name = excluded.name, ru = excluded.ru, lon = excluded.lon, lat = excluded.lat')
+_AIRPORT_CODE_INDEX_SQL: str = 'CREATE INDEX IF NOT EXISTS airports_code ON airports (code)'
+_UPDATE_AIRPORT_SQL: str = 'UPDATE airports SET name = ? WHERE code = ?'
+_INSERT_AIRPORT_SQL: str = ('INSERT INTO airports (name, code) '
+                            'SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM airports WHERE code = ?)')
+
+# Рабочую копию после сбоя можно просто удалить, поэтому ей не нужны журнал на диске и fsync
+_WORKING_PRAGMAS: Dict[str, object] = {'journal_mode': 'memory', 'synchronous': 'off'}
+_WHITESPACE: re.Pattern = re.compile(r'[ \t\n\r]*')
+
+
+class ImportStats(NamedTuple):
+    """Итог загрузки одной выгрузки."""
+    read: int
+    imported: int
+    skipped: int
+    rows_before: int
+    rows_after: int
+    seconds: float
+
+
+def iter_json_array(stream: TextIO, chunk_size: int = 1 << 16) -> Iterator[object]:
+    """Разбирает JSON-массив из потока по одному элементу.
+
+    В памяти хранится только необработанный остаток прочитанного текста, а не весь массив.
+
+    Args:
+        stream (TextIO): Текстовый поток с JSON-массивом.
+        chunk_size (int): Сколько символов читать за раз.
+
+    Yields:
+        object: Очередной элемент массива.
+
+    Raises:
+        ValueError: Если в потоке не JSON-массив или он обрезан.
+    """
+    decoder: json.JSONDecoder = json.JSONDecoder()
+    buffer: str = ''
+    position: int = 0
+    exhausted: bool = False
+
+    def refill() -> bool:
+        nonlocal buffer, position, exhausted
+        chunk: str = stream.read(chunk_size)
+        exhausted = not chunk
+        buffer, position = buffer[position:] + chunk, 0
+        return not exhausted
+
+    def next_char() -> str:
+        nonlocal position
+        while True:
+            position = _WHITESPACE.match(buffer, position).end()
+            if position < len(buffer):
+                return buffer[position]
+            if not refill():
+                raise ValueError('JSON-массив обрезан')
+
+    if next_char() != '[':
+        raise ValueError('Ожидался JSON-массив')
+    position += 1
+    if next_char() == ']':
+        return
+    while True:
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            item, end = None, None
+        # Элемент в конце буфера мог быть прочитан не целиком (например, число)
+        if end is None or (end == len(buffer) and not exhausted):
+            if not refill():
+                raise ValueError(f'Ошибка в JSON-массиве: {buffer[:80]!r}')
+            continue
+        yield item
+        position = end
+        separator: str = next_char()
+        position += 1
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError(f'Ошибка в JSON-массиве: {separator!r} вместо запятой')
+        next_char()
+
+
+def _names(item: dict) -> Tuple[Optional[str], Optional[str]]:
+    # Название на английском и на русском: в русской выгрузке name - русское
+    translations: dict = item.get('name_translations') or {}
+    name: Optional[str] = item.get('name')
+    return translations.get('en') or name, translations.get('ru') or name
+
+
+def city_row(item: object) -> Optional[tuple]:
+    """Строка таблицы city из элемента cities.json.
+
+    Args:
+        item (object): Элемент выгрузки.
+
+    Returns:
+        Optional[tuple]: (name, ru, code, lon, lat) или None, если не хватает кода, названий или координат.
+    """
+    if not isinstance(item, dict):
+        return None
+    name, ru = _names(item)
+    coordinates: dict = item.get('coordinates') or {}
+    code: Optional[str] = item.get('code')
+    lon, lat = coordinates.get('lon'), coordinates.get('lat')
+    if not (code and name and ru) or lon is None or lat is None:
+        return None
+    return name, ru, code, float(lon), float(lat)
+
+
+def airport_row(item: object) -> Optional[tuple]:
+    """Строка таблицы airports из элемента airports.json.
+
+    Вокзалы и порты из выгрузки пропускаются: в ответах Aviasales их нет.
+
+    Args:
+        item (object): Элемент выгрузки.
+
+    Returns:
+        Optional[tuple]: (name, code) или None, если запись не нужна или в ней не хватает данных.
+    """
+    if not isinstance(item, dict) or item.get('iata_type', 'airport') != 'airport':
+        return None
+    _, ru = _names(item)
+    code: Optional[str] = item.get('code')
+    if not (code and ru):
+        return None
+    return ru, code
+
+
+@contextmanager
+def open_dump(source: str) -> Iterator[TextIO]:
+    """Открывает выгрузку из файла или по HTTP(S) как текстовый поток, не читая ее целиком.
+
+    Args:
+        source (str): Путь к файлу или URL.
+
+    Yields:
+        TextIO: Поток с текстом выгрузки.
+    """
+    if not source.startswith(('http://', 'https://')):
+        with open(source, encoding='utf-8') as file:
+            yield file
+        return
+    with rq.get(source, stream=True, timeout=(config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT)) as response:
+        response.raise_for_status()
+        # Выгрузки отдаются со сжатием gzip, распаковка тоже идет потоком
+        response.raw.decode_content = True
+        yield io.TextIOWrapper(response.raw, encoding='utf-8')
+
+
+def _batches(rows: Iterator[Optional[tuple]], size: int, counts: Dict[str, int]) -> Iterator[List[tuple]]:
+    batch: List[tuple] = []
+    for row in rows:
+        counts['read'] += 1
+        if row is None:
+            counts['skipped'] += 1
+            continue
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _import(source: str, db_path: str, model: Type[pw.Model], parse: Callable[[object], Optional[tuple]],
+            upsert: Callable[[pw.SqliteDatabase, List[tuple]], None], batch_size: int,
+            prepare_sql: Optional[str] = None) -> ImportStats:
+    started: float = time.perf_counter()
+    working: str = f'{db_path}.{os.getpid()}.import'
+    db: pw.SqliteDatabase = pw.SqliteDatabase(working, pragmas=_WORKING_PRAGMAS)
+    counts: Dict[str, int] = {'read': 0, 'skipped': 0, 'imported': 0}
+    try:
+        if os.path.exists(db_path):
+            shutil.copyfile(db_path, working)
+        else:
+            # Базы еще нет: таблица и индексы создаются по модели
+            with model.bind_ctx(db):
+                model.create_table()
+        with db.connection_context():
+            if prepare_sql:
+                db.execute_sql(prepare_sql)
+            table: str = model._meta.table_name
+            rows_before: int = db.execute_sql(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            with open_dump(source) as stream:
+                for batch in _batches(map(parse, iter_json_array(stream)), batch_size, counts):
+                    with db.atomic():
+                        upsert(db, batch)
+                    counts['imported'] += len(batch)
+            rows_after: int = db.execute_sql(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        # Открытые соединения бота продолжают читать старый файл, новые откроют уже этот
+        os.replace(working, db_path)
+    finally:
+        if os.path.exists(working):
+            os.remove(working)
+    return ImportStats(counts['read'], counts['imported'], counts['skipped'], rows_before, rows_after,
+                       time.perf_counter() - started)
+
+
+def _upsert_cities(db: pw.SqliteDatabase, batch: List[tuple]) -> None:
+    db.cursor().executemany(_UPSERT_CITY_SQL, batch)
+
+
+def _upsert_airports(db: pw.SqliteDatabase, batch: List[tuple]) -> None:
+    db.cursor().executemany(_UPDATE_AIRPORT_SQL, batch)
+    db.cursor().executemany(_INSERT_AIRPORT_SQL, ((name, code, code) for name, code in batch))
+
+
+def import_cities(source: str = CITIES_DUMP_URL, db_path: str = CITIES_DB_PATH,
+                  batch_size: int = config.REFERENCE_IMPORT_BATCH) -> ImportStats:
+    """Добавляет и обновляет города из выгрузки cities.json и заменяет ими базу.
+
+    Args:
+        source (str): Путь к файлу выгрузки или URL.
+        db_path (str): Путь к базе cities.db.
+        batch_size (int): Сколько записей записывать одной транзакцией.
+
+    Returns:
+        ImportStats: Итог загрузки.
+    """
+    return _import(source, db_path, City, city_row, _upsert_cities, batch_size)
+
+
+def import_airports(source: str = AIRPORTS_DUMP_URL, db_path: str = AIRPORTS_DB_PATH,
+                    batch_size: int = config.REFERENCE_IMPORT_BATCH) -> ImportStats:
+    """Добавляет и обновляет аэропорты из выгрузки airports.json и заменяет ими базу.
+
+    Args:
+        source (str): Путь к файлу выгрузки или URL.
+        db_path (str): Путь к базе airports.db.
+        batch_size (int): Сколько записей записывать одной транзакцией.
+
+    Returns:
+        ImportStats: Итог загрузки.
+    """
+    return _import(source, db_path, Airport, airport_row, _upsert_airports, batch_size, _AIRPORT_CODE_INDEX_SQL)
+
+
+def refresh_reference_data(cities_source: Optional[str] = CITIES_DUMP_URL,
+                           airports_source: Optional[str] = AIRPORTS_DUMP_URL,
+                           snapshot_path: Optional[str] = None) -> Dict[str, ImportStats]:
+    """Обновляет справочники, пересобирает снимок и перезагружает справочники этого процесса.
+
+    Args:
+        cities_source (Optional[str]): Выгрузка городов; None - не обновлять.
+        airports_source (Optional[str]): Выгрузка аэропортов; None - не обновлять.
+        snapshot_path (Optional[str]): Снимок справочников, который нужно пересобрать, если он есть;
+            по умолчанию - из настроек.
+
+    Returns:
+        Dict[str, ImportStats]: Итоги по справочникам 'cities' и 'airports'.
+    """
+    stats: Dict[str, ImportStats] = {}
+    if cities_source:
+        stats['cities'] = import_cities(cities_source)
+    if airports_source:
+        stats['airports'] = import_airports(airports_source)
+    snapshot_path = snapshot_path or config.REFERENCE_SNAPSHOT_PATH or REFERENCE_SNAPSHOT_PATH
+    if stats and os.path.exists(snapshot_path):
+        build_snapshot(snapshot_path)
+    gazetteer.reload_if_changed()
+    airport_directory.reload_if_changed()
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Обновление справочников городов и аэропортов из выгрузок Travelpayouts')
+    parser.add_argument('--cities', default=CITIES_DUMP_URL, help='файл или URL выгрузки cities.json, "-" - не обновлять')
+    parser.add_argument('--airports', default=AIRPORTS_DUMP_URL,
+                        help='файл или URL выгрузки airports.json, "-" - не обновлять')
+    args = parser.parse_args()
+    stats: Dict[str, ImportStats] = refresh_reference_data(
+        None if args.cities == '-' else args.cities, None if args.airports == '-' else args.airports)
+    for name, result in stats.items():
+        print(f'{name}: прочитано {result.read}, записано {result.imported}, пропущено {result.skipped}, '
+              f'строк было {result.rows_before}, стало {result.rows_after}, {result.seconds:.1f} с')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,539 @@
+"""Снимок справочников городов и аэропортов в одном двоичном файле.
+
+Сборка: python -m database.reference_snapshot [--output database/reference.snap]
+
+Файл открывается через mmap только для чтения, поэтому все процессы бота (например,
+обработчики режима webhook) делят одну копию в кэше страниц, а поиск читает записи
+прямо из отображенной памяти, не создавая словарей и списков на каждый город.
+
+Формат (little-endian, каждый раздел выровнен по 8 байт):
+ - заголовок HEADER: сигнатура, версия, размеры разделов и BLAKE2b исходных баз;
+ - города: записи CITY по строкам таблицы city (смещения и длины строк, долгота, широта);
+ - индексы name и ru для двоичного поиска: отсортированные по байтам строки (смещение, длина)
+   и номер города с этой строкой;
+ - совершенный хэш городов по коду: смещения корзин (int32) и номер города в каждом слоте;
+ - аэропорты: записи AIRPORT, по одной на код (при повторах - первая строка таблицы);
+ - совершенный хэш аэропортов по коду;
+ - строки: все названия и коды в UTF-8, каждая уникальная строка хранится один раз.
+"""
+import abc
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+from telebot import logger
+
+from database.models import (AIRPORT_ROWS_SQL, AIRPORTS_DB_PATH, CITIES_DB_PATH, CITY_ROWS_SQL, DATABASE_DIR,
+                             open_readonly)
+
+# Путь к снимку по умолчанию
+REFERENCE_SNAPSHOT_PATH: str = os.path.join(DATABASE_DIR, 'reference.snap')
+
+MAGIC: bytes = b'TBREFSNP'
+VERSION: int = 1
+# Сигнатура, версия, количество городов, размеры индексов name и ru, количество кодов городов,
+# количество аэропортов, размер раздела строк; затем BLAKE2b баз городов и аэропортов
+HEADER: struct.Struct = struct.Struct('<8sIIIIIII4x16s16s')
+# Смещения и длины name, ru и code в разделе строк, долгота, широта
+CITY: struct.Struct = struct.Struct('<IIIHHH2xdd')
+# Смещения и длины code и name
+AIRPORT: struct.Struct = struct.Struct('<IIHH')
+DIGEST_SIZE: int = 16
+
+FNV_OFFSET: int = 0x811c9dc5
+FNV_PRIME: int = 0x01000193
+
+
+def _hash(key: bytes, seed: int) -> int:
+    # FNV-1a, у которой начальное значение заменяется смещением корзины
+    value: int = seed or FNV_OFFSET
+    for byte in key:
+        value = ((value ^ byte) * FNV_PRIME) & 0xffffffff
+    return value
+
+
+def build_perfect_hash(keys: List[bytes]) -> Tuple[List[int], List[int]]:
+    """Минимальный совершенный хэш (hash and displace) для различных ключей.
+
+    Ключи раскладываются по корзинам первым хэшем. Для корзин с несколькими ключами, начиная
+    с самых больших, подбирается смещение, при котором второй хэш разводит ключи по свободным
+    слотам; ключи из одиночных корзин занимают оставшиеся слоты напрямую.
+
+    Args:
+        keys (List[bytes]): Различные ключи.
+
+    Returns:
+        Tuple[List[int], List[int]]: Смещения корзин (отрицательное значение -slot - 1 - слот
+        одиночного ключа) и номер ключа в каждом слоте.
+    """
+    size: int = len(keys)
+    buckets: List[List[int]] = [[] for _ in range(size)]
+    for number, key in enumerate(keys):
+        buckets[_hash(key, 0) % size].append(number)
+    displacements: List[int] = [0] * size
+    slots: List[int] = [-1] * size
+    order: List[int] = sorted(range(size), key=lambda bucket: -len(buckets[bucket]))
+    position: int = 0
+    for position, bucket in enumerate(order):
+        items: List[int] = buckets[bucket]
+        if len(items) < 2:
+            break
+        seed: int = 1
+        while True:
+            taken: List[int] = [_hash(keys[number], seed) % size for number in items]
+            if len(set(taken)) == len(taken) and all(slots[slot] == -1 for slot in taken):
+                break
+            seed += 1
+        displacements[bucket] = seed
+        for number, slot in zip(items, taken):
+            slots[slot] = number
+    else:
+        position = size
+    free: List[int] = [slot for slot in range(size) if slots[slot] == -1]
+    for bucket in order[position:]:
+        if buckets[bucket]:
+            slot = free.pop()
+            slots[slot] = buckets[bucket][0]
+            displacements[bucket] = -slot - 1
+    return displacements, slots
+
+
+def file_digest(path: str) -> bytes:
+    """BLAKE2b содержимого файла; по нему снимок проверяется на соответствие исходной базе."""
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _align(data: bytearray) -> None:
+    data.extend(bytes(-len(data) % 8))
+
+
+def build_snapshot(output: str = REFERENCE_SNAPSHOT_PATH, cities_path: str = CITIES_DB_PATH,
+                   airports_path: str = AIRPORTS_DB_PATH) -> int:
+    """Собирает снимок справочников и атомарно заменяет им файл `output`.
+
+    Args:
+        output (str): Путь к снимку.
+        cities_path (str): Путь к базе cities.db.
+        airports_path (str): Путь к базе airports.db.
+
+    Returns:
+        int: Размер снимка в байтах.
+    """
+    cities_db = open_readonly(cities_path)
+    with cities_db.connection_context():
+        cities: List[tuple] = cities_db.execute_sql(CITY_ROWS_SQL).fetchall()
+    airports_db = open_readonly(airports_path)
+    with airports_db.connection_context():
+        airport_rows: List[tuple] = airports_db.execute_sql(AIRPORT_ROWS_SQL).fetchall()
+
+    strings: bytearray = bytearray()
+    interned: Dict[str, Tuple[int, int]] = {}
+
+    def intern(value: str) -> Tuple[int, int]:
+        if value not in interned:
+            encoded: bytes = value.encode()
+            interned[value] = (len(strings), len(encoded))
+            strings.extend(encoded)
+        return interned[value]
+
+    city_records: bytearray = bytearray()
+    first_by: Dict[str, Dict[bytes, int]] = {'name': {}, 'ru': {}, 'code': {}}
+    for row, (name, ru, code, lon, lat) in enumerate(cities):
+        refs: List[Tuple[int, int]] = [intern(name), intern(ru), intern(code)]
+        city_records.extend(CITY.pack(*(offset for offset, _ in refs), *(length for _, length in refs), lon, lat))
+        # При совпадении значений побеждает первая строка, как и у словарей справочника
+        for key, value in (('name', name), ('ru', ru), ('code', code)):
+            first_by[key].setdefault(value.encode(), row)
+
+    airports: Dict[bytes, Tuple[str, str]] = {}
+    for code, name in airport_rows:
+        airports.setdefault(code.encode(), (code, name))
+    airport_records: bytearray = bytearray()
+    for code, name in airports.values():
+        code_ref, name_ref = intern(code), intern(name)
+        airport_records.extend(AIRPORT.pack(code_ref[0], name_ref[0], code_ref[1], name_ref[1]))
+
+    sorted_index: Dict[str, List[int]] = {}
+    for key in ('name', 'ru'):
+        entries: List[int] = []
+        for value in sorted(first_by[key]):
+            entries.extend((*interned[value.decode()], first_by[key][value]))
+        sorted_index[key] = entries
+    city_codes: List[bytes] = list(first_by['code'])
+    city_displacements, city_slots = build_perfect_hash(city_codes)
+    airport_codes: List[bytes] = list(airports)
+    airport_displacements, airport_slots = build_perfect_hash(airport_codes)
+
+    data: bytearray = bytearray(HEADER.pack(MAGIC, VERSION, len(cities), len(first_by['name']), len(first_by['ru']),
+                                            len(city_codes),
+                                            len(airports), len(strings), file_digest(cities_path),
+                                            file_digest(airports_path)))
+    for section in (city_records, struct.pack(f'<{len(sorted_index["name"])}I', *sorted_index['name']),
+                    struct.pack(f'<{len(sorted_index["ru"])}I', *sorted_index['ru']),
+                    struct.pack(f'<{len(city_codes)}i', *city_displacements),
+                    struct.pack(f'<{len(city_codes)}I', *(first_by['code'][city_codes[number]] for number in city_slots)),
+                    airport_records,
+                    struct.pack(f'<{len(airport_codes)}i', *airport_displacements),
+                    struct.pack(f'<{len(airport_codes)}I', *airport_slots),
+                    strings):
+        _align(data)
+        data.extend(section)
+
+    temporary: str = f'{output}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(data)
+    os.replace(temporary, output)
+    return len(data)
+
+
+class _Strings:
+    """Раздел строк снимка."""
+
+    def __init__(self, view: memoryview) -> None:
+        self.view: memoryview = view
+
+    def raw(self, offset: int, length: int) -> bytes:
+        return self.view[offset:offset + length].tobytes()
+
+    def get(self, offset: int, length: int) -> str:
+        return str(self.view[offset:offset + length], 'utf-8')
+
+
+class _CityColumn:
+    """Колонка таблицы city в снимке: строки по номеру поля записи или float для координат."""
+
+    def __init__(self, snapshot: 'ReferenceSnapshot', field: int) -> None:
+        self.snapshot: ReferenceSnapshot = snapshot
+        self.field: int = field
+
+    def __len__(self) -> int:
+        return self.snapshot.cities
+
+    def __getitem__(self, row: int):
+        values: tuple = self.snapshot.city(row)
+        if self.field >= 6:
+            return values[self.field]
+        return self.snapshot.strings.get(values[self.field], values[self.field + 3])
+
+
+class _SortedIndex:
+    """Поиск номера города по строке двоичным поиском по отсортированным строкам."""
+
+    def __init__(self, strings: _Strings, entries: memoryview) -> None:
+        self.strings: _Strings = strings
+        # Тройки (смещение строки, длина, номер города)
+        self.entries: memoryview = entries
+
+    def get(self, key: str, default: Optional[int] = None) -> Optional[int]:
+        target: bytes = key.encode()
+        entries: memoryview = self.entries
+        raw = self.strings.raw
+        low, high = 0, len(entries) // 3
+        while low < high:
+            middle: int = (low + high) // 2
+            if raw(entries[3 * middle], entries[3 * middle + 1]) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(entries) // 3 and raw(entries[3 * low], entries[3 * low + 1]) == target:
+            return entries[3 * low + 2]
+        return default
+
+
+class _HashIndex:
+    """Поиск по коду через совершенный хэш с проверкой, что в слоте именно этот код."""
+
+    def __init__(self, displacements: memoryview, slots: memoryview, code_of) -> None:
+        self.displacements: memoryview = displacements
+        self.slots: memoryview = slots
+        self.code_of = code_of
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def get(self, key: str, default: Optional[int] = None) -> Optional[int]:
+        size: int = len(self.slots)
+        if not size:
+            return default
+        target: bytes = key.encode()
+        displacement: int = self.displacements[_hash(target, 0) % size]
+        slot: int = -displacement - 1 if displacement < 0 else _hash(target, displacement) % size
+        value: int = self.slots[slot]
+        return value if self.code_of(value) == target else default
+
+
+class _AirportNames(Mapping[str, str]):
+    """Названия аэропортов по коду: словарь только для чтения поверх снимка."""
+
+    def __init__(self, snapshot: 'ReferenceSnapshot', index: _HashIndex) -> None:
+        self.snapshot: ReferenceSnapshot = snapshot
+        self.index: _HashIndex = index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __iter__(self) -> Iterator[str]:
+        for number in range(len(self.index)):
+            code, _, code_length, _ = self.snapshot.airport(number)
+            yield self.snapshot.strings.get(code, code_length)
+
+    def __getitem__(self, code: str) -> str:
+        name: Optional[str] = self.get(code)
+        if name is None:
+            raise KeyError(code)
+        return name
+
+    def get(self, code: str, default: Optional[str] = None) -> Optional[str]:
+        number: Optional[int] = self.index.get(code)
+        if number is None:
+            return default
+        _, name, _, name_length = self.snapshot.airport(number)
+        return self.snapshot.strings.get(name, name_length)
+
+
+class CityColumns(NamedTuple):
+    """Колонки и индексы городов снимка с тем же интерфейсом, что у загруженного справочника."""
+    snapshot: 'ReferenceSnapshot'
+    names: _CityColumn
+    ru: _CityColumn
+    codes: _CityColumn
+    lon: _CityColumn
+    lat: _CityColumn
+    by_name: _SortedIndex
+    by_ru: _SortedIndex
+    by_code: _HashIndex
+
+    def row(self, index: int) -> Tuple[str, str, str, float, float]:
+        """Название, название на русском, код, долгота и широта города одним чтением записи."""
+        name, ru, code, name_length, ru_length, code_length, lon, lat = self.snapshot.city(index)
+        strings: _Strings = self.snapshot.strings
+        return (strings.get(name, name_length), strings.get(ru, ru_length), strings.get(code, code_length),
+                lon, lat)
+
+
+class ReferenceSnapshot:
+    """Снимок справочников, отображенный в память только для чтения."""
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): Путь к снимку.
+
+        Raises:
+            ValueError: Если файл не является снимком этой версии.
+        """
+        with open(path, 'rb') as file:
+            self._mmap: mmap.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view: memoryview = memoryview(self._mmap)
+        if len(view) < HEADER.size:
+            raise ValueError(f'{path}: файл слишком короткий')
+        (magic, version, self.cities, names, ru, codes, airports, strings,
+         self.cities_digest, self.airports_digest) = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path}: не снимок справочников версии {VERSION}')
+
+        sections: List[memoryview] = []
+        offset: int = HEADER.size
+        for length in (self.cities * CITY.size, names * 12, ru * 12, codes * 4, codes * 4,
+                       airports * AIRPORT.size, airports * 4, airports * 4, strings):
+            offset += -offset % 8
+            if offset + length > len(view):
+                raise ValueError(f'{path}: файл обрезан')
+            sections.append(view[offset:offset + length])
+            offset += length
+        (self._cities, by_name, by_ru, city_displacements, city_slots,
+         self._airports, airport_displacements, airport_slots, strings_view) = sections
+        self.strings: _Strings = _Strings(strings_view)
+        self.city_columns: CityColumns = CityColumns(
+            self, *(_CityColumn(self, field) for field in (0, 1, 2, 6, 7)),
+            _SortedIndex(self.strings, by_name.cast('I')), _SortedIndex(self.strings, by_ru.cast('I')),
+            _HashIndex(city_displacements.cast('i'), city_slots.cast('I'), self._city_code))
+        self.airport_names: _AirportNames = _AirportNames(self, _HashIndex(
+            airport_displacements.cast('i'), airport_slots.cast('I'), self._airport_code))
+
+    def city(self, row: int) -> tuple:
+        """Поля записи города: смещения name, ru, code, их длины, долгота, широта."""
+        if not 0 <= row < self.cities:
+            raise IndexError(row)
+        return CITY.unpack_from(self._cities, row * CITY.size)
+
+    def airport(self, number: int) -> tuple:
+        """Поля записи аэропорта: смещения code и name и их длины."""
+        return AIRPORT.unpack_from(self._airports, number * AIRPORT.size)
+
+    def _city_code(self, row: int) -> bytes:
+        values: tuple = self.city(row)
+        return self.strings.raw(values[2], values[5])
+
+    def _airport_code(self, number: int) -> bytes:
+        code, _, code_length, _ = self.airport(number)
+        return self.strings.raw(code, code_length)
+
+
+# Открытые снимки и BLAKE2b исходных баз по пути; запись обновляется, когда меняется файл
+_snapshots: Dict[str, Tuple[Optional[tuple], Optional[ReferenceSnapshot]]] = {}
+_digests: Dict[str, Tuple[Optional[tuple], Optional[bytes]]] = {}
+_cache_lock: threading.Lock = threading.Lock()
+
+
+def _file_key(path: str) -> Optional[tuple]:
+    try:
+        stat: os.stat_result = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def _source_digest(path: str) -> Optional[bytes]:
+    key: Optional[tuple] = _file_key(path)
+    cached: Optional[Tuple[Optional[tuple], Optional[bytes]]] = _digests.get(path)
+    if cached is None or cached[0] != key:
+        cached = (key, file_digest(path) if key is not None else None)
+        _digests[path] = cached
+    return cached[1]
+
+
+def load_snapshot(path: str, cities_path: Optional[str] = None,
+                  airports_path: Optional[str] = None) -> Optional[ReferenceSnapshot]:
+    """Открывает снимок, если он есть и собран из текущих версий указанных баз.
+
+    Снимок запоминается, пока не изменится его файл, поэтому справочники городов
+    и аэропортов одного процесса используют одно отображение файла в память.
+
+    Args:
+        path (str): Путь к снимку.
+        cities_path (Optional[str]): Путь к базе cities.db, если нужны города.
+        airports_path (Optional[str]): Путь к базе airports.db, если нужны аэропорты.
+
+    Returns:
+        Optional[ReferenceSnapshot]: Снимок или None, если справочники нужно читать из SQLite.
+    """
+    with _cache_lock:
+        key: Optional[tuple] = _file_key(path)
+        cached: Optional[Tuple[Optional[tuple], Optional[ReferenceSnapshot]]] = _snapshots.get(path)
+        if cached is None or cached[0] != key:
+            snapshot: Optional[ReferenceSnapshot] = None
+            if key is not None:
+                try:
+                    snapshot = ReferenceSnapshot(path)
+                except (OSError, ValueError) as e:
+                    logger.warning('Снимок справочников %s не прочитан (%s), справочники читаются из SQLite', path, e)
+            cached = (key, snapshot)
+            _snapshots[path] = cached
+        snapshot = cached[1]
+        if snapshot is None:
+            return None
+        if ((cities_path and _source_digest(cities_path) != snapshot.cities_digest)
+                or (airports_path and _source_digest(airports_path) != snapshot.airports_digest)):
+            logger.warning('Снимок справочников %s собран из других баз, справочники читаются из SQLite. '
+                           'Пересоберите его: python -m database.reference_snapshot', path)
+            return None
+        return snapshot
+
+
+class ReloadingReference(abc.ABC):
+    """Справочник в памяти, который перечитывается, когда меняется файл базы или снимка.
+
+    Общая часть справочников городов (database.gazetteer) и аэропортов
+    (database.airport_directory). Не чаще раза в `check_interval` секунд обращение
+    к справочнику сравнивает время изменения обоих файлов с загруженными и при
+    расхождении загружает справочник заново: из снимка, если он собран из текущей базы,
+    иначе из SQLite.
+    """
+
+    def __init__(self, db_path: str, check_interval: float = 60.0,
+                 snapshot_path: Optional[str] = None) -> None:
+        """
+        Args:
+            db_path (str): Путь к базе данных справочника.
+            check_interval (float): Как часто (в секундах) проверять, не изменился ли файл базы или снимка.
+            snapshot_path (Optional[str]): Путь к снимку справочников; None - всегда читать SQLite.
+        """
+        self.db_path: str = db_path
+        self.check_interval: float = check_interval
+        self.snapshot_path: Optional[str] = snapshot_path
+        # Снимок, из которого загружен справочник, или None, если он загружен из SQLite
+        self.snapshot: Optional[ReferenceSnapshot] = None
+        # Увеличивается при каждой перезагрузке, по нему зависимые индексы понимают, что устарели
+        self.version: int = 0
+        self._lock: threading.Lock = threading.Lock()
+        self._mtime_ns: Optional[Tuple[Optional[int], ...]] = None
+        self._checked_at: float = 0.0
+        self._data: Any = None
+
+    def reload(self) -> None:
+        """Перечитывает справочник."""
+        with self._lock:
+            self._load()
+
+    def reload_if_changed(self) -> bool:
+        """Перечитывает справочник, если файл базы данных или снимка изменился.
+
+        Returns:
+            bool: True, если справочник был перезагружен.
+        """
+        with self._lock:
+            self._checked_at = time.monotonic()
+            if self._data is not None and self._file_mtime() == self._mtime_ns:
+                return False
+            self._load()
+            return True
+
+    @abc.abstractmethod
+    def _open_snapshot(self) -> Optional[ReferenceSnapshot]:
+        """Снимок, если он собран из текущей базы справочника (load_snapshot)."""
+
+    @abc.abstractmethod
+    def _from_snapshot(self, snapshot: ReferenceSnapshot) -> Any:
+        """Данные справочника из снимка."""
+
+    @abc.abstractmethod
+    def _read_database(self) -> Any:
+        """Данные справочника из SQLite."""
+
+    def _current(self) -> Any:
+        data: Any = self._data
+        if data is None or time.monotonic() - self._checked_at > self.check_interval:
+            self.reload_if_changed()
+            data = self._data
+        return data
+
+    def _file_mtime(self) -> Tuple[Optional[int], ...]:
+        mtimes: List[Optional[int]] = []
+        for path in (self.db_path, self.snapshot_path):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns if path else None)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def _load(self) -> None:
+        mtime_ns: Tuple[Optional[int], ...] = self._file_mtime()
+        self.snapshot = self._open_snapshot() if self.snapshot_path else None
+        self._data = self._from_snapshot(self.snapshot) if self.snapshot is not None else self._read_database()
+        self._mtime_ns = mtime_ns
+        self._checked_at = time.monotonic()
+        self.version += 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Сборка снимка справочников городов и аэропортов')
+    parser.add_argument('--output', default=REFERENCE_SNAPSHOT_PATH, help='путь к снимку')
+    parser.add_argument('--cities', default=CITIES_DB_PATH, help='путь к базе городов')
+    parser.add_argument('--airports', default=AIRPORTS_DB_PATH, help='путь к базе аэропортов')
+    args = parser.parse_args()
+    size: int = build_snapshot(args.output, args.cities, args.airports)
+    print(f'Снимок {args.output}: {size / 1024:.0f} КБ')
+
+
+if __name__ == '__main__':
+    main()
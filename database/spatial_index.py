@@ -0,0 +1,158 @@
+import math
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from database.gazetteer import EARTH_RADIUS_KM, CityRecord, Gazetteer, gazetteer
+
+# Километров в одном градусе широты
+KM_PER_DEGREE: float = math.pi * EARTH_RADIUS_KM / 180
+# Половина окружности Земли: дальше этого расстояния точек нет
+MAX_DISTANCE_KM: float = math.pi * EARTH_RADIUS_KM
+
+
+class _Grid:
+    """Города одной версии справочника, разложенные по ячейкам сетки широта x долгота."""
+
+    def __init__(self, source: Gazetteer, cell_degrees: float) -> None:
+        count: int = len(source)
+        lat: np.ndarray = np.fromiter((source.record(row).lat for row in range(count)), dtype=np.float64, count=count)
+        lon: np.ndarray = np.fromiter((source.record(row).lon for row in range(count)), dtype=np.float64, count=count)
+        self.cell_degrees: float = cell_degrees
+        self.rows_count: int = math.ceil(180 / cell_degrees)
+        self.cols_count: int = math.ceil(360 / cell_degrees)
+        cells: np.ndarray = self._cell_row(lat) * self.cols_count + self._cell_col(lon)
+
+        # Города отсортированы по номеру ячейки, поэтому ячейки одной строки сетки подряд лежат одним отрезком
+        order: np.ndarray = np.argsort(cells, kind='stable')
+        self.rows: np.ndarray = order
+        self.lat: np.ndarray = np.radians(lat[order])
+        self.lon: np.ndarray = np.radians(lon[order])
+        self.cos_lat: np.ndarray = np.cos(self.lat)
+        # starts[c]..starts[c + 1] - отрезок городов ячейки c
+        self.starts: np.ndarray = np.searchsorted(cells[order], np.arange(self.rows_count * self.cols_count + 1))
+
+    def _cell_row(self, lat: np.ndarray) -> np.ndarray:
+        return np.clip(((lat + 90) // self.cell_degrees).astype(np.int64), 0, self.rows_count - 1)
+
+    def _cell_col(self, lon: np.ndarray) -> np.ndarray:
+        return (((lon + 180) % 360) // self.cell_degrees).astype(np.int64) % self.cols_count
+
+    def candidates(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """Позиции городов из ячеек, пересекающих прямоугольник вокруг круга поиска."""
+        dlat: float = radius_km / KM_PER_DEGREE
+        lat_low, lat_high = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+        row_low, row_high = (int(row) for row in self._cell_row(np.array([lat_low, lat_high])))
+        # Ширина круга по долготе растет к полюсам; у полюса берем всю строку сетки
+        widest: float = math.cos(math.radians(max(abs(lat_low), abs(lat_high))))
+        dlon: float = dlat / widest if widest > 1e-9 else 360.0
+        if dlon >= 180:
+            col_ranges: List[Tuple[int, int]] = [(0, self.cols_count - 1)]
+        else:
+            col_low, col_high = (int(col) for col in self._cell_col(np.array([lon - dlon, lon + dlon])))
+            # Прямоугольник может переходить через 180-й меридиан
+            col_ranges = [(col_low, col_high)] if col_low <= col_high else [(col_low, self.cols_count - 1),
+                                                                            (0, col_high)]
+        slices: List[np.ndarray] = []
+        for row in range(row_low, row_high + 1):
+            for col_low, col_high in col_ranges:
+                first: int = self.starts[row * self.cols_count + col_low]
+                end: int = self.starts[row * self.cols_count + col_high + 1]
+                if end > first:
+                    slices.append(np.arange(first, end))
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+    def distances(self, positions: np.ndarray, lat: float, lon: float) -> np.ndarray:
+        """Расстояния в километрах от точки до городов на позициях positions (гаверсинусы)."""
+        phi: float = math.radians(lat)
+        half_dphi: np.ndarray = (self.lat[positions] - phi) / 2
+        half_dlambda: np.ndarray = (self.lon[positions] - math.radians(lon)) / 2
+        a: np.ndarray = np.sin(half_dphi) ** 2 + math.cos(phi) * self.cos_lat[positions] * np.sin(half_dlambda) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class SpatialIndex:
+    """Пространственный индекс городов справочника по координатам.
+
+    Города разложены по ячейкам сетки `cell_degrees` x `cell_degrees` градусов. Запрос
+    "все города в радиусе" перебирает только ячейки, пересекающие описанный вокруг круга
+    прямоугольник, и считает расстояния по формуле гаверсинусов сразу для всех их городов
+    средствами NumPy. Поиск ближайших городов расширяет радиус, пока не найдет нужное число.
+    """
+
+    def __init__(self, source: Gazetteer = gazetteer, cell_degrees: float = 1.0) -> None:
+        """
+        Args:
+            source (Gazetteer): Справочник городов, по которому строится индекс.
+            cell_degrees (float): Размер ячейки сетки в градусах.
+        """
+        self.source: Gazetteer = source
+        self.cell_degrees: float = cell_degrees
+        self._lock: threading.Lock = threading.Lock()
+        self._grid: Optional[_Grid] = None
+        self._version: int = -1
+
+    def within(self, lat: float, lon: float, radius_km: float, limit: Optional[int] = None) -> List[CityRecord]:
+        """Города в пределах радиуса от точки.
+
+        Args:
+            lat (float): Широта точки.
+            lon (float): Долгота точки.
+            radius_km (float): Радиус поиска в километрах.
+            limit (Optional[int]): Сколько ближайших городов вернуть; None - все.
+
+        Returns:
+            List[CityRecord]: Города по возрастанию расстояния.
+        """
+        return [city for _, city in self.within_distances(lat, lon, radius_km, limit)]
+
+    def within_distances(self, lat: float, lon: float, radius_km: float,
+                         limit: Optional[int] = None) -> List[Tuple[float, CityRecord]]:
+        """То же, что within, но вместе с расстоянием до каждого города в километрах."""
+        grid: _Grid = self._get_grid()
+        positions: np.ndarray = grid.candidates(lat, lon, radius_km)
+        distances: np.ndarray = grid.distances(positions, lat, lon)
+        inside: np.ndarray = distances <= radius_km
+        positions, distances = positions[inside], distances[inside]
+        rows: np.ndarray = grid.rows[positions]
+        # У нескольких городов справочника одинаковые координаты: при равных расстояниях порядок по номеру записи
+        order: np.ndarray = np.lexsort((rows, distances))[:limit]
+        return [(float(distances[i]), self.source.record(int(rows[i]))) for i in order]
+
+    def nearest(self, lat: float, lon: float, k: int = 1,
+                max_distance_km: float = MAX_DISTANCE_KM) -> List[CityRecord]:
+        """Ближайшие к точке города.
+
+        Args:
+            lat (float): Широта точки.
+            lon (float): Долгота точки.
+            k (int): Сколько городов вернуть.
+            max_distance_km (float): Дальше этого расстояния города не ищутся.
+
+        Returns:
+            List[CityRecord]: До k городов по возрастанию расстояния.
+        """
+        radius: float = min(self.cell_degrees * KM_PER_DEGREE, max_distance_km)
+        while True:
+            found: List[CityRecord] = self.within(lat, lon, radius, limit=k)
+            # В круге радиуса radius найдены все города, поэтому k ближайших в нем - ближайшие вообще
+            if len(found) >= k or radius >= max_distance_km:
+                return found
+            radius = min(radius * 2, max_distance_km)
+
+    def _get_grid(self) -> _Grid:
+        grid: Optional[_Grid] = self._grid
+        if grid is None or self._version != self.source.version:
+            with self._lock:
+                # len() заодно загружает справочник, если он еще не загружен
+                len(self.source)
+                if self._grid is None or self._version != self.source.version:
+                    self._version = self.source.version
+                    self._grid = _Grid(self.source, self.cell_degrees)
+                grid = self._grid
+        return grid
+
+
+# Общий пространственный индекс для всех обработчиков
+spatial_index: SpatialIndex = SpatialIndex()
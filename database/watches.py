@@ -0,0 +1,98 @@
+import datetime
+from typing import List, Tuple, Union
+
+import peewee as pw
+
+from config_data import config
+from database.history import ensure_schema
+from database.models import Watch, history_db
+
+# Направление подписки: код города отправления, код города прибытия, месяц YYYY-MM
+Route = Tuple[str, str, str]
+
+
+def add_watch(user_id: Union[str, int], chat_id: int, route: Route, threshold: int) -> bool:
+    """Подписывает пользователя на снижение цены по направлению.
+
+    Повторная подписка на то же направление заменяет порог, и уведомление придет снова.
+
+    Args:
+        user_id (Union[str, int]): Идентификатор пользователя.
+        chat_id (int): Чат, в который отправлять уведомления.
+        route (Route): Направление и месяц.
+        threshold (int): Уведомить, когда самая низкая цена станет ниже этого значения.
+
+    Returns:
+        bool: False, если у пользователя уже WATCH_MAX_PER_USER подписок на другие направления.
+    """
+    ensure_schema()
+    user_id = str(user_id)
+    origin, destination, month = route
+    with history_db.atomic('IMMEDIATE'):
+        existing: pw.SelectQuery = Watch.select().where(Watch.user_id == user_id)
+        if (existing.count() >= config.WATCH_MAX_PER_USER
+                and not existing.where(Watch.origin == origin, Watch.destination == destination,
+                                       Watch.month == month).exists()):
+            return False
+        Watch.insert(user_id=user_id, chat_id=chat_id, origin=origin, destination=destination, month=month,
+                     threshold=threshold).on_conflict(
+            conflict_target=[Watch.user_id, Watch.origin, Watch.destination, Watch.month],
+            update={Watch.chat_id: chat_id, Watch.threshold: threshold, Watch.notified_price: None}).execute()
+    return True
+
+
+def remove_watches(user_id: Union[str, int]) -> List[Watch]:
+    """Удаляет все подписки пользователя.
+
+    Args:
+        user_id (Union[str, int]): Идентификатор пользователя.
+
+    Returns:
+        List[Watch]: Удаленные подписки.
+    """
+    ensure_schema()
+    with history_db.atomic('IMMEDIATE'):
+        watches: List[Watch] = list(Watch.select().where(Watch.user_id == str(user_id)).order_by(Watch.id))
+        Watch.delete().where(Watch.user_id == str(user_id)).execute()
+    return watches
+
+
+def watched_routes() -> List[Route]:
+    """Направления, на которые есть хотя бы одна подписка; каждое один раз.
+
+    Подписки на прошедшие месяцы при этом удаляются.
+
+    Returns:
+        List[Route]: Направления и месяцы.
+    """
+    ensure_schema()
+    Watch.delete().where(Watch.month < datetime.date.today().strftime('%Y-%m')).execute()
+    query: pw.SelectQuery = Watch.select(Watch.origin, Watch.destination, Watch.month).distinct().tuples()
+    return [tuple(row) for row in query]
+
+
+def watches_below(route: Route, price: int) -> List[Watch]:
+    """Подписки, которые нужно уведомить о цене `price`, с отметкой об уведомлении.
+
+    Уведомляются подписки с порогом выше цены, если о такой или более низкой цене
+    им еще не сообщали. У подписок, чей порог цена уже не проходит, отметка сбрасывается.
+
+    Args:
+        route (Route): Направление и месяц.
+        price (int): Самая низкая цена по направлению.
+
+    Returns:
+        List[Watch]: Подписки для уведомления.
+    """
+    ensure_schema()
+    origin, destination, month = route
+    same_route: pw.Expression = (Watch.origin == origin) & (Watch.destination == destination) & (Watch.month == month)
+    with history_db.atomic('IMMEDIATE'):
+        watches: List[Watch] = list(Watch.select().where(
+            same_route, Watch.threshold > price,
+            Watch.notified_price.is_null() | (Watch.notified_price > price)))
+        if watches:
+            Watch.update(notified_price=price).where(Watch.id.in_([watch.id for watch in watches])).execute()
+        Watch.update(notified_price=None).where(same_route, Watch.threshold <= price,
+                                                Watch.notified_price.is_null(False)).execute()
+    return watches
@@ -0,0 +1,9 @@
+from . import start
+from . import help
+from . import flights
+from . import anywhere
+from . import watch
+from . import flight_pages
+from . import weather
+from . import history
+from . import profile
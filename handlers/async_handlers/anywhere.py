@@ -0,0 +1,132 @@
+from typing import Dict, List, Optional
+
+from telebot import types, util
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_handler_backends import State, StatesGroup
+
+from config_data import config
+from database.history import add_to_history
+from utils.async_http import search_anywhere_async
+from utils.aviasales import AviasalesError, anywhere_requests
+from utils.conversation import Step, next_step, parse_answers
+from utils.dispatcher import PRIORITY_BULK
+from utils.flight_pages import first_page
+from utils.keyboards import location_markup
+from utils.flight_steps import ANYWHERE_STEPS, split_anywhere_arguments
+from utils.metrics import record_error
+
+
+class AnywhereStates(StatesGroup):
+    """Шаги диалога поиска /anywhere."""
+    origins = State()
+    destinations = State()
+    month = State()
+
+
+def registrate(bot: AsyncTeleBot) -> None:
+    """Регистрация обработчиков команды /anywhere для асинхронного бота.
+
+    Шаги и их проверки общие с синхронным ботом (utils.flight_steps.ANYWHERE_STEPS),
+    текущий шаг хранится в хранилище состояний бота.
+
+    Args:
+        bot (AsyncTeleBot): Объект бота.
+    """
+    steps_by_state: Dict[str, Step] = {getattr(AnywhereStates, step.key).name: step for step in ANYWHERE_STEPS}
+
+    @bot.message_handler(commands=['anywhere'])
+    async def start(message: types.Message) -> None:
+        """Обработчик команды /anywhere.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        add_to_history(message.from_user.id, message.text)
+        arguments: str = util.extract_arguments(message.text)
+        answers, rejected = parse_answers(ANYWHERE_STEPS, split_anywhere_arguments(arguments) if arguments else {})
+        await bot.set_state(message.from_user.id, AnywhereStates.origins, message.chat.id)
+        async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+            data.clear()
+            data.update(answers)
+        await ask_next(message, rejected)
+
+    @bot.message_handler(state=[AnywhereStates.origins, AnywhereStates.destinations, AnywhereStates.month],
+                         content_types=['text', 'location'])
+    async def process_step(message: types.Message) -> None:
+        """Обработка ответа на текущий шаг диалога: текста или геопозиции.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        step: Step = steps_by_state[await bot.get_state(message.from_user.id, message.chat.id)]
+        if message.location is not None:
+            value: Optional[str] = (step.locate(message.location.latitude, message.location.longitude)
+                                    if step.locate else None)
+        else:
+            value = step.parse(message.text)
+        if value is None:
+            await bot.send_message(message.chat.id, step.error)
+            return
+
+        async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+            data[step.key] = value
+        await ask_next(message)
+
+    async def ask_next(message: types.Message, rejected: Optional[Dict[str, str]] = None) -> None:
+        """Задает вопрос первого шага без ответа или переходит к поиску, если ответы собраны.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+            rejected (Optional[Dict[str, str]]): Не подошедшие аргументы команды по ключам шагов.
+        """
+        async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+            index: Optional[int] = next_step(ANYWHERE_STEPS, data)
+        if index is None:
+            await final(message)
+            return
+
+        step: Step = ANYWHERE_STEPS[index]
+        await bot.set_state(message.from_user.id, getattr(AnywhereStates, step.key), message.chat.id)
+        if rejected and step.key in rejected:
+            await bot.send_message(message.chat.id, step.error)
+        else:
+            await bot.send_message(message.chat.id, step.prompt, reply_markup=location_markup() if step.locate else None)
+
+    async def final(message: types.Message) -> None:
+        """Поиск самых дешевых рейсов между всеми городами отправления и прибытия.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+            request: dict = dict(data)
+        await bot.delete_state(message.from_user.id, message.chat.id)
+
+        try:
+            origins: List[str] = request['origins'].split(',')
+            destinations: List[str] = request['destinations'].split(',')
+            requests_count: int = len(anywhere_requests(origins, destinations, request['month']))
+            if not requests_count:
+                await bot.send_message(message.chat.id, 'Города отправления и прибытия совпадают')
+                return
+            if requests_count > config.ANYWHERE_MAX_REQUESTS:
+                await bot.send_message(message.chat.id, f'Слишком много направлений: {requests_count} запросов при '
+                                                        f'допустимых {config.ANYWHERE_MAX_REQUESTS}. Уменьшите радиус, '
+                                                        f'количество городов или месяцев.')
+                return
+
+            try:
+                flights: List[dict] = await search_anywhere_async(origins, destinations, request['month'],
+                                                                  config.ANYWHERE_TOP)
+            except AviasalesError as e:
+                await bot.send_message(message.chat.id, f'Ошибка при выполнении запроса: {e.status_code}')
+                return
+
+            if not flights:
+                await bot.send_message(message.chat.id, 'По вашему запросу нет доступных рейсов')
+                return
+            text, markup = first_page(flights, None, None)
+            await bot.send_message(message.chat.id, text, reply_markup=markup, priority=PRIORITY_BULK)
+        except Exception as e:
+            record_error(e)
+            await bot.reply_to(message, 'Что-то пошло не так, прошу повторите запрос')
@@ -0,0 +1,34 @@
+from typing import Optional, Tuple
+
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+
+from utils.flight_pages import NOOP_CALLBACK, get_page, is_page_callback
+
+
+def registrate(bot: AsyncTeleBot) -> None:
+    """Регистрация обработчика кнопок листания результатов поиска рейсов для асинхронного бота.
+
+    Args:
+        bot (AsyncTeleBot): Объект бота.
+    """
+
+    @bot.callback_query_handler(func=is_page_callback)
+    async def show_page(call: types.CallbackQuery) -> None:
+        """Заменяет текст сообщения с результатами на выбранную страницу.
+
+        Args:
+            call (types.CallbackQuery): Callback-запрос от кнопки.
+        """
+        if call.data == NOOP_CALLBACK:
+            await bot.answer_callback_query(call.id)
+            return
+
+        page: Optional[Tuple[str, Optional[types.InlineKeyboardMarkup]]] = get_page(call.data)
+        if page is None:
+            await bot.answer_callback_query(call.id, 'Результаты поиска устарели, повторите запрос')
+            return
+
+        text, markup = page
+        await bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
+        await bot.answer_callback_query(call.id)
@@ -0,0 +1,202 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from telebot import types, util
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_handler_backends import State, StatesGroup
+
+from database.gazetteer import CityRecord, gazetteer
+from database.history import add_to_history
+from handlers.custom_handlers.trend import trend_text
+from utils.async_http import get_prices_for_months_async
+from utils.aviasales import AviasalesError
+from utils.conversation import Step, next_step, parse_answers
+from utils.dispatcher import PRIORITY_BULK
+from utils.flight_pages import first_page
+from utils.flight_steps import CUSTOM_STEPS, FLIGHT_STEPS, MONTH_STEP, split_flight_arguments
+from utils.keyboards import city_suggestions_markup, location_markup
+from utils.locations import city_from_message
+from utils.metrics import record_error
+from utils.validators import validate_month_range, validate_price_range
+
+
+class FlightStates(StatesGroup):
+    """Шаги диалога поиска рейсов."""
+    origin = State()
+    destination = State()
+    month = State()
+    prices = State()
+
+
+def flight_steps(command: str) -> Tuple[Step, ...]:
+    """Шаги диалога команды: у /custom есть еще шаг диапазона цен."""
+    return CUSTOM_STEPS if command == 'custom' else FLIGHT_STEPS
+
+
+def registrate(bot: AsyncTeleBot) -> None:
+    """Регистрация обработчиков команд /low, /high, /custom и /trend для асинхронного бота.
+
+    Все команды проходят одни и те же шаги (у /custom есть еще шаг диапазона цен),
+    а различаются только обработкой полученных рейсов; /trend отвечает по сохраненным ценам.
+    Состояние диалога хранится в хранилище состояний бота: введенные города сохраняются IATA-кодами.
+
+    Args:
+        bot (AsyncTeleBot): Объект бота.
+    """
+
+    @bot.message_handler(commands=['low', 'high', 'custom', 'trend'])
+    async def start(message: types.Message) -> None:
+        """Обработчик команд /low, /high, /custom и /trend.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        add_to_history(message.from_user.id, message.text)
+        command: str = util.extract_command(message.text)
+        # Аргументы после команды (`/low Москва Сочи 2024-02`) заменяют ответы на шаги диалога
+        arguments: str = util.extract_arguments(message.text)
+        answers, rejected = parse_answers(flight_steps(command),
+                                          split_flight_arguments(arguments) if arguments else {})
+        await bot.set_state(message.from_user.id, FlightStates.origin, message.chat.id)
+        async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+            data.clear()
+            data.update(answers, command=command)
+        await ask_next(message, rejected)
+
+    @bot.message_handler(state=FlightStates.origin, content_types=['text', 'location'])
+    async def process_origin(message: types.Message) -> None:
+        """Обработка ввода города отправления или геопозиции.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        departure_city: Optional[CityRecord] = city_from_message(message)
+        if not departure_city:
+            await bot.send_message(message.chat.id, 'Город не найден в базе данных, либо город введен не корректно. '
+                                                    'Пожалуйста, введите город отправления.',
+                                   reply_markup=city_suggestions_markup(message.text))
+            return
+
+        async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+            data['origin'] = departure_city.code
+        await ask_next(message)
+
+    @bot.message_handler(state=FlightStates.destination, content_types=['text', 'location'])
+    async def process_destination(message: types.Message) -> None:
+        """Обработка ввода города прибытия или геопозиции.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        arrival_city: Optional[CityRecord] = city_from_message(message)
+        if not arrival_city:
+            await bot.send_message(message.chat.id, 'Город не найден в базе данных, либо город введен не корректно. '
+                                                    'Пожалуйста, введите город прибытия.',
+                                   reply_markup=city_suggestions_markup(message.text))
+            return
+
+        async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+            data['destination'] = arrival_city.code
+        await ask_next(message)
+
+    @bot.message_handler(state=FlightStates.month)
+    async def process_month(message: types.Message) -> None:
+        """Обработка ввода месяца отправления.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        if not validate_month_range(message.text):
+            await bot.send_message(message.chat.id, MONTH_STEP.error)
+            return
+
+        async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+            data['month'] = message.text
+        await ask_next(message)
+
+    @bot.message_handler(state=FlightStates.prices)
+    async def process_prices(message: types.Message) -> None:
+        """Обработка ввода диапазона цен для /custom.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        if not validate_price_range(message.text):
+            await bot.send_message(message.chat.id, 'Некорректный формат диапазона цен. Пожалуйста, введите в формате '
+                                                    'нижняя_граница-верхняя_граница (например, 5000-10000).')
+            return
+
+        async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+            data['prices'] = message.text
+        await ask_next(message)
+
+    async def ask_next(message: types.Message, rejected: Optional[Dict[str, str]] = None) -> None:
+        """Задает вопрос первого шага без ответа или переходит к поиску, если ответы собраны.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+            rejected (Optional[Dict[str, str]]): Не подошедшие аргументы команды по ключам шагов.
+        """
+        async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+            steps: Tuple[Step, ...] = flight_steps(data['command'])
+            index: Optional[int] = next_step(steps, data)
+        if index is None:
+            await final(message)
+            return
+
+        step: Step = steps[index]
+        await bot.set_state(message.from_user.id, getattr(FlightStates, step.key), message.chat.id)
+        if rejected and step.key in rejected:
+            markup: Optional[types.ReplyKeyboardMarkup] = (step.suggestions(rejected[step.key])
+                                                           if step.suggestions else None)
+            await bot.send_message(message.chat.id, step.error, reply_markup=markup)
+        else:
+            await bot.send_message(message.chat.id, step.prompt, reply_markup=location_markup() if step.locate else None)
+
+    async def final(message: types.Message) -> None:
+        """Финальный этап запроса - обработка данных и отправка результатов.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+            request: dict = dict(data)
+        await bot.delete_state(message.from_user.id, message.chat.id)
+
+        try:
+            origin_city: CityRecord = gazetteer.get_by_code(request['origin'])
+            destination_city: CityRecord = gazetteer.get_by_code(request['destination'])
+            if request['command'] == 'trend':
+                # Статистика по уже сохраненным ценам, без запроса к API. Файл цен читается в потоке:
+                # на время сжатия он заблокирован
+                text: str = await asyncio.to_thread(trend_text, origin_city, destination_city, request['month'])
+                await bot.send_message(message.chat.id, text)
+                return
+            # /high - по убыванию даты вылета, остальные - по возрастанию цены
+            high: bool = request['command'] == 'high'
+            try:
+                flights: List[dict] = list(await get_prices_for_months_async(
+                    origin_city.code, destination_city.code, request['month'],
+                    key='departure_at' if high else 'price', reverse=high))
+            except AviasalesError as e:
+                await bot.send_message(message.chat.id, f'Ошибка при выполнении запроса: {e.status_code}')
+                return
+
+            if not flights:
+                await bot.send_message(message.chat.id, 'По вашему запросу нет доступных рейсов')
+                return
+
+            if request['command'] == 'custom':
+                # Фильтруем данные по диапазону цен
+                min_price, max_price = (int(price) for price in request['prices'].split('-'))
+                flights = [flight for flight in flights if min_price <= flight['price'] <= max_price]
+                if not flights:
+                    await bot.send_message(message.chat.id,
+                                           'По вашему запросу нет доступных рейсов в указанном диапазоне цен')
+                    return
+
+            text, markup = first_page(flights, origin_city.ru, destination_city.ru)
+            await bot.send_message(message.chat.id, text, reply_markup=markup, priority=PRIORITY_BULK)
+        except Exception as e:
+            record_error(e)
+            await bot.reply_to(message, 'Что-то пошло не так, прошу повторите запрос')
@@ -0,0 +1,31 @@
+import asyncio
+from typing import List
+
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+
+from database.history import add_to_history, get_user_history
+from utils.dispatcher import PRIORITY_BULK
+
+
+def registrate(bot: AsyncTeleBot) -> None:
+    """Регистрация обработчиков команд для асинхронного бота.
+
+    Args:
+        bot (AsyncTeleBot): Объект бота.
+    """
+
+    @bot.message_handler(commands=['history'])
+    async def start(message: types.Message) -> None:
+        """Обработчик команды /history. Выводит историю команд пользователя.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        add_to_history(message.from_user.id, message.text)
+        commands: List[str] = await asyncio.to_thread(get_user_history, message.from_user.id)
+        if commands:
+            commands_list: str = "\n".join(commands)
+            await bot.reply_to(message, f"Ваша история команд:\n{commands_list}", priority=PRIORITY_BULK)
+        else:
+            await bot.reply_to(message, "У вас нет сохраненных команд в истории.")
@@ -0,0 +1,31 @@
+import io
+from typing import List, Tuple
+
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+from telebot.util import extract_arguments
+
+from config_data import config
+from utils.profiler import profile_command
+
+
+def registrate(bot: AsyncTeleBot) -> None:
+    """Регистрация служебной команды профилирования для асинхронного бота.
+
+    Args:
+        bot (AsyncTeleBot): Объект бота.
+    """
+
+    @bot.message_handler(commands=['profile'], func=lambda message: message.from_user.id in config.ADMIN_IDS)
+    async def profile(message: types.Message) -> None:
+        """Обработчик команды /profile для администраторов из ADMIN_IDS: включает и выключает
+        профилирование, показывает медленные трассы и присылает выгрузку стеков файлами.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        files: List[Tuple[str, bytes]]
+        text, files = profile_command(extract_arguments(message.text))
+        await bot.reply_to(message, text)
+        for name, data in files:
+            await bot.send_document(message.chat.id, io.BytesIO(data), visible_file_name=name)
@@ -0,0 +1,23 @@
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+
+from database.history import add_to_history
+from handlers.default_handlers.start import START_TEXT
+
+
+def registrate(bot: AsyncTeleBot) -> None:
+    """Регистрация обработчиков команд для асинхронного бота.
+
+    Args:
+        bot (AsyncTeleBot): Объект бота.
+    """
+
+    @bot.message_handler(commands=['start'])
+    async def start(message: types.Message) -> None:
+        """Обработчик команды /start.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        add_to_history(message.from_user.id, message.text)
+        await bot.send_message(message.chat.id, text=START_TEXT.format(message.from_user.first_name))
@@ -0,0 +1,126 @@
+import asyncio
+from typing import Dict, List, Optional
+
+from telebot import types, util
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_handler_backends import State, StatesGroup
+
+from database.history import add_to_history
+from database.watches import Watch, add_watch, remove_watches
+from handlers.custom_handlers.watch import WATCH_LIMIT_TEXT, watch_added_text, watches_removed_text
+from utils.conversation import Step, next_step, parse_answers
+from utils.flight_steps import WATCH_STEPS, split_watch_arguments
+from utils.keyboards import location_markup
+from utils.metrics import record_error
+
+
+class WatchStates(StatesGroup):
+    """Шаги диалога подписки /watch."""
+    origin = State()
+    destination = State()
+    month = State()
+    threshold = State()
+
+
+def registrate(bot: AsyncTeleBot) -> None:
+    """Регистрация обработчиков команд /watch и /unwatch для асинхронного бота.
+
+    Шаги и их проверки общие с синхронным ботом (utils.flight_steps.WATCH_STEPS),
+    текущий шаг хранится в хранилище состояний бота.
+
+    Args:
+        bot (AsyncTeleBot): Объект бота.
+    """
+    steps_by_state: Dict[str, Step] = {getattr(WatchStates, step.key).name: step for step in WATCH_STEPS}
+
+    @bot.message_handler(commands=['watch'])
+    async def start(message: types.Message) -> None:
+        """Обработчик команды /watch.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        add_to_history(message.from_user.id, message.text)
+        arguments: str = util.extract_arguments(message.text)
+        answers, rejected = parse_answers(WATCH_STEPS, split_watch_arguments(arguments) if arguments else {})
+        await bot.set_state(message.from_user.id, WatchStates.origin, message.chat.id)
+        async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+            data.clear()
+            data.update(answers)
+        await ask_next(message, rejected)
+
+    # Регистрируется раньше обработчика шагов, чтобы /unwatch работал и посреди диалога
+    @bot.message_handler(commands=['unwatch'])
+    async def unwatch(message: types.Message) -> None:
+        """Обработчик команды /unwatch: отменяет все подписки пользователя.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        add_to_history(message.from_user.id, message.text)
+        watches: List[Watch] = await asyncio.to_thread(remove_watches, message.from_user.id)
+        await bot.send_message(message.chat.id, watches_removed_text(watches))
+
+    @bot.message_handler(state=[WatchStates.origin, WatchStates.destination, WatchStates.month,
+                                WatchStates.threshold], content_types=['text', 'location'])
+    async def process_step(message: types.Message) -> None:
+        """Обработка ответа на текущий шаг диалога: текста или геопозиции.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        step: Step = steps_by_state[await bot.get_state(message.from_user.id, message.chat.id)]
+        if message.location is not None:
+            value: Optional[str] = (step.locate(message.location.latitude, message.location.longitude)
+                                    if step.locate else None)
+        else:
+            value = step.parse(message.text)
+        if value is None:
+            await bot.send_message(message.chat.id, step.error,
+                                   reply_markup=step.suggestions(message.text) if step.suggestions else None)
+            return
+
+        async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+            data[step.key] = value
+        await ask_next(message)
+
+    async def ask_next(message: types.Message, rejected: Optional[Dict[str, str]] = None) -> None:
+        """Задает вопрос первого шага без ответа или сохраняет подписку, если ответы собраны.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+            rejected (Optional[Dict[str, str]]): Не подошедшие аргументы команды по ключам шагов.
+        """
+        async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+            index: Optional[int] = next_step(WATCH_STEPS, data)
+        if index is None:
+            await final(message)
+            return
+
+        step: Step = WATCH_STEPS[index]
+        await bot.set_state(message.from_user.id, getattr(WatchStates, step.key), message.chat.id)
+        if rejected and step.key in rejected:
+            await bot.send_message(message.chat.id, step.error,
+                                   reply_markup=step.suggestions(rejected[step.key]) if step.suggestions else None)
+        else:
+            await bot.send_message(message.chat.id, step.prompt, reply_markup=location_markup() if step.locate else None)
+
+    async def final(message: types.Message) -> None:
+        """Сохранение подписки.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+            request: dict = dict(data)
+        await bot.delete_state(message.from_user.id, message.chat.id)
+
+        try:
+            # Запись в SQLite не должна останавливать цикл событий
+            added: bool = await asyncio.to_thread(
+                add_watch, message.from_user.id, message.chat.id,
+                (request['origin'], request['destination'], request['month']), int(request['threshold']))
+            await bot.send_message(message.chat.id, watch_added_text(request) if added else WATCH_LIMIT_TEXT)
+        except Exception as e:
+            record_error(e)
+            await bot.reply_to(message, 'Что-то пошло не так, прошу повторите запрос')
@@ -0,0 +1,65 @@
+import asyncio
+from typing import Optional
+
+import aiohttp
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_handler_backends import State, StatesGroup
+
+from database.gazetteer import CityRecord
+from database.history import add_to_history
+from utils.async_http import get_daily_forecast_async
+from utils.dispatcher import PRIORITY_BULK
+from utils.http_client import CircuitOpenError
+from utils.keyboards import city_suggestions_markup, location_markup
+from utils.locations import city_from_message
+from utils.weather import format_forecast_day
+
+
+class WeatherStates(StatesGroup):
+    """Шаги диалога запроса погоды."""
+    city = State()
+
+
+def registrate(bot: AsyncTeleBot) -> None:
+    """Регистрация обработчика команды /weather для асинхронного бота.
+
+    Args:
+        bot (AsyncTeleBot): Объект бота.
+    """
+
+    @bot.message_handler(commands=['weather'])
+    async def start(message: types.Message) -> None:
+        """Обработчик команды /weather.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        add_to_history(message.from_user.id, message.text)
+        await bot.set_state(message.from_user.id, WeatherStates.city, message.chat.id)
+        await bot.send_message(message.chat.id,
+                               'Введите название города на русском языке, в котором необходимо узнать погоду, '
+                               'или отправьте геопозицию', reply_markup=location_markup())
+
+    @bot.message_handler(state=WeatherStates.city, content_types=['text', 'location'])
+    async def final(message: types.Message) -> None:
+        """Запрос прогноза для введенного города и отправка результата.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        # Город по названию или ближайший к отправленной геопозиции
+        data: Optional[CityRecord] = city_from_message(message)
+        if not data:
+            await bot.send_message(message.chat.id, 'Город не найден в базе данных, либо введен некорректно. '
+                                                    'Пожалуйста, повторите ввод города.',
+                                   reply_markup=city_suggestions_markup(message.text))
+            return
+
+        await bot.delete_state(message.from_user.id, message.chat.id)
+        try:
+            final_data: dict = await get_daily_forecast_async(data.lat, data.lon)
+            for day_data in final_data['daily']['data']:
+                await bot.send_message(message.chat.id, format_forecast_day(data.ru, day_data), priority=PRIORITY_BULK)
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError) as e:
+            await bot.send_message(message.chat.id, f'Произошла ошибка при запросе погоды: {str(e)}')
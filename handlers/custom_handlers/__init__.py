@@ -2,4 +2,9 @@ from . import weather
 from . import high
 from . import low
 from . import history
-from . import custom
\ No newline at end of file
+from . import custom
+from . import anywhere
+from . import watch
+from . import trend
+from . import flight_pages
+from . import profile
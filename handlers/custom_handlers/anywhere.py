@@ -0,0 +1,71 @@
+from typing import Dict, List
+
+from telebot import TeleBot, types
+
+from config_data import config
+from database.history import add_to_history
+from utils.aviasales import AviasalesError, anywhere_requests, search_anywhere
+from utils.conversation import ConversationMachine, Flow, get_conversations
+from utils.dispatcher import PRIORITY_BULK
+from utils.flight_pages import first_page
+from utils.flight_steps import ANYWHERE_STEPS, split_anywhere_arguments
+from utils.metrics import record_error
+
+
+def registrate(bot: TeleBot) -> None:
+    """Регистрация обработчиков команды /anywhere.
+
+    Args:
+        bot (TeleBot): Объект бота.
+    """
+    conversations: ConversationMachine = get_conversations(bot)
+
+    @bot.message_handler(commands=['anywhere'])
+    def start(message: types.Message) -> None:
+        """Обработчик команды /anywhere.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        user_id: str = str(message.from_user.id)
+        command: str = message.text
+        add_to_history(user_id, command)
+        conversations.start(message, 'anywhere')
+
+    def finish(message: types.Message, data: Dict[str, str]) -> None:
+        """Поиск самых дешевых рейсов между всеми городами отправления и прибытия.
+
+        Args:
+            message (types.Message): Последнее сообщение пользователя.
+            data (Dict[str, str]): Коды городов отправления и прибытия через запятую и месяц.
+        """
+        try:
+            origins: List[str] = data['origins'].split(',')
+            destinations: List[str] = data['destinations'].split(',')
+            requests_count: int = len(anywhere_requests(origins, destinations, data['month']))
+            if not requests_count:
+                bot.send_message(message.chat.id, 'Города отправления и прибытия совпадают')
+                return
+            if requests_count > config.ANYWHERE_MAX_REQUESTS:
+                bot.send_message(message.chat.id, f'Слишком много направлений: {requests_count} запросов при '
+                                                  f'допустимых {config.ANYWHERE_MAX_REQUESTS}. Уменьшите радиус, '
+                                                  f'количество городов или месяцев.')
+                return
+
+            try:
+                flights: List[dict] = search_anywhere(origins, destinations, data['month'], config.ANYWHERE_TOP)
+            except AviasalesError as e:
+                bot.send_message(message.chat.id, f'Ошибка при выполнении запроса: {e.status_code}')
+                return
+
+            if not flights:
+                bot.send_message(message.chat.id, 'По вашему запросу нет доступных рейсов')
+                return
+            # Города у рейсов разные, поэтому названия берутся из кодов направления каждого рейса
+            text, markup = first_page(flights, None, None)
+            bot.send_message(message.chat.id, text, reply_markup=markup, priority=PRIORITY_BULK)
+        except Exception as e:
+            record_error(e)
+            bot.reply_to(message, 'Что-то пошло не так, прошу повторите запрос')
+
+    conversations.add_flow(Flow('anywhere', ANYWHERE_STEPS, finish, split_anywhere_arguments))
@@ -0,0 +1,33 @@
+from typing import Optional, Tuple
+
+from telebot import TeleBot, types
+
+from utils.flight_pages import NOOP_CALLBACK, get_page, is_page_callback
+
+
+def registrate(bot: TeleBot) -> None:
+    """Регистрация обработчика кнопок листания результатов поиска рейсов.
+
+    Args:
+        bot (TeleBot): Объект бота.
+    """
+
+    @bot.callback_query_handler(func=is_page_callback)
+    def show_page(call: types.CallbackQuery) -> None:
+        """Заменяет текст сообщения с результатами на выбранную страницу.
+
+        Args:
+            call (types.CallbackQuery): Callback-запрос от кнопки.
+        """
+        if call.data == NOOP_CALLBACK:
+            bot.answer_callback_query(call.id)
+            return
+
+        page: Optional[Tuple[str, Optional[types.InlineKeyboardMarkup]]] = get_page(call.data)
+        if page is None:
+            bot.answer_callback_query(call.id, 'Результаты поиска устарели, повторите запрос')
+            return
+
+        text, markup = page
+        bot.edit_message_text(text, call.message.chat.id, call.message.message_id, reply_markup=markup)
+        bot.answer_callback_query(call.id)
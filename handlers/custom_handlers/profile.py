@@ -0,0 +1,28 @@
+import io
+
+from telebot.util import extract_arguments
+
+from config_data import config
+from utils.profiler import profile_command
+
+
+def registrate(bot):
+    """
+    Функция-регистратор служебной команды профилирования для бота.
+
+    Args:
+        bot: Экземпляр бота для регистрации команд.
+    """
+    @bot.message_handler(commands=['profile'], func=lambda message: message.from_user.id in config.ADMIN_IDS)
+    def profile(message):
+        """
+        Обработчик команды '/profile' для администраторов из ADMIN_IDS: включает и выключает
+        профилирование, показывает медленные трассы и присылает выгрузку стеков файлами.
+
+        Args:
+            message: Объект сообщения от пользователя.
+        """
+        text, files = profile_command(extract_arguments(message.text))
+        bot.reply_to(message, text)
+        for name, data in files:
+            bot.send_document(message.chat.id, io.BytesIO(data), visible_file_name=name)
@@ -0,0 +1,76 @@
+from typing import Dict, List
+
+from telebot import TeleBot, types
+
+from config_data import config
+from database.gazetteer import CityRecord
+from database.history import add_to_history
+from database.price_store import TrendRow, price_store
+from utils.aviasales import search_months
+from utils.conversation import ConversationMachine, Flow, get_conversations
+from utils.flight_steps import FLIGHT_STEPS, flow_cities, split_flight_arguments
+from utils.metrics import record_error
+
+
+def trend_text(origin_city: CityRecord, destination_city: CityRecord, departure_at: str) -> str:
+    """Статистика сохраненных цен по направлению для ответа на /trend.
+
+    Считается только по ценам, которые бот уже получал при поиске, без запросов к API.
+
+    Args:
+        origin_city (CityRecord): Город отправления.
+        destination_city (CityRecord): Город прибытия.
+        departure_at (str): Месяц вылета или диапазон месяцев.
+
+    Returns:
+        str: Текст сообщения.
+    """
+    rows: List[TrendRow] = price_store.trend(origin_city.code, destination_city.code, search_months(departure_at))
+    if not rows:
+        return (f'По направлению {origin_city.ru} - {destination_city.ru} еще нет сохраненных цен. '
+                f'Выполните поиск /low, и бот начнет собирать статистику.')
+    lines: List[str] = [f'Цены {origin_city.ru} - {destination_city.ru} по сохраненным поискам:']
+    for row in rows:
+        lines.append(f'\n{row.month}: сохранено цен - {row.count}, '
+                     f'последняя проверка {row.updated_at:%Y-%m-%d %H:%M} UTC\n'
+                     f' - при последней проверке от {row.latest} ₽\n'
+                     f' - минимум {row.min} ₽, медиана {row.median} ₽, '
+                     f'{config.TREND_PERCENTILE:g}-й перцентиль {row.percentile} ₽')
+    return '\n'.join(lines)
+
+
+def registrate(bot: TeleBot) -> None:
+    """Регистрация обработчиков команды /trend.
+
+    Args:
+        bot (TeleBot): Объект бота.
+    """
+    conversations: ConversationMachine = get_conversations(bot)
+
+    @bot.message_handler(commands=['trend'])
+    def start(message: types.Message) -> None:
+        """Обработчик команды /trend.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        user_id: str = str(message.from_user.id)
+        command: str = message.text
+        add_to_history(user_id, command)
+        conversations.start(message, 'trend')
+
+    def finish(message: types.Message, data: Dict[str, str]) -> None:
+        """Отправка статистики цен: все ответы собраны.
+
+        Args:
+            message (types.Message): Последнее сообщение пользователя.
+            data (Dict[str, str]): Коды городов отправления и прибытия и месяц.
+        """
+        try:
+            origin_city, destination_city = flow_cities(data)
+            bot.send_message(message.chat.id, trend_text(origin_city, destination_city, data['month']))
+        except Exception as e:
+            record_error(e)
+            bot.reply_to(message, 'Что-то пошло не так, прошу повторите запрос')
+
+    conversations.add_flow(Flow('trend', FLIGHT_STEPS, finish, split_flight_arguments))
@@ -0,0 +1,95 @@
+from typing import Dict, List
+
+from telebot import TeleBot, types
+
+from config_data import config
+from database.history import add_to_history
+from database.watches import Watch, add_watch, remove_watches
+from utils.conversation import ConversationMachine, Flow, get_conversations
+from utils.flight_steps import WATCH_STEPS, flow_cities, split_watch_arguments
+from utils.metrics import record_error
+
+
+def watch_added_text(data: Dict[str, str]) -> str:
+    """Ответ на новую подписку /watch.
+
+    Args:
+        data (Dict[str, str]): Коды городов, месяц и порог цены.
+
+    Returns:
+        str: Текст сообщения.
+    """
+    origin_city, destination_city = flow_cities(data)
+    return (f'Готово! Сообщу, когда билет {origin_city.ru} - {destination_city.ru} в {data["month"]} '
+            f'станет дешевле {data["threshold"]} ₽. Отменить подписки: /unwatch')
+
+
+def watches_removed_text(watches: List[Watch]) -> str:
+    """Ответ на /unwatch.
+
+    Args:
+        watches (List[Watch]): Удаленные подписки.
+
+    Returns:
+        str: Текст сообщения.
+    """
+    if not watches:
+        return 'У вас нет подписок на цены.'
+    routes: str = '\n'.join(f'{watch.origin} - {watch.destination} {watch.month} дешевле {watch.threshold} ₽'
+                            for watch in watches)
+    return f'Подписки отменены:\n{routes}'
+
+
+# Ответ, когда у пользователя уже максимум подписок
+WATCH_LIMIT_TEXT: str = (f'У вас уже {config.WATCH_MAX_PER_USER} подписок. Отмените их командой /unwatch '
+                         f'и подпишитесь заново.')
+
+
+def registrate(bot: TeleBot) -> None:
+    """Регистрация обработчиков команд /watch и /unwatch.
+
+    Args:
+        bot (TeleBot): Объект бота.
+    """
+    conversations: ConversationMachine = get_conversations(bot)
+
+    @bot.message_handler(commands=['watch'])
+    def start(message: types.Message) -> None:
+        """Обработчик команды /watch.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        user_id: str = str(message.from_user.id)
+        command: str = message.text
+        add_to_history(user_id, command)
+        conversations.start(message, 'watch')
+
+    def finish(message: types.Message, data: Dict[str, str]) -> None:
+        """Сохранение подписки: все ответы собраны.
+
+        Args:
+            message (types.Message): Последнее сообщение пользователя.
+            data (Dict[str, str]): Коды городов отправления и прибытия, месяц и порог цены.
+        """
+        try:
+            if add_watch(message.from_user.id, message.chat.id, (data['origin'], data['destination'], data['month']),
+                         int(data['threshold'])):
+                bot.send_message(message.chat.id, watch_added_text(data))
+            else:
+                bot.send_message(message.chat.id, WATCH_LIMIT_TEXT)
+        except Exception as e:
+            record_error(e)
+            bot.reply_to(message, 'Что-то пошло не так, прошу повторите запрос')
+
+    @bot.message_handler(commands=['unwatch'])
+    def unwatch(message: types.Message) -> None:
+        """Обработчик команды /unwatch: отменяет все подписки пользователя.
+
+        Args:
+            message (types.Message): Объект сообщения от пользователя.
+        """
+        add_to_history(message.from_user.id, message.text)
+        bot.send_message(message.chat.id, watches_removed_text(remove_watches(message.from_user.id)))
+
+    conversations.add_flow(Flow('watch', WATCH_STEPS, finish, split_watch_arguments))
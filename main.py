@@ -1,17 +1,204 @@
+import argparse
+import asyncio
+import multiprocessing
+import signal
+from typing import List
+from urllib.parse import urlparse
+
 import telebot
+from telebot import apihelper, asyncio_filters, asyncio_helper, types
 from config_data import config
 from handlers.default_handlers import start, help
-from handlers.custom_handlers import low, high, custom, history, weather
+from handlers.custom_handlers import low, high, custom, anywhere, watch, trend, history, weather, flight_pages, profile
+from handlers import async_handlers
+from database.history import history_writer, migrate
+from database.models import check_schema
+from database.price_store import start_price_compactor
+from utils.async_http import http_client
+from utils.dispatcher import PRIORITY_BULK, AsyncQueuedTeleBot, QueuedTeleBot
+from utils.metrics import start_metrics_server
+from utils.price_watch import start_price_watcher
+from utils.state_store import create_step_backend
+from utils.weather import start_forecast_warmer
+from utils.webhook import WebhookServer
+
+
+def use_telegram_api_url() -> None:
+    """Направляет запросы к Telegram Bot API на TELEGRAM_API_URL, если он задан."""
+    if config.TELEGRAM_API_URL:
+        apihelper.API_URL = asyncio_helper.API_URL = config.TELEGRAM_API_URL + '/bot{0}/{1}'
+
+
+def check_databases() -> None:
+    """Применяет миграции базы истории и проверяет таблицы и индексы всех баз до запуска бота.
+
+    Raises:
+        SchemaError: Если в базе не хватает таблицы, колонки или индекса.
+    """
+    migrate()
+    check_schema()
+
+
+def create_bot() -> QueuedTeleBot:
+    """Создает синхронного бота и регистрирует обработчики команд.
+
+    Returns:
+        QueuedTeleBot: Объект бота, отправляющий сообщения через очередь с лимитами.
+    """
+    use_telegram_api_url()
+    bot = QueuedTeleBot(config.BOT_TOKEN, next_step_backend=create_step_backend())
+
+    start.registrate(bot)
+    help.registrate(bot)
+    low.registrate(bot)
+    high.registrate(bot)
+    custom.registrate(bot)
+    anywhere.registrate(bot)
+    watch.registrate(bot)
+    trend.registrate(bot)
+    flight_pages.registrate(bot)
+    weather.registrate(bot)
+    history.registrate(bot)
+    profile.registrate(bot)
+    return bot
+
+
+def create_async_bot() -> AsyncQueuedTeleBot:
+    """Создает асинхронного бота и регистрирует обработчики команд.
+
+    Returns:
+        AsyncQueuedTeleBot: Объект бота, отправляющий сообщения через очередь с лимитами.
+    """
+    use_telegram_api_url()
+    bot = AsyncQueuedTeleBot(config.BOT_TOKEN)
+    bot.add_custom_filter(asyncio_filters.StateFilter(bot))
 
-bot = telebot.TeleBot(config.BOT_TOKEN)
+    async_handlers.start.registrate(bot)
+    async_handlers.help.registrate(bot)
+    async_handlers.flights.registrate(bot)
+    async_handlers.anywhere.registrate(bot)
+    async_handlers.watch.registrate(bot)
+    async_handlers.flight_pages.registrate(bot)
+    async_handlers.weather.registrate(bot)
+    async_handlers.history.registrate(bot)
+    async_handlers.profile.registrate(bot)
+    return bot
+
+
+def run_polling() -> None:
+    """Запуск синхронного бота: каждое обновление обрабатывается в пуле потоков telebot."""
+    bot = create_bot()
+    start_metrics_server()
+    start_forecast_warmer()
+    start_price_compactor()
+    # Уведомления о ценах уходят через ту же очередь отправки, что и ответы бота
+    watcher = start_price_watcher(lambda chat_id, text: bot.send_message(chat_id, text, priority=PRIORITY_BULK))
+    try:
+        bot.infinity_polling()
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        # Отправляем то, что осталось в очереди, и дописываем историю команд, прежде чем выйти
+        bot.dispatcher.stop()
+        history_writer.stop()
+
+
+async def run_async() -> None:
+    """Запуск асинхронного бота: все обновления обрабатываются в одном цикле событий."""
+    bot = create_async_bot()
+    start_metrics_server()
+    start_forecast_warmer()
+    start_price_compactor()
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    # Проверка подписок работает в своем потоке, а отправка уведомлений передается в цикл событий бота
+    watcher = start_price_watcher(lambda chat_id, text: asyncio.run_coroutine_threadsafe(
+        bot.send_message(chat_id, text, priority=PRIORITY_BULK), loop))
+    try:
+        await bot.infinity_polling()
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        await bot.dispatcher.stop()
+        await asyncio.to_thread(history_writer.stop)
+        await http_client.close()
+        await bot.close_session()
+
+
+def run_webhook_worker(number: int, updates: multiprocessing.Queue) -> None:
+    """Процесс-обработчик режима webhook: обрабатывает обновления из своей очереди.
+
+    Args:
+        number (int): Номер процесса.
+        updates (multiprocessing.Queue): Очередь тел запросов Telegram; None - завершить работу.
+    """
+    bot = create_bot()
+    # Метрики у каждого процесса свои, поэтому и порт у каждого свой
+    start_metrics_server(config.METRICS_PORT + number if config.METRICS_PORT > 0 else 0)
+    watcher = None
+    if number == 0:
+        # Популярные прогнозы, подписки на цены и сжатие истории цен достаточно одного процесса
+        start_forecast_warmer()
+        start_price_compactor()
+        watcher = start_price_watcher(lambda chat_id, text: bot.send_message(chat_id, text, priority=PRIORITY_BULK))
+    try:
+        while True:
+            body = updates.get()
+            if body is None:
+                break
+            bot.process_new_updates([types.Update.de_json(body)])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        bot.worker_pool.close()
+        bot.dispatcher.stop()
+        history_writer.stop()
+
+
+def run_webhook() -> None:
+    """Запуск в режиме webhook: один HTTP-сервер и WEBHOOK_WORKERS процессов-обработчиков.
+
+    Каждый чат закреплен за одним процессом, а шаги диалогов хранятся в STATE_STORE,
+    поэтому при sqlite или file диалог продолжится и после перезапуска с другим числом процессов.
+    """
+    queues: List[multiprocessing.Queue] = [multiprocessing.Queue() for _ in range(config.WEBHOOK_WORKERS)]
+    workers: List[multiprocessing.Process] = [
+        multiprocessing.Process(target=run_webhook_worker, args=(number, queue), name=f'webhook-worker-{number}')
+        for number, queue in enumerate(queues)]
+    for worker in workers:
+        worker.start()
+
+    path: str = urlparse(config.WEBHOOK_URL).path or '/'
+    server = WebhookServer((config.WEBHOOK_HOST, config.WEBHOOK_PORT), path, config.WEBHOOK_SECRET, queues)
+    use_telegram_api_url()
+    telebot.TeleBot(config.BOT_TOKEN).set_webhook(url=config.WEBHOOK_URL, secret_token=config.WEBHOOK_SECRET or None)
+    # SIGTERM (systemd, docker stop) завершает работу так же аккуратно, как Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for queue in queues:
+            queue.put(None)
+        for worker in workers:
+            worker.join()
 
-start.registrate(bot)
-help.registrate(bot)
-low.registrate(bot)
-high.registrate(bot)
-custom.registrate(bot)
-weather.registrate(bot)
-history.registrate(bot)
 
 if __name__ == '__main__':
-    bot.infinity_polling()
+    parser = argparse.ArgumentParser(description='Telegram-бот для поиска авиабилетов и прогноза погоды')
+    parser.add_argument('--mode', choices=('polling', 'async', 'webhook'), default=config.BOT_MODE,
+                        help='режим работы бота (по умолчанию значение BOT_MODE из keys.env)')
+    args = parser.parse_args()
+
+    check_databases()
+    if args.mode == 'async':
+        asyncio.run(run_async())
+    elif args.mode == 'webhook':
+        if not config.WEBHOOK_URL:
+            parser.error('для режима webhook нужно задать WEBHOOK_URL в keys.env')
+        run_webhook()
+    else:
+        run_polling()
@@ -0,0 +1,279 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import SplitResult, urlsplit
+
+import aiohttp
+
+from config_data import config
+from database.price_store import price_store
+from utils.aviasales import (PAGE_LIMIT, PRICES_FOR_DATES_PATH, AviasalesError, TopK, anywhere_requests,
+                             collect_top, flight_cache, merge_flights, prices_for_dates_params, search_months,
+                             top_flights)
+from utils.http_client import CircuitBreaker, CircuitOpenError, aviasales_client, meteosource_client
+from utils.metrics import operation
+from utils.ttl_cache import TTLCache
+from utils.weather import (DAILY_FORECAST_PATH, count_request, daily_forecast_request, forecast_cache,
+                           forecast_key, forecast_ttl)
+
+
+class AsyncHTTPClient:
+    """Общая сессия aiohttp с пулом соединений для асинхронного режима бота.
+
+    Сессия создается при первом запросе внутри работающего цикла событий и переиспользует
+    TCP/TLS-соединения между запросами ко всем внешним API. Таймауты и размер пула берутся
+    из тех же настроек, что и у utils.http_client, а состояние доступности сервиса учитывается
+    общим с синхронным клиентом CircuitBreaker.
+    """
+
+    def __init__(self, limit: int = 100, limit_per_host: int = config.HTTP_POOL_SIZE,
+                 connect_timeout: float = config.HTTP_CONNECT_TIMEOUT,
+                 read_timeout: float = config.HTTP_READ_TIMEOUT) -> None:
+        """
+        Args:
+            limit (int): Максимальное количество одновременных соединений.
+            limit_per_host (int): Максимальное количество соединений к одному хосту.
+            connect_timeout (float): Таймаут подключения в секундах.
+            read_timeout (float): Таймаут ожидания ответа в секундах.
+        """
+        self.limit: int = limit
+        self.limit_per_host: int = limit_per_host
+        self.timeout: aiohttp.ClientTimeout = aiohttp.ClientTimeout(sock_connect=connect_timeout,
+                                                                    sock_read=read_timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def get_json(self, url: str, params: Optional[dict] = None, headers: Optional[dict] = None,
+                       breaker: Optional[CircuitBreaker] = None) -> Any:
+        """GET-запрос с разбором JSON-ответа.
+
+        Args:
+            url (str): Адрес запроса.
+            params (Optional[dict]): Параметры строки запроса.
+            headers (Optional[dict]): Заголовки запроса.
+            breaker (Optional[CircuitBreaker]): Автомат размыкания цепи для этого сервиса.
+
+        Returns:
+            Any: Разобранный JSON-ответ.
+
+        Raises:
+            CircuitOpenError: Если сервис недавно был недоступен.
+            aiohttp.ClientResponseError: Если сервер ответил кодом ошибки.
+        """
+        if params:
+            # Как и requests, параметры со значением None не передаем
+            params = {key: value for key, value in params.items() if value is not None}
+        if breaker is not None:
+            breaker.before_request()
+        session: aiohttp.ClientSession = self._get_session()
+        parts: SplitResult = urlsplit(url)
+        try:
+            with operation('http', parts.netloc + parts.path):
+                async with session.get(url, params=params, headers=headers) as response:
+                    response.raise_for_status()
+                    payload: Any = await response.json(content_type=None)
+        except aiohttp.ClientResponseError as e:
+            if breaker is not None:
+                if e.status >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            raise
+        except (Exception, asyncio.CancelledError):
+            # Обрыв соединения, таймаут, ошибка чтения тела, ответ не в JSON или отмена. Результат нужно
+            # записать при любом исходе, иначе пробный запрос полуоткрытой цепи не завершится
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+        if breaker is not None:
+            breaker.record_success()
+        return payload
+
+    async def close(self) -> None:
+        """Закрывает сессию и все соединения пула."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector: aiohttp.TCPConnector = aiohttp.TCPConnector(limit=self.limit,
+                                                                   limit_per_host=self.limit_per_host)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+
+# Общий клиент для всех асинхронных обработчиков
+http_client: AsyncHTTPClient = AsyncHTTPClient()
+
+# Загрузки, которые сейчас выполняются; одновременные запросы одного ключа ждут одну задачу
+_in_flight: Dict[Hashable, 'asyncio.Future[Any]'] = {}
+
+
+async def _get_or_load(cache: TTLCache, key: Hashable, load: Callable[[], Awaitable[Any]],
+                       ttl: Optional[float] = None) -> Any:
+    """Асинхронный вариант TTLCache.get_or_load с тем же поведением.
+
+    Свежая запись возвращается сразу. Устаревшая, но допустимая - тоже сразу, а обновление
+    идет в фоновой задаче (одна на ключ). Без записи одновременные запросы ключа ждут одну
+    загрузку. Кэш в SQLite-файле читается и пишется в потоке, чтобы не блокировать цикл событий.
+    """
+    found: Optional[Tuple[Any, bool]] = await asyncio.to_thread(cache.peek, key) if cache.persistent \
+        else cache.peek(key)
+    if found is not None and found[1]:
+        return found[0]
+    future: Optional['asyncio.Future[Any]'] = _in_flight.get(key)
+    if future is None:
+        async def load_and_store() -> Any:
+            loaded: Any = await load()
+            if cache.persistent:
+                await asyncio.to_thread(cache.set, key, loaded, ttl)
+            else:
+                cache.set(key, loaded, ttl)
+            return loaded
+
+        future = _in_flight[key] = asyncio.ensure_future(load_and_store())
+        future.add_done_callback(lambda done: _finish_load(key, done))
+    if found is not None:
+        # Ошибка фонового обновления не мешает: устаревшая запись отдается до конца stale_ttl
+        return found[0]
+    # shield: отмена одного ожидающего не должна отменять загрузку для остальных
+    return await asyncio.shield(future)
+
+
+def _finish_load(key: Hashable, future: 'asyncio.Future[Any]') -> None:
+    _in_flight.pop(key, None)
+    if not future.cancelled():
+        # Ошибку фонового обновления никто не ждет; без этого asyncio пишет ее в журнал как необработанную
+        future.exception()
+
+
+async def get_prices_for_dates_async(origin: str, destination: str, departure_at: str) -> List[dict]:
+    """Асинхронный вариант utils.aviasales.get_prices_for_dates с тем же кэшем.
+
+    Args:
+        origin (str): IATA-код города отправления.
+        destination (str): IATA-код города прибытия.
+        departure_at (str): Месяц вылета в формате YYYY-MM.
+
+    Returns:
+        List[dict]: Рейсы, отсортированные по цене.
+
+    Raises:
+        AviasalesError: Если API ответил кодом ошибки.
+    """
+    async def load() -> List[dict]:
+        # Как utils.aviasales.fetch_month: следующая страница, только если предыдущая заполнена
+        flights: List[dict] = []
+        for page in range(1, config.FLIGHT_MAX_PAGES + 1):
+            params: dict = prices_for_dates_params(origin, destination, departure_at, page)
+            try:
+                payload: dict = await http_client.get_json(aviasales_client.url(PRICES_FOR_DATES_PATH),
+                                                           params=params, breaker=aviasales_client.breaker)
+            except aiohttp.ClientResponseError as e:
+                raise AviasalesError(e.status) from e
+            data: List[dict] = payload.get('data', [])
+            # Дозапись в файл цен ждет блокировку на время сжатия, поэтому - в потоке
+            await asyncio.to_thread(price_store.record, origin, destination, data)
+            flights.extend(data)
+            if len(data) < PAGE_LIMIT:
+                break
+        return flights
+
+    return await _get_or_load(flight_cache, (origin, destination, departure_at), load)
+
+
+async def get_prices_for_months_async(origin: str, destination: str, departure_at: str, key: str = 'price',
+                                      reverse: bool = False) -> Iterator[dict]:
+    """Асинхронный вариант utils.aviasales.get_prices_for_months.
+
+    Месяцы диапазона запрашиваются одновременно, но не больше FLIGHT_FANOUT_CONCURRENCY
+    за раз на один поиск.
+
+    Args:
+        origin (str): IATA-код города отправления.
+        destination (str): IATA-код города прибытия.
+        departure_at (str): Месяц YYYY-MM или диапазон YYYY-MM..YYYY-MM.
+        key (str): Поле рейса для упорядочивания: price или departure_at.
+        reverse (bool): По убыванию.
+
+    Returns:
+        Iterator[dict]: Рейсы всех месяцев по порядку.
+
+    Raises:
+        AviasalesError: Если API ответил кодом ошибки.
+    """
+    semaphore: asyncio.Semaphore = asyncio.Semaphore(config.FLIGHT_FANOUT_CONCURRENCY)
+
+    async def load_month(month: str) -> List[dict]:
+        async with semaphore:
+            return await get_prices_for_dates_async(origin, destination, month)
+
+    results: List[List[dict]] = await asyncio.gather(*(load_month(month) for month in search_months(departure_at)))
+    return merge_flights(results, key, reverse)
+
+
+async def search_anywhere_async(origins: Iterable[str], destinations: Iterable[str], departure_at: str,
+                                k: int) -> List[dict]:
+    """Асинхронный вариант utils.aviasales.search_anywhere.
+
+    Не больше FLIGHT_FANOUT_CONCURRENCY запросов одного поиска выполняются одновременно.
+
+    Args:
+        origins (Iterable[str]): IATA-коды городов отправления.
+        destinations (Iterable[str]): IATA-коды городов прибытия.
+        departure_at (str): Месяц YYYY-MM или диапазон YYYY-MM..YYYY-MM.
+        k (int): Сколько рейсов вернуть.
+
+    Returns:
+        List[dict]: До k рейсов по возрастанию цены; в origin и destination - коды городов.
+
+    Raises:
+        AviasalesError: Если API ответил ошибкой на все запросы.
+        aiohttp.ClientError: Если API недоступен для всех запросов.
+        CircuitOpenError: Если API недавно был недоступен.
+    """
+    semaphore: asyncio.Semaphore = asyncio.Semaphore(config.FLIGHT_FANOUT_CONCURRENCY)
+
+    async def load(origin: str, destination: str, month: str) -> Tuple[str, str, List[dict]]:
+        async with semaphore:
+            return origin, destination, await get_prices_for_dates_async(origin, destination, month)
+
+    top: TopK = TopK(k)
+    error: Optional[Exception] = None
+    succeeded: int = 0
+    for task in asyncio.as_completed([load(*request) for request in anywhere_requests(origins, destinations,
+                                                                                      departure_at)]):
+        try:
+            origin, destination, flights = await task
+        except (AviasalesError, aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError) as e:
+            error = e
+            continue
+        succeeded += 1
+        collect_top(top, origin, destination, flights)
+    if error is not None and not succeeded:
+        raise error
+    return top_flights(top)
+
+
+async def get_daily_forecast_async(lat: float, lon: float) -> dict:
+    """Асинхронный вариант utils.weather.get_daily_forecast с тем же кэшем.
+
+    Args:
+        lat (float): Широта.
+        lon (float): Долгота.
+
+    Returns:
+        dict: Ответ эндпоинта /daily.
+
+    Raises:
+        aiohttp.ClientError: Если запрос не удался или API ответил ошибкой.
+        CircuitOpenError: Если API недавно был недоступен.
+    """
+    key: Tuple[float, float] = forecast_key(lat, lon)
+    count_request(key)
+
+    async def load() -> dict:
+        querystring, headers = daily_forecast_request(*key)
+        return await http_client.get_json(meteosource_client.url(DAILY_FORECAST_PATH), params=querystring,
+                                          headers=headers, breaker=meteosource_client.breaker)
+
+    return await _get_or_load(forecast_cache, key, load, ttl=forecast_ttl(key))
@@ -0,0 +1,335 @@
+import heapq
+import itertools
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+from operator import itemgetter
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import requests as rq
+
+from config_data import config
+from database.airport_directory import airport_directory
+from database.price_store import price_store
+from utils.http_client import aviasales_client
+from utils.metrics import registry
+from utils.ttl_cache import TTLCache
+from utils.validators import month_range
+
+PRICES_FOR_DATES_PATH: str = '/aviasales/v3/prices_for_dates'
+# Рейсов на одной странице ответа prices_for_dates
+PAGE_LIMIT: int = 50
+
+# Общий кэш ответов prices_for_dates для /low, /high и /custom
+flight_cache: TTLCache = TTLCache(maxsize=config.FLIGHT_CACHE_SIZE, ttl=config.FLIGHT_CACHE_TTL,
+                                  stale_ttl=config.FLIGHT_CACHE_STALE_TTL,
+                                  persist_path=config.FLIGHT_CACHE_PATH or None)
+registry.add_collector('travelbot_flight_cache', 'Кэш ответов prices_for_dates', flight_cache.stats)
+
+# Общие потоки для запросов по нескольким месяцам: ограничивают число одновременных запросов к API
+_fanout_pool: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=config.FLIGHT_FANOUT_CONCURRENCY,
+                                                      thread_name_prefix='flights-fanout')
+
+
+class AviasalesError(Exception):
+    """Ошибка ответа API Aviasales."""
+
+    def __init__(self, status_code: int) -> None:
+        """
+        Args:
+            status_code (int): HTTP-код ответа.
+        """
+        super().__init__(f'Aviasales API вернул код {status_code}')
+        self.status_code: int = status_code
+
+
+def prices_for_dates_params(origin: str, destination: str, departure_at: str, page: int = 1) -> dict:
+    """Параметры запроса prices_for_dates, общие для всех команд поиска.
+
+    Args:
+        origin (str): IATA-код города отправления.
+        destination (str): IATA-код города прибытия.
+        departure_at (str): Месяц вылета в формате YYYY-MM.
+        page (int): Номер страницы ответа.
+
+    Returns:
+        dict: Параметры строки запроса.
+    """
+    return {
+        'origin': origin,
+        'destination': destination,
+        'departure_at': departure_at,
+        'sorting': 'price',
+        'direct': 'false',
+        'cy': 'rub',
+        'limit': PAGE_LIMIT,
+        'page': page,
+        'token': config.AVIASALES_API_KEY,
+    }
+
+
+def fetch_prices_for_dates(origin: str, destination: str, departure_at: str, page: int = 1) -> List[dict]:
+    """Запрос одной страницы рейсов к API Aviasales в обход кэша.
+
+    Args:
+        origin (str): IATA-код города отправления.
+        destination (str): IATA-код города прибытия.
+        departure_at (str): Месяц вылета в формате YYYY-MM.
+        page (int): Номер страницы ответа.
+
+    Returns:
+        List[dict]: Рейсы, отсортированные по цене.
+
+    Raises:
+        AviasalesError: Если API ответил кодом, отличным от 200.
+        rq.RequestException: Если API недоступен.
+    """
+    params: dict = prices_for_dates_params(origin, destination, departure_at, page)
+    response: rq.Response = aviasales_client.get(PRICES_FOR_DATES_PATH, params=params)
+    if response.status_code != 200:
+        raise AviasalesError(response.status_code)
+    data: List[dict] = response.json().get('data', [])
+    # Полученные цены сохраняются для /trend
+    price_store.record(origin, destination, data)
+    return data
+
+
+def fetch_month(origin: str, destination: str, departure_at: str) -> List[dict]:
+    """Все страницы рейсов за месяц, но не больше FLIGHT_MAX_PAGES.
+
+    Следующая страница запрашивается, только если предыдущая заполнена целиком.
+
+    Args:
+        origin (str): IATA-код города отправления.
+        destination (str): IATA-код города прибытия.
+        departure_at (str): Месяц вылета в формате YYYY-MM.
+
+    Returns:
+        List[dict]: Рейсы, отсортированные по цене.
+
+    Raises:
+        AviasalesError: Если API ответил кодом, отличным от 200.
+        rq.RequestException: Если API недоступен.
+    """
+    flights: List[dict] = []
+    for page in range(1, config.FLIGHT_MAX_PAGES + 1):
+        data: List[dict] = fetch_prices_for_dates(origin, destination, departure_at, page)
+        flights.extend(data)
+        if len(data) < PAGE_LIMIT:
+            break
+    return flights
+
+
+def get_prices_for_dates(origin: str, destination: str, departure_at: str) -> List[dict]:
+    """Рейсы по направлению и месяцу с использованием общего кэша.
+
+    Все команды поиска запрашивают одни и те же параметры и отличаются только локальной
+    сортировкой и фильтрацией, поэтому ответ кэшируется по направлению и месяцу.
+
+    Args:
+        origin (str): IATA-код города отправления.
+        destination (str): IATA-код города прибытия.
+        departure_at (str): Месяц вылета в формате YYYY-MM.
+
+    Returns:
+        List[dict]: Рейсы, отсортированные по цене. Список общий для всех вызовов,
+        изменять его нельзя.
+
+    Raises:
+        AviasalesError: Если API ответил кодом, отличным от 200.
+        rq.RequestException: Если API недоступен.
+    """
+    key: tuple = (origin, destination, departure_at)
+    return flight_cache.get_or_load(key, lambda: fetch_month(origin, destination, departure_at))
+
+
+def search_months(departure_at: str) -> List[str]:
+    """Месяцы поиска: один месяц YYYY-MM или все месяцы диапазона YYYY-MM..YYYY-MM.
+
+    Args:
+        departure_at (str): Месяц или диапазон месяцев, прошедший проверку validate_month_range.
+
+    Returns:
+        List[str]: Месяцы в формате YYYY-MM.
+    """
+    return month_range(departure_at) or [departure_at]
+
+
+def merge_flights(results: Iterable[List[dict]], key: str = 'price', reverse: bool = False) -> Iterator[dict]:
+    """Потоковое k-путевое слияние рейсов нескольких месяцев.
+
+    Каждый список сортируется по отдельности (копия: списки из кэша менять нельзя),
+    а heapq.merge выдает рейсы по одному, не собирая общий список и не сортируя его заново.
+
+    Args:
+        results (Iterable[List[dict]]): Рейсы каждого месяца.
+        key (str): Поле рейса для упорядочивания: price или departure_at.
+        reverse (bool): По убыванию.
+
+    Returns:
+        Iterator[dict]: Рейсы всех месяцев по порядку.
+    """
+    get_key = itemgetter(key)
+    return heapq.merge(*(sorted(flights, key=get_key, reverse=reverse) for flights in results),
+                       key=get_key, reverse=reverse)
+
+
+def get_prices_for_months(origin: str, destination: str, departure_at: str, key: str = 'price',
+                          reverse: bool = False) -> Iterator[dict]:
+    """Рейсы за месяц или диапазон месяцев.
+
+    Месяцы диапазона запрашиваются одновременно в общих потоках _fanout_pool (каждый
+    через общий кэш), а их результаты сливаются merge_flights.
+
+    Args:
+        origin (str): IATA-код города отправления.
+        destination (str): IATA-код города прибытия.
+        departure_at (str): Месяц YYYY-MM или диапазон YYYY-MM..YYYY-MM.
+        key (str): Поле рейса для упорядочивания: price или departure_at.
+        reverse (bool): По убыванию.
+
+    Returns:
+        Iterator[dict]: Рейсы всех месяцев по порядку.
+
+    Raises:
+        AviasalesError: Если API ответил кодом, отличным от 200.
+        rq.RequestException: Если API недоступен.
+    """
+    months: List[str] = search_months(departure_at)
+    if len(months) == 1:
+        return merge_flights([get_prices_for_dates(origin, destination, months[0])], key, reverse)
+    # Запросы выполняются в контексте обработчика, чтобы их время попало в метрики команды
+    futures: List[Future] = [_fanout_pool.submit(copy_context().run, get_prices_for_dates, origin, destination, month)
+                             for month in months]
+    return merge_flights([future.result() for future in futures], key, reverse)
+
+
+def format_flight(flight: dict, origin_ru: str, destination_ru: str,
+                  airports: Optional[Mapping[str, str]] = None) -> str:
+    """Текст сообщения с информацией о рейсе.
+
+    Args:
+        flight (dict): Рейс из ответа prices_for_dates.
+        origin_ru (str): Название города отправления.
+        destination_ru (str): Название города прибытия.
+        airports (Optional[Mapping[str, str]]): Уже найденные названия аэропортов по кодам;
+            остальные ищутся в справочнике.
+
+    Returns:
+        str: Описание рейса для отправки пользователю.
+    """
+    formated_date: str = flight['departure_at'][:19]
+    origin_airport_name: str = _airport_name(flight.get('origin_airport'), airports)
+    destination_airport_name: str = _airport_name(flight.get('destination_airport'), airports)
+    return (
+        f'Город отправления: {origin_ru}\n'
+        f'Город прибытия: {destination_ru}\n'
+        f'Дата отправления: {formated_date}\n'
+        f'Стоимость: {flight["price"]}\n'
+        f'Аэропорт отправления: {origin_airport_name}\n'
+        f'Аэропорт прибытия: {destination_airport_name}\n'
+        f'Ссылка: aviasales.ru{flight["link"]}'
+    )
+
+
+def _airport_name(code: Optional[str], airports: Optional[Mapping[str, str]]) -> str:
+    if airports is not None and code in airports:
+        return airports[code]
+    return airport_directory.get_name(code)
+
+
+class TopK:
+    """Ограниченная куча: k элементов с наименьшей ценой из потока.
+
+    Хранит не больше k элементов (на вершине самый дорогой из них), поэтому каждый
+    новый элемент обходится в O(log k), а весь поток в памяти не собирается.
+    """
+
+    def __init__(self, k: int) -> None:
+        """
+        Args:
+            k (int): Сколько элементов хранить.
+        """
+        self.k: int = k
+        # (-цена, порядковый номер, элемент): номер сохраняет порядок при равной цене
+        self._heap: List[Tuple[float, int, Any]] = []
+        self._counter: Iterator[int] = itertools.count()
+
+    def push(self, price: float, item: Any) -> None:
+        """Добавляет элемент, если он дешевле самого дорогого из сохраненных."""
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, (-price, next(self._counter), item))
+        elif -price > self._heap[0][0]:
+            heapq.heapreplace(self._heap, (-price, next(self._counter), item))
+
+    def items(self) -> List[Any]:
+        """Сохраненные элементы по возрастанию цены."""
+        return [item for _, _, item in sorted(self._heap, key=lambda entry: (-entry[0], entry[1]))]
+
+
+def anywhere_requests(origins: Iterable[str], destinations: Iterable[str],
+                      departure_at: str) -> List[Tuple[str, str, str]]:
+    """Запросы поиска "откуда угодно куда угодно": все пары городов на все месяцы.
+
+    Args:
+        origins (Iterable[str]): IATA-коды городов отправления.
+        destinations (Iterable[str]): IATA-коды городов прибытия.
+        departure_at (str): Месяц YYYY-MM или диапазон YYYY-MM..YYYY-MM.
+
+    Returns:
+        List[Tuple[str, str, str]]: Город отправления, город прибытия и месяц; пары
+        из одного и того же города пропускаются.
+    """
+    months: List[str] = search_months(departure_at)
+    return [(origin, destination, month) for origin in dict.fromkeys(origins)
+            for destination in dict.fromkeys(destinations) if origin != destination for month in months]
+
+
+def collect_top(top: TopK, origin: str, destination: str, flights: List[dict]) -> None:
+    """Добавляет рейсы одного направления в кучу лучших."""
+    for flight in flights:
+        top.push(flight['price'], (origin, destination, flight))
+
+
+def top_flights(top: TopK) -> List[dict]:
+    """Лучшие рейсы из кучи с кодами городов направления, по возрастанию цены."""
+    return [dict(flight, origin=origin, destination=destination) for origin, destination, flight in top.items()]
+
+
+def search_anywhere(origins: Iterable[str], destinations: Iterable[str], departure_at: str, k: int) -> List[dict]:
+    """Самые дешевые рейсы между любыми городами из двух списков.
+
+    Все пары и месяцы запрашиваются одновременно в общих потоках _fanout_pool (через общий
+    кэш), а рейсы по мере готовности ответов проходят через ограниченную кучу TopK.
+    Направления, по которым API ответил ошибкой, пропускаются.
+
+    Args:
+        origins (Iterable[str]): IATA-коды городов отправления.
+        destinations (Iterable[str]): IATA-коды городов прибытия.
+        departure_at (str): Месяц YYYY-MM или диапазон YYYY-MM..YYYY-MM.
+        k (int): Сколько рейсов вернуть.
+
+    Returns:
+        List[dict]: До k рейсов по возрастанию цены; в origin и destination - коды городов.
+
+    Raises:
+        AviasalesError: Если API ответил ошибкой на все запросы.
+        rq.RequestException: Если API недоступен для всех запросов.
+    """
+    futures: Dict[Future, Tuple[str, str, str]] = {
+        _fanout_pool.submit(copy_context().run, get_prices_for_dates, *request): request
+        for request in anywhere_requests(origins, destinations, departure_at)}
+    top: TopK = TopK(k)
+    error: Optional[Exception] = None
+    succeeded: int = 0
+    for future in as_completed(futures):
+        origin, destination, _ = futures[future]
+        try:
+            flights: List[dict] = future.result()
+        except (AviasalesError, rq.RequestException) as e:
+            error = e
+            continue
+        succeeded += 1
+        collect_top(top, origin, destination, flights)
+    if error is not None and not succeeded:
+        raise error
+    return top_flights(top)
@@ -0,0 +1,213 @@
+import json
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from telebot import TeleBot, types, util
+
+from config_data import config
+from utils.keyboards import location_markup
+from utils.metrics import label_request, record_error, registry
+from utils.state_store import StateStore, create_state_store
+
+# Ответ на ошибку внутри шага диалога
+ERROR_TEXT: str = 'Что-то пошло не так, прошу повторите запрос'
+
+
+class Step(NamedTuple):
+    """Шаг диалога: вопрос пользователю и разбор ответа.
+
+    parse (или locate для геопозиции) возвращает значение, которое сохраняется в состоянии
+    диалога под ключом key, или None, если ответ не подходит. Значение должно сериализоваться в JSON, поэтому
+    вместо объектов хранятся их короткие идентификаторы (например, код города).
+    """
+    key: str
+    prompt: str
+    parse: Callable[[str], Optional[str]]
+    error: str
+    # Клавиатура с подсказками для неподходящего ответа
+    suggestions: Optional[Callable[[str], Optional[types.ReplyKeyboardMarkup]]] = None
+    # Значение по отправленной геопозиции (широта, долгота); None - шаг принимает только текст
+    locate: Optional[Callable[[float, float], Optional[str]]] = None
+
+
+class Flow(NamedTuple):
+    """Диалог: шаги по порядку и обработчик собранных ответов.
+
+    arguments разбивает текст после команды (например, `/low Москва Сочи 2024-02`)
+    на ответы по ключам шагов, чтобы не задавать вопросы, на которые уже есть ответ.
+    """
+    name: str
+    steps: Tuple[Step, ...]
+    finish: Callable[[types.Message, Dict[str, str]], None]
+    arguments: Optional[Callable[[str], Dict[str, str]]] = None
+
+
+def parse_answers(steps: Tuple[Step, ...], answers: Dict[str, str]) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """Проверяет заранее известные ответы парсерами шагов.
+
+    Args:
+        steps (Tuple[Step, ...]): Шаги диалога.
+        answers (Dict[str, str]): Текст ответа по ключу шага.
+
+    Returns:
+        Tuple[Dict[str, str], Dict[str, str]]: Разобранные значения и тексты, которые не подошли.
+    """
+    data: Dict[str, str] = {}
+    rejected: Dict[str, str] = {}
+    for step in steps:
+        if step.key not in answers:
+            continue
+        value: Optional[str] = step.parse(answers[step.key])
+        if value is None:
+            rejected[step.key] = answers[step.key]
+        else:
+            data[step.key] = value
+    return data, rejected
+
+
+def next_step(steps: Tuple[Step, ...], data: Dict[str, str]) -> Optional[int]:
+    """Номер первого шага без ответа или None, если все ответы собраны."""
+    return next((index for index, step in enumerate(steps) if step.key not in data), None)
+
+
+class ConversationMachine:
+    """Конечный автомат диалогов из нескольких шагов.
+
+    Состояние диалога - это имя диалога, номер текущего шага и уже собранные ответы.
+    Оно хранится в StateStore в виде короткой строки JSON, поэтому переживает перезапуск
+    при STATE_STORE=sqlite или file, а брошенные диалоги удаляются через CONVERSATION_TTL
+    секунд после последнего ответа.
+    """
+
+    def __init__(self, bot: TeleBot, store: StateStore) -> None:
+        """
+        Args:
+            bot (TeleBot): Объект бота.
+            store (StateStore): Хранилище состояний диалогов.
+        """
+        self.bot: TeleBot = bot
+        self.store: StateStore = store
+        self.flows: Dict[str, Flow] = {}
+
+    def add_flow(self, flow: Flow) -> None:
+        """Регистрирует диалог."""
+        self.flows[flow.name] = flow
+
+    def start(self, message: types.Message, name: str) -> None:
+        """Начинает диалог заново.
+
+        Если после команды указаны аргументы, они разбираются сразу: при всех верных
+        ответах диалог завершается этим же сообщением, иначе задается первый вопрос,
+        на который ответа нет или ответ не подошел.
+
+        Args:
+            message (types.Message): Сообщение с командой.
+            name (str): Имя диалога.
+        """
+        self.store.clear(message.chat.id)
+        flow: Flow = self.flows[name]
+        try:
+            arguments: Optional[str] = util.extract_arguments(message.text)
+            answers: Dict[str, str] = flow.arguments(arguments) if arguments and flow.arguments else {}
+            data, rejected = parse_answers(flow.steps, answers)
+            self._advance(message, flow, data, rejected)
+        except Exception as e:
+            record_error(e)
+            self.bot.reply_to(message, ERROR_TEXT)
+
+    def handle(self, message: types.Message) -> None:
+        """Обрабатывает ответ на текущий шаг диалога, если диалог начат.
+
+        Если шаг завершился ошибкой, диалог возвращается на этот же шаг с прежними ответами,
+        и пользователь может ответить еще раз.
+
+        Args:
+            message (types.Message): Сообщение пользователя.
+        """
+        records = self.store.pop(message.chat.id)
+        if not records:
+            return
+        state: dict = json.loads(records[-1])
+        flow: Optional[Flow] = self.flows.get(state['flow'])
+        if flow is None:
+            return
+        step: Optional[Step] = None
+        try:
+            step = flow.steps[state['step']]
+            # В метриках ответ учитывается как шаг своей команды, а не общего обработчика
+            label_request('/' + flow.name, step.key)
+            value: Optional[str] = self._parse(step, message)
+            if value is None:
+                markup = step.suggestions(message.text) if step.suggestions else None
+                self.bot.send_message(message.chat.id, step.error, reply_markup=markup)
+                self._save(message.chat.id, flow.name, state['step'], state['data'])
+                return
+
+            self._advance(message, flow, dict(state['data'], **{step.key: value}), {})
+        except Exception as e:
+            record_error(e)
+            if step is not None:
+                # _advance мог уже сохранить следующий шаг, но вопрос до пользователя не дошел
+                self.store.clear(message.chat.id)
+                self._save(message.chat.id, flow.name, state['step'], state['data'])
+            self.bot.reply_to(message, ERROR_TEXT)
+
+    def is_reply(self, message: types.Message) -> bool:
+        """Фильтр сообщений, которые могут быть ответом на шаг диалога: геопозиция или текст, но не команда."""
+        return message.location is not None or bool(message.text) and not message.text.startswith('/')
+
+    def stats(self) -> Dict[str, float]:
+        """Количество активных диалогов и размер их состояния в виде JSON в хранилище.
+
+        Это не память процесса: объекты Python вокруг каждой строки состояния занимают
+        в несколько раз больше (см. benchmarks/conversations.py).
+
+        Returns:
+            Dict[str, float]: active - активные диалоги, state_bytes - всего байт JSON,
+            state_bytes_per_conversation - в среднем на диалог.
+        """
+        active, size = self.store.usage()
+        return {'active': active, 'state_bytes': size,
+                'state_bytes_per_conversation': size / active if active else 0.0}
+
+    def _advance(self, message: types.Message, flow: Flow, data: Dict[str, str], rejected: Dict[str, str]) -> None:
+        """Задает следующий вопрос без ответа или завершает диалог, если ответы собраны."""
+        index: Optional[int] = next_step(flow.steps, data)
+        if index is None:
+            flow.finish(message, data)
+            return
+        self._save(message.chat.id, flow.name, index, data)
+        step: Step = flow.steps[index]
+        if step.key in rejected:
+            markup = step.suggestions(rejected[step.key]) if step.suggestions else None
+            self.bot.send_message(message.chat.id, step.error, reply_markup=markup)
+        else:
+            self.bot.send_message(message.chat.id, step.prompt, reply_markup=location_markup() if step.locate else None)
+
+    @staticmethod
+    def _parse(step: Step, message: types.Message) -> Optional[str]:
+        if message.location is None:
+            return step.parse(message.text)
+        return step.locate(message.location.latitude, message.location.longitude) if step.locate else None
+
+    def _save(self, chat_id: int, name: str, step: int, data: Dict[str, str]) -> None:
+        self.store.push(chat_id, json.dumps({'flow': name, 'step': step, 'data': data},
+                                            ensure_ascii=False, separators=(',', ':')))
+
+
+def get_conversations(bot: TeleBot) -> ConversationMachine:
+    """Автомат диалогов бота; при первом вызове создается и подключается к обработчикам.
+
+    Args:
+        bot (TeleBot): Объект бота.
+
+    Returns:
+        ConversationMachine: Автомат диалогов.
+    """
+    machine: Optional[ConversationMachine] = getattr(bot, 'conversations', None)
+    if machine is None:
+        machine = ConversationMachine(bot, create_state_store('conversation', ttl=config.CONVERSATION_TTL))
+        bot.conversations = machine
+        bot.register_message_handler(machine.handle, content_types=['text', 'location'], func=machine.is_reply)
+        registry.add_collector('travelbot_conversations', 'Активные диалоги и размер их состояния в JSON',
+                               machine.stats)
+    return machine
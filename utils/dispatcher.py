@@ -0,0 +1,557 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+import telebot
+from telebot.async_telebot import AsyncTeleBot
+
+from config_data import config
+from utils.metrics import bind, bind_async, instrument_handler, registry
+
+# Приоритеты отправки: чем меньше число, тем раньше уходит сообщение.
+# Вопросы и ответы диалога не должны ждать, пока отправится длинный список результатов.
+PRIORITY_INTERACTIVE: int = 0
+PRIORITY_BULK: int = 10
+
+# Сколько раз повторять сообщение, на которое Telegram ответил 429
+MAX_ATTEMPTS: int = 5
+# Сколько последних задержек отправки учитывать в метриках
+LATENCY_SAMPLES: int = 1024
+# Как часто (сек) удалять из памяти состояние чатов, в которые давно ничего не отправлялось
+CLEANUP_INTERVAL: float = 60.0
+
+
+class TokenBucket:
+    """Ведро токенов: не больше `capacity` отправок подряд и `rate` отправок в секунду в среднем."""
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        """
+        Args:
+            rate (float): Скорость пополнения, токенов в секунду.
+            capacity (float): Вместимость ведра.
+            now (float): Текущее время по time.monotonic().
+        """
+        self.rate: float = rate
+        self.capacity: float = capacity
+        self.tokens: float = capacity
+        self.updated_at: float = now
+
+    def delay(self, now: float) -> float:
+        """Сколько секунд ждать до появления токена.
+
+        Args:
+            now (float): Текущее время по time.monotonic().
+
+        Returns:
+            float: 0, если токен есть уже сейчас.
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        """Забирает один токен; вызывать только после delay(), вернувшего 0."""
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        """Ведро полное, то есть чат давно ничего не отправлял.
+
+        Args:
+            now (float): Текущее время по time.monotonic().
+        """
+        self.delay(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    """Одно исходящее сообщение."""
+
+    __slots__ = ('priority', 'seq', 'chat_id', 'send', 'enqueued_at', 'attempts', 'future')
+
+    def __init__(self, priority: int, seq: int, chat_id: Union[int, str], send: Callable[[], Any],
+                 enqueued_at: float, future: Any) -> None:
+        self.priority: int = priority
+        self.seq: int = seq
+        self.chat_id: Union[int, str] = chat_id
+        self.send: Callable[[], Any] = send
+        self.enqueued_at: float = enqueued_at
+        self.attempts: int = 0
+        self.future: Any = future
+
+    def __lt__(self, other: '_Job') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _Chat:
+    """Очередь и лимит одного чата."""
+
+    __slots__ = ('bucket', 'jobs', 'busy', 'waiting')
+
+    def __init__(self, bucket: TokenBucket) -> None:
+        self.bucket: TokenBucket = bucket
+        self.jobs: List[_Job] = []
+        # Сообщение этого чата сейчас отправляется: следующее ждет, чтобы не нарушить порядок
+        self.busy: bool = False
+        # Чат ждет токена или окончания retry_after в очереди ожидания
+        self.waiting: bool = False
+
+
+class SendScheduler:
+    """Очередь исходящих сообщений с лимитами на чат и на бота в целом.
+
+    Хранит сообщения каждого чата в отдельной очереди с приоритетами и решает, какое
+    сообщение можно отправить прямо сейчас. Чаты, готовые к отправке, лежат в куче по
+    приоритету первого сообщения, а чаты, исчерпавшие лимит или получившие retry_after, -
+    в куче по времени, когда их можно будет снова отправлять. Сообщения одного чата
+    отправляются строго по одному, поэтому их порядок сохраняется.
+
+    Класс не потокобезопасен: вызовы должны защищаться блокировкой владельца.
+    """
+
+    def __init__(self, global_rate: float = config.TELEGRAM_GLOBAL_RATE,
+                 chat_rate: float = config.TELEGRAM_CHAT_RATE, chat_burst: float = config.TELEGRAM_CHAT_BURST,
+                 group_rate: float = config.TELEGRAM_GROUP_RATE,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        Args:
+            global_rate (float): Сообщений в секунду для всего бота.
+            chat_rate (float): Сообщений в секунду в один личный чат.
+            chat_burst (float): Сколько сообщений подряд можно отправить в чат без пауз.
+            group_rate (float): Сообщений в секунду в одну группу.
+            clock (Callable[[], float]): Источник монотонного времени.
+        """
+        self.chat_rate: float = chat_rate
+        self.chat_burst: float = chat_burst
+        self.group_rate: float = group_rate
+        self.clock: Callable[[], float] = clock
+        self.global_bucket: TokenBucket = TokenBucket(global_rate, global_rate, clock())
+        self._chats: Dict[Union[int, str], _Chat] = {}
+        # (приоритет, номер, чат) - чаты, которые можно отправлять сейчас
+        self._runnable: List[Tuple[int, int, Union[int, str]]] = []
+        # (можно с, номер, чат) - чаты, ждущие токена или retry_after
+        self._waiting: List[Tuple[float, int, Union[int, str]]] = []
+        self._seq: itertools.count = itertools.count()
+        self._cleaned_at: float = clock()
+        self.pending: int = 0
+        self.in_flight: int = 0
+        self.sent: int = 0
+        self.retried: int = 0
+        self.failed: int = 0
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def push(self, chat_id: Union[int, str], send: Callable[[], Any], priority: int, future: Any) -> None:
+        """Ставит сообщение в очередь.
+
+        Args:
+            chat_id (Union[int, str]): Идентификатор чата.
+            send (Callable[[], Any]): Функция, выполняющая отправку.
+            priority (int): Приоритет сообщения.
+            future (Any): Future, в который попадет результат отправки.
+        """
+        now: float = self.clock()
+        job: _Job = _Job(priority, next(self._seq), chat_id, send, now, future)
+        chat: Optional[_Chat] = self._chats.get(chat_id)
+        if chat is None:
+            rate: float = self.group_rate if isinstance(chat_id, int) and chat_id < 0 else self.chat_rate
+            burst: float = 1 if isinstance(chat_id, int) and chat_id < 0 else self.chat_burst
+            chat = self._chats[chat_id] = _Chat(TokenBucket(rate, burst, now))
+        heapq.heappush(chat.jobs, job)
+        self.pending += 1
+        if not chat.busy and not chat.waiting and chat.jobs[0] is job:
+            heapq.heappush(self._runnable, (job.priority, job.seq, chat_id))
+
+    def pop(self) -> Tuple[Optional[_Job], Optional[float]]:
+        """Выбирает сообщение, которое можно отправить прямо сейчас.
+
+        Returns:
+            Tuple[Optional[_Job], Optional[float]]: Сообщение или None и, если его нет,
+            через сколько секунд стоит проверить снова (None - очередь пуста).
+        """
+        now: float = self.clock()
+        self._cleanup(now)
+        while self._waiting and self._waiting[0][0] <= now:
+            _, _, chat_id = heapq.heappop(self._waiting)
+            chat: Optional[_Chat] = self._chats.get(chat_id)
+            if chat is not None and chat.waiting:
+                chat.waiting = False
+                if chat.jobs and not chat.busy:
+                    heapq.heappush(self._runnable, (chat.jobs[0].priority, chat.jobs[0].seq, chat_id))
+
+        while self._runnable:
+            priority, seq, chat_id = self._runnable[0]
+            chat = self._chats.get(chat_id)
+            if chat is None or chat.busy or chat.waiting or not chat.jobs or chat.jobs[0].seq != seq:
+                # Запись устарела: у чата появилось более срочное сообщение или он уже ждет
+                heapq.heappop(self._runnable)
+                continue
+            chat_delay: float = chat.bucket.delay(now)
+            if chat_delay > 0:
+                heapq.heappop(self._runnable)
+                chat.waiting = True
+                heapq.heappush(self._waiting, (now + chat_delay, seq, chat_id))
+                continue
+            global_delay: float = self.global_bucket.delay(now)
+            if global_delay > 0:
+                return None, global_delay
+            heapq.heappop(self._runnable)
+            chat.bucket.consume()
+            self.global_bucket.consume()
+            job: _Job = heapq.heappop(chat.jobs)
+            chat.busy = True
+            self.pending -= 1
+            self.in_flight += 1
+            job.attempts += 1
+            return job, None
+
+        if self._waiting:
+            return None, max(0.0, self._waiting[0][0] - now)
+        return None, None
+
+    def complete(self, job: _Job, ok: bool) -> None:
+        """Отмечает, что отправка завершилась (успешно или окончательной ошибкой).
+
+        Args:
+            job (_Job): Отправленное сообщение.
+            ok (bool): True, если сообщение доставлено.
+        """
+        now: float = self.clock()
+        self.in_flight -= 1
+        if ok:
+            self.sent += 1
+            self._latencies.append(now - job.enqueued_at)
+        else:
+            self.failed += 1
+        self._release(job.chat_id)
+
+    def retry_later(self, job: _Job, delay: float) -> None:
+        """Возвращает сообщение в начало очереди чата и приостанавливает чат.
+
+        Args:
+            job (_Job): Сообщение, на которое Telegram ответил 429.
+            delay (float): Сколько секунд не отправлять в этот чат (retry_after).
+        """
+        self.in_flight -= 1
+        self.pending += 1
+        self.retried += 1
+        chat: _Chat = self._chats[job.chat_id]
+        chat.busy = False
+        heapq.heappush(chat.jobs, job)
+        chat.waiting = True
+        heapq.heappush(self._waiting, (self.clock() + delay, job.seq, job.chat_id))
+
+    def metrics(self) -> Dict[str, float]:
+        """Метрики очереди.
+
+        Returns:
+            Dict[str, float]: Глубина очереди, сообщения в отправке, счетчики отправленных,
+            повторенных и неотправленных сообщений, перцентили задержки от постановки
+            в очередь до доставки (сек) по последним LATENCY_SAMPLES сообщениям.
+        """
+        latencies: List[float] = sorted(self._latencies)
+        result: Dict[str, float] = {'queue_depth': self.pending, 'in_flight': self.in_flight, 'sent': self.sent,
+                                    'retried': self.retried, 'failed': self.failed, 'chats': len(self._chats)}
+        for name, quantile in (('latency_p50', 0.5), ('latency_p99', 0.99)):
+            result[name] = latencies[min(len(latencies) - 1, int(len(latencies) * quantile))] if latencies else 0.0
+        result['latency_max'] = latencies[-1] if latencies else 0.0
+        return result
+
+    def _release(self, chat_id: Union[int, str]) -> None:
+        chat: _Chat = self._chats[chat_id]
+        chat.busy = False
+        if chat.jobs and not chat.waiting:
+            heapq.heappush(self._runnable, (chat.jobs[0].priority, chat.jobs[0].seq, chat_id))
+
+    def _cleanup(self, now: float) -> None:
+        if now - self._cleaned_at < CLEANUP_INTERVAL:
+            return
+        self._cleaned_at = now
+        idle: List[Union[int, str]] = [chat_id for chat_id, chat in self._chats.items()
+                                       if not chat.jobs and not chat.busy and not chat.waiting
+                                       and chat.bucket.is_full(now)]
+        for chat_id in idle:
+            del self._chats[chat_id]
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Значение retry_after из ответа 429 или None для остальных ошибок."""
+    if getattr(error, 'error_code', None) != 429:
+        return None
+    result_json: dict = getattr(error, 'result_json', None) or {}
+    return float(result_json.get('parameters', {}).get('retry_after', 1))
+
+
+class OutboundDispatcher:
+    """Отправка сообщений синхронного бота через общую очередь с лимитами.
+
+    Несколько рабочих потоков забирают сообщения из SendScheduler, поэтому медленный
+    ответ Telegram в одном чате не задерживает остальные. На ответ 429 сообщение
+    возвращается в очередь и отправляется повторно через retry_after секунд.
+    """
+
+    def __init__(self, workers: int = config.TELEGRAM_SEND_WORKERS,
+                 scheduler: Optional[SendScheduler] = None) -> None:
+        """
+        Args:
+            workers (int): Количество рабочих потоков.
+            scheduler (Optional[SendScheduler]): Очередь; по умолчанию с лимитами из настроек.
+        """
+        self.workers: int = workers
+        self.scheduler: SendScheduler = scheduler or SendScheduler()
+        self._condition: threading.Condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stopping: bool = False
+
+    def submit(self, chat_id: Union[int, str], send: Callable[[], Any],
+               priority: int = PRIORITY_INTERACTIVE) -> Future:
+        """Ставит отправку в очередь.
+
+        Args:
+            chat_id (Union[int, str]): Идентификатор чата.
+            send (Callable[[], Any]): Функция, выполняющая запрос к Telegram.
+            priority (int): Приоритет сообщения.
+
+        Returns:
+            Future: Результат отправки (объект Message) или исключение.
+        """
+        future: Future = Future()
+        with self._condition:
+            if not self._threads:
+                self._start()
+            self.scheduler.push(chat_id, send, priority, future)
+            self._condition.notify()
+        return future
+
+    def metrics(self) -> Dict[str, float]:
+        """Метрики очереди, см. SendScheduler.metrics."""
+        with self._condition:
+            return self.scheduler.metrics()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Дожидается отправки сообщений из очереди и останавливает рабочие потоки.
+
+        Args:
+            timeout (float): Сколько секунд максимум ждать опустошения очереди.
+        """
+        deadline: float = time.monotonic() + timeout
+        with self._condition:
+            while (self.scheduler.pending or self.scheduler.in_flight) and time.monotonic() < deadline:
+                self._condition.wait(timeout=0.1)
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+        self._threads = []
+        self._stopping = False
+
+    def _start(self) -> None:
+        for number in range(self.workers):
+            thread: threading.Thread = threading.Thread(target=self._work, name=f'OutboundDispatcher-{number}',
+                                                        daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while True:
+                    if self._stopping:
+                        return
+                    job, wait = self.scheduler.pop()
+                    if job is not None:
+                        break
+                    self._condition.wait(timeout=wait)
+
+            try:
+                result: Any = job.send()
+            except Exception as e:
+                retry_after: Optional[float] = _retry_after(e)
+                with self._condition:
+                    if retry_after is not None and job.attempts < MAX_ATTEMPTS:
+                        self.scheduler.retry_later(job, retry_after)
+                    else:
+                        self.scheduler.complete(job, ok=False)
+                        job.future.set_exception(e)
+                        telebot.logger.error(f'Сообщение в чат {job.chat_id} не отправлено: {e}')
+                    self._condition.notify_all()
+                continue
+
+            with self._condition:
+                self.scheduler.complete(job, ok=True)
+                self._condition.notify_all()
+            job.future.set_result(result)
+
+
+class AsyncOutboundDispatcher:
+    """Отправка сообщений асинхронного бота через общую очередь с лимитами.
+
+    Работает так же, как OutboundDispatcher, но рабочие - задачи asyncio в цикле событий бота.
+    """
+
+    def __init__(self, workers: int = config.TELEGRAM_SEND_WORKERS,
+                 scheduler: Optional[SendScheduler] = None) -> None:
+        """
+        Args:
+            workers (int): Количество одновременных отправок.
+            scheduler (Optional[SendScheduler]): Очередь; по умолчанию с лимитами из настроек.
+        """
+        self.workers: int = workers
+        self.scheduler: SendScheduler = scheduler or SendScheduler()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List['asyncio.Task[None]'] = []
+
+    def submit(self, chat_id: Union[int, str], send: Callable[[], Awaitable[Any]],
+               priority: int = PRIORITY_INTERACTIVE) -> 'asyncio.Future[Any]':
+        """Ставит отправку в очередь; вызывать из цикла событий бота.
+
+        Args:
+            chat_id (Union[int, str]): Идентификатор чата.
+            send (Callable[[], Awaitable[Any]]): Функция, возвращающая корутину запроса к Telegram.
+            priority (int): Приоритет сообщения.
+
+        Returns:
+            asyncio.Future[Any]: Результат отправки (объект Message) или исключение.
+        """
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        if not self._tasks:
+            self._wakeup = asyncio.Event()
+            self._tasks = [loop.create_task(self._work()) for _ in range(self.workers)]
+        future: 'asyncio.Future[Any]' = loop.create_future()
+        self.scheduler.push(chat_id, send, priority, future)
+        self._wakeup.set()
+        return future
+
+    def metrics(self) -> Dict[str, float]:
+        """Метрики очереди, см. SendScheduler.metrics."""
+        return self.scheduler.metrics()
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Дожидается отправки сообщений из очереди и останавливает рабочие задачи.
+
+        Args:
+            timeout (float): Сколько секунд максимум ждать опустошения очереди.
+        """
+        deadline: float = time.monotonic() + timeout
+        while (self.scheduler.pending or self.scheduler.in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self) -> None:
+        while True:
+            job, wait = self.scheduler.pop()
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                result: Any = await job.send()
+            except Exception as e:
+                retry_after: Optional[float] = _retry_after(e)
+                if retry_after is not None and job.attempts < MAX_ATTEMPTS:
+                    self.scheduler.retry_later(job, retry_after)
+                else:
+                    self.scheduler.complete(job, ok=False)
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                    telebot.logger.error(f'Сообщение в чат {job.chat_id} не отправлено: {e}')
+                self._wakeup.set()
+                continue
+
+            self.scheduler.complete(job, ok=True)
+            if not job.future.done():
+                job.future.set_result(result)
+            self._wakeup.set()
+
+
+class QueuedTeleBot(telebot.TeleBot):
+    """TeleBot, отправляющий сообщения через OutboundDispatcher.
+
+    send_message (а через него и reply_to) не ждет ответа Telegram, а ставит сообщение
+    в очередь и сразу возвращает Future. Необязательный аргумент `priority` задает
+    приоритет: PRIORITY_INTERACTIVE (по умолчанию) или PRIORITY_BULK для списков результатов.
+    Каждый обработчик обновлений оборачивается в instrument_handler: время обработки, запросов
+    и ошибки попадают в метрики (utils.metrics).
+    """
+
+    def __init__(self, token: str, *args, dispatcher: Optional[OutboundDispatcher] = None, **kwargs) -> None:
+        """
+        Args:
+            token (str): Токен бота.
+            dispatcher (Optional[OutboundDispatcher]): Очередь отправки; по умолчанию новая.
+        """
+        super().__init__(token, *args, **kwargs)
+        self.dispatcher: OutboundDispatcher = dispatcher or OutboundDispatcher()
+        registry.add_collector('travelbot_send', 'Очередь отправки сообщений в Telegram', self.dispatcher.metrics)
+
+    def send_message(self, chat_id: Union[int, str], text: str, *args,
+                     priority: int = PRIORITY_INTERACTIVE, **kwargs) -> Future:
+        return self.dispatcher.submit(chat_id, bind('telegram', 'sendMessage', lambda: super(
+            QueuedTeleBot, self).send_message(chat_id, text, *args, **kwargs)), priority)
+
+    @staticmethod
+    def _build_handler_dict(handler: Callable, pass_bot: bool = False, **filters) -> dict:
+        # Каждый обработчик, зарегистрированный декоратором или register_*_handler, замеряется
+        instrumented: Callable = instrument_handler(handler, commands=bool(filters.get('commands')))
+        return telebot.TeleBot._build_handler_dict(instrumented, pass_bot, **filters)
+
+    def _notify_next_handlers(self, new_messages: List[telebot.types.Message]) -> None:
+        """Передает сообщения обработчикам следующего шага и убирает их из списка.
+
+        telebot удаляет сообщение из списка прямо во время обхода и пропускает следующее за ним:
+        если в одной пачке обновлений следующего шага ждали два чата, ответ второго терялся.
+
+        Args:
+            new_messages (List[telebot.types.Message]): Новые сообщения; остаются те, что без следующего шага.
+        """
+        remaining: List[telebot.types.Message] = []
+        for message in new_messages:
+            handlers = self.next_step_backend.get_handlers(message.chat.id)
+            if not handlers:
+                remaining.append(message)
+                continue
+            for handler in handlers:
+                self._exec_task(instrument_handler(handler['callback']), message, *handler['args'],
+                                **handler['kwargs'])
+        new_messages[:] = remaining
+
+
+class AsyncQueuedTeleBot(AsyncTeleBot):
+    """AsyncTeleBot, отправляющий сообщения через AsyncOutboundDispatcher.
+
+    `await bot.send_message(...)` только ставит сообщение в очередь и возвращает
+    asyncio.Future с результатом отправки; аргумент `priority` и замер обработчиков
+    работают как у QueuedTeleBot.
+    """
+
+    def __init__(self, token: str, *args, dispatcher: Optional[AsyncOutboundDispatcher] = None,
+                 **kwargs) -> None:
+        """
+        Args:
+            token (str): Токен бота.
+            dispatcher (Optional[AsyncOutboundDispatcher]): Очередь отправки; по умолчанию новая.
+        """
+        super().__init__(token, *args, **kwargs)
+        self.dispatcher: AsyncOutboundDispatcher = dispatcher or AsyncOutboundDispatcher()
+        registry.add_collector('travelbot_send', 'Очередь отправки сообщений в Telegram', self.dispatcher.metrics)
+
+    async def send_message(self, chat_id: Union[int, str], text: str, *args,
+                           priority: int = PRIORITY_INTERACTIVE, **kwargs) -> 'asyncio.Future[Any]':
+        return self.dispatcher.submit(chat_id, bind_async('telegram', 'sendMessage', lambda: super(
+            AsyncQueuedTeleBot, self).send_message(chat_id, text, *args, **kwargs)), priority)
+
+    @staticmethod
+    def _build_handler_dict(handler: Callable, pass_bot: bool = False, **filters) -> dict:
+        # Каждый обработчик, зарегистрированный декоратором или register_*_handler, замеряется
+        instrumented: Callable = instrument_handler(handler, commands=bool(filters.get('commands')))
+        return AsyncTeleBot._build_handler_dict(instrumented, pass_bot, **filters)
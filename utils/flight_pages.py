@@ -0,0 +1,172 @@
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from telebot import types
+
+from config_data import config
+from database.airport_directory import airport_directory
+from database.gazetteer import CityRecord, gazetteer
+from utils.aviasales import format_flight
+from utils.metrics import operation
+from utils.ttl_cache import TTLCache
+
+# Максимальная длина текста одного сообщения Telegram
+MESSAGE_LIMIT: int = 4096
+# Префикс callback_data кнопок листания результатов
+CALLBACK_PREFIX: str = 'flights'
+# callback_data кнопки с номером страницы, нажатие на нее ничего не меняет
+NOOP_CALLBACK: str = f'{CALLBACK_PREFIX}:noop'
+
+# Страницы результатов поиска по идентификатору, для кнопок "Назад"/"Далее"
+result_pages: TTLCache = TTLCache(maxsize=config.RESULT_PAGES_SIZE, ttl=config.RESULT_PAGES_TTL)
+
+
+def render_pages(flights: List[dict], origin_ru: Optional[str], destination_ru: Optional[str],
+                 limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Раскладывает рейсы по страницам, каждая из которых помещается в одно сообщение.
+
+    Рейсы идут в исходном порядке и не разрываются между страницами. Каждая страница
+    начинается с заголовка вида "Рейсы 1-12 из 50".
+
+    Args:
+        flights (List[dict]): Рейсы из ответа prices_for_dates.
+        origin_ru (Optional[str]): Название города отправления; None - по коду origin каждого рейса.
+        destination_ru (Optional[str]): Название города прибытия; None - по коду destination каждого рейса.
+        limit (int): Максимальная длина страницы.
+
+    Returns:
+        List[str]: Тексты страниц.
+    """
+    # Названия аэропортов всех рейсов одним поиском, а не по два на каждый рейс
+    airports: Dict[str, str] = airport_directory.get_names(
+        code for flight in flights for code in (flight.get('origin_airport'), flight.get('destination_airport')))
+    with operation('render', 'flight_pages'):
+        blocks: List[str] = [f'Рейс {number}:\n{_format(flight, origin_ru, destination_ru, airports)}'
+                             for number, flight in enumerate(flights, start=1)]
+        total: int = len(blocks)
+        # Заголовок самой длинной формы, чтобы после подстановки номеров страница не вышла за limit
+        header_size: int = len(_page_header(total, total, total)) + 2
+
+        pages: List[str] = []
+        first: int = 0
+        size: int = header_size
+        for number, block in enumerate(blocks):
+            block_size: int = len(block) + 2
+            if number > first and size + block_size > limit:
+                pages.append(_page_text(blocks, first, number, total))
+                first, size = number, header_size
+            size += block_size
+        if blocks:
+            pages.append(_page_text(blocks, first, total, total))
+    return pages
+
+
+def store_pages(pages: List[str]) -> str:
+    """Сохраняет страницы результатов для листания кнопками.
+
+    Args:
+        pages (List[str]): Тексты страниц.
+
+    Returns:
+        str: Идентификатор результатов для callback_data.
+    """
+    result_id: str = uuid.uuid4().hex[:12]
+    result_pages.set(result_id, pages)
+    return result_id
+
+
+def page_markup(result_id: str, page: int, total: int) -> Optional[types.InlineKeyboardMarkup]:
+    """Кнопки листания для страницы результатов.
+
+    Args:
+        result_id (str): Идентификатор результатов.
+        page (int): Номер текущей страницы, начиная с нуля.
+        total (int): Количество страниц.
+
+    Returns:
+        Optional[types.InlineKeyboardMarkup]: Клавиатура или None, если страница одна.
+    """
+    if total <= 1:
+        return None
+    buttons: List[types.InlineKeyboardButton] = []
+    if page > 0:
+        buttons.append(types.InlineKeyboardButton('« Назад', callback_data=f'{CALLBACK_PREFIX}:{result_id}:{page - 1}'))
+    buttons.append(types.InlineKeyboardButton(f'{page + 1}/{total}', callback_data=NOOP_CALLBACK))
+    if page < total - 1:
+        buttons.append(types.InlineKeyboardButton('Далее »', callback_data=f'{CALLBACK_PREFIX}:{result_id}:{page + 1}'))
+    markup: types.InlineKeyboardMarkup = types.InlineKeyboardMarkup()
+    markup.row(*buttons)
+    return markup
+
+
+def first_page(flights: List[dict], origin_ru: Optional[str],
+               destination_ru: Optional[str]) -> Tuple[str, Optional[types.InlineKeyboardMarkup]]:
+    """Готовит первое сообщение с результатами поиска.
+
+    Если все рейсы помещаются в одно сообщение, кнопки не нужны и страницы не сохраняются.
+
+    Args:
+        flights (List[dict]): Рейсы из ответа prices_for_dates.
+        origin_ru (Optional[str]): Название города отправления; None - по коду origin каждого рейса.
+        destination_ru (Optional[str]): Название города прибытия; None - по коду destination каждого рейса.
+
+    Returns:
+        Tuple[str, Optional[types.InlineKeyboardMarkup]]: Текст сообщения и кнопки листания.
+    """
+    pages: List[str] = render_pages(flights, origin_ru, destination_ru)
+    if len(pages) == 1:
+        return pages[0], None
+    result_id: str = store_pages(pages)
+    return pages[0], page_markup(result_id, 0, len(pages))
+
+
+def is_page_callback(call: types.CallbackQuery) -> bool:
+    """Фильтр callback-запросов кнопок листания результатов.
+
+    Args:
+        call (types.CallbackQuery): Callback-запрос.
+
+    Returns:
+        bool: True, если запрос от кнопки листания.
+    """
+    return bool(call.data) and call.data.startswith(f'{CALLBACK_PREFIX}:')
+
+
+def get_page(data: str) -> Optional[Tuple[str, Optional[types.InlineKeyboardMarkup]]]:
+    """Страница результатов по callback_data кнопки.
+
+    Args:
+        data (str): callback_data нажатой кнопки.
+
+    Returns:
+        Optional[Tuple[str, Optional[types.InlineKeyboardMarkup]]]: Текст страницы и кнопки
+        или None, если результаты устарели или кнопка не меняет страницу.
+    """
+    parts: List[str] = data.split(':')
+    if len(parts) != 3 or not parts[2].isdigit():
+        return None
+    result_id, page = parts[1], int(parts[2])
+    pages: Optional[List[str]] = result_pages.get(result_id)
+    if not pages or page >= len(pages):
+        return None
+    return pages[page], page_markup(result_id, page, len(pages))
+
+
+def _format(flight: dict, origin_ru: Optional[str], destination_ru: Optional[str], airports: Dict[str, str]) -> str:
+    return format_flight(flight, origin_ru or _city_ru(flight.get('origin')),
+                         destination_ru or _city_ru(flight.get('destination')), airports)
+
+
+def _city_ru(code: Optional[str]) -> str:
+    city: Optional[CityRecord] = gazetteer.get_by_code(code)
+    return city.ru if city else code or ''
+
+
+def _page_header(first: int, last: int, total: int) -> str:
+    if first == last:
+        return f'Рейс {first} из {total}'
+    return f'Рейсы {first}-{last} из {total}'
+
+
+def _page_text(blocks: List[str], first: int, end: int, total: int) -> str:
+    return '\n\n'.join([_page_header(first + 1, end, total)] + blocks[first:end])
@@ -0,0 +1,202 @@
+import datetime
+import re
+from typing import Dict, List, Optional, Tuple
+
+from config_data import config
+from database.city_search import city_matcher
+from database.gazetteer import CityRecord, gazetteer
+from database.spatial_index import spatial_index
+from utils.conversation import Step
+from utils.keyboards import city_suggestions_markup
+from utils.locations import city_near
+from utils.validators import validate_date_format, validate_month_range, validate_price_range
+
+
+def parse_city(text: str) -> Optional[str]:
+    """Код города по введенному названию или None, если город не найден."""
+    city: Optional[CityRecord] = city_matcher.resolve(text)
+    return city.code if city else None
+
+
+def locate_city(lat: float, lon: float) -> Optional[str]:
+    """Код ближайшего к геопозиции города или None, если рядом городов нет."""
+    city: Optional[CityRecord] = city_near(lat, lon)
+    return city.code if city else None
+
+
+def parse_month(text: str) -> Optional[str]:
+    """Месяц YYYY-MM или диапазон YYYY-MM..YYYY-MM; None, если формат неверный."""
+    return text if validate_month_range(text) else None
+
+
+def parse_price_range(text: str) -> Optional[str]:
+    """Диапазон цен в формате "от-до" или None, если формат неверный."""
+    return text if validate_price_range(text) else None
+
+
+def parse_watch_month(text: str) -> Optional[str]:
+    """Месяц YYYY-MM, который еще не прошел, или None."""
+    if not validate_date_format(text) or not 1 <= int(text[5:]) <= 12:
+        return None
+    return text if text >= datetime.date.today().strftime('%Y-%m') else None
+
+
+def parse_threshold(text: str) -> Optional[str]:
+    """Цена в рублях (целое положительное число) или None, если формат неверный."""
+    return text if text.isdigit() and int(text) > 0 else None
+
+
+ORIGIN_STEP: Step = Step('origin', 'Введите название города отправления на русском языке '
+                                   'или отправьте геопозицию', parse_city,
+                         'Город не найден в базе данных, либо город введен не корректно. '
+                         'Пожалуйста, введите город отправления.', city_suggestions_markup, locate=locate_city)
+DESTINATION_STEP: Step = Step('destination', 'Введите название города прибытия на русском языке '
+                                             'или отправьте геопозицию', parse_city,
+                              'Город не найден в базе данных, либо город введен не корректно. '
+                              'Пожалуйста, введите город прибытия.', city_suggestions_markup, locate=locate_city)
+MONTH_STEP: Step = Step('month', 'Введите год и месяц отправления в формате YYYY-MM (Например 2024-02) '
+                                 'или диапазон месяцев через две точки (Например 2024-02..2024-04)', parse_month,
+                        'Некорректный формат даты. Пожалуйста, введите в формате YYYY-MM или YYYY-MM..YYYY-MM.')
+PRICES_STEP: Step = Step('prices', 'Введите диапазон цен через дефис (например, 5000-10000)', parse_price_range,
+                         'Некорректный формат диапазона цен. Пожалуйста, введите в формате '
+                         'нижняя_граница-верхняя_граница (например, 5000-10000).')
+WATCH_MONTH_STEP: Step = Step('month', 'Введите год и месяц отправления в формате YYYY-MM (Например 2024-02)',
+                              parse_watch_month,
+                              'Некорректный формат даты или месяц уже прошел. Пожалуйста, введите в формате YYYY-MM.')
+THRESHOLD_STEP: Step = Step('threshold', 'Введите цену в рублях: бот сообщит, когда билет станет дешевле',
+                            parse_threshold, 'Некорректная цена. Пожалуйста, введите целое число рублей, '
+                                             'например 5000.')
+
+# Город с радиусом для /anywhere, например "Сочи (Адлер) 300 км"
+RADIUS_PATTERN: re.Pattern = re.compile(r'^(?P<city>.+?)\s+(?P<radius>\d+)\s*км$', re.IGNORECASE)
+
+
+def parse_places(text: str) -> Optional[str]:
+    """Коды городов для /anywhere через запятую или None, если какой-то город не найден.
+
+    Через запятую перечисляются города или города с радиусом ("Москва 100 км"): вместо
+    такого города берутся все города в радиусе от него, начиная с ближайших. Всего
+    городов не больше ANYWHERE_MAX_CITIES.
+    """
+    codes: List[str] = []
+    for place in text.split(','):
+        place = place.strip()
+        with_radius: Optional[re.Match] = RADIUS_PATTERN.match(place)
+        city: Optional[CityRecord] = city_matcher.resolve(with_radius.group('city') if with_radius else place)
+        if not city:
+            return None
+        if with_radius:
+            radius: float = float(with_radius.group('radius'))
+            codes.extend(nearby.code for nearby in spatial_index.within(city.lat, city.lon, radius,
+                                                                        config.ANYWHERE_MAX_CITIES))
+        else:
+            codes.append(city.code)
+    return ','.join(list(dict.fromkeys(codes))[:config.ANYWHERE_MAX_CITIES])
+
+
+ORIGINS_STEP: Step = Step('origins', 'Введите города отправления через запятую или город с радиусом '
+                                    '(например, Москва, Санкт-Петербург или Москва 100 км) либо отправьте геопозицию',
+                          parse_places,
+                          'Не удалось найти один из городов. Пожалуйста, введите города отправления через запятую.',
+                          locate=locate_city)
+DESTINATIONS_STEP: Step = Step('destinations', 'Введите города прибытия через запятую или город с радиусом '
+                                              '(например, Сочи (Адлер) 300 км) либо отправьте геопозицию',
+                               parse_places,
+                               'Не удалось найти один из городов. Пожалуйста, введите города прибытия через запятую.',
+                               locate=locate_city)
+
+# Шаги /low и /high: город отправления, город прибытия, месяц
+FLIGHT_STEPS: Tuple[Step, ...] = (ORIGIN_STEP, DESTINATION_STEP, MONTH_STEP)
+# Шаги /custom: те же и диапазон цен
+CUSTOM_STEPS: Tuple[Step, ...] = FLIGHT_STEPS + (PRICES_STEP,)
+# Шаги /anywhere: несколько городов отправления и прибытия, месяц
+ANYWHERE_STEPS: Tuple[Step, ...] = (ORIGINS_STEP, DESTINATIONS_STEP, MONTH_STEP)
+# Шаги /watch: город отправления, город прибытия, один месяц и порог цены
+WATCH_STEPS: Tuple[Step, ...] = (ORIGIN_STEP, DESTINATION_STEP, WATCH_MONTH_STEP, THRESHOLD_STEP)
+
+# Ключи шагов для аргументов с цифрами после названий городов, по порядку
+NUMERIC_KEYS: Tuple[str, ...] = ('month', 'prices')
+# То же для /watch: после месяца идет порог цены
+WATCH_NUMERIC_KEYS: Tuple[str, ...] = ('month', 'threshold')
+
+
+def split_flight_arguments(text: str, numeric_keys: Tuple[str, ...] = NUMERIC_KEYS) -> Dict[str, str]:
+    """Разбивает аргументы команды поиска рейсов на ответы шагов.
+
+    Формат: `<город отправления> <город прибытия> [YYYY-MM или YYYY-MM..YYYY-MM] [от-до]`, например
+    `Москва Санкт-Петербург 2024-02` или `Москва Сочи 2024-07 5000-10000`.
+    В названиях городов нет цифр, поэтому месяц и цены - это слова с цифрами в конце.
+    Названия из нескольких слов разделяются по первой границе, где оба города
+    находятся в индексе городов.
+
+    Args:
+        text (str): Текст после команды.
+        numeric_keys (Tuple[str, ...]): Ключи шагов для слов с цифрами, по порядку.
+
+    Returns:
+        Dict[str, str]: Текст ответа по ключу шага; проверяют его парсеры шагов.
+    """
+    words: List[str] = text.split()
+    numeric: List[str] = []
+    while words and any(char.isdigit() for char in words[-1]):
+        numeric.insert(0, words.pop())
+    answers: Dict[str, str] = dict(zip(numeric_keys, numeric))
+    if not words:
+        return answers
+
+    for border in range(1, len(words)):
+        origin, destination = ' '.join(words[:border]), ' '.join(words[border:])
+        if city_matcher.resolve(origin) and city_matcher.resolve(destination):
+            answers.update(origin=origin, destination=destination)
+            return answers
+
+    # Пара городов не нашлась: самое длинное известное начало - город отправления, остальное - прибытия
+    border = next((border for border in range(len(words), 0, -1)
+                   if city_matcher.resolve(' '.join(words[:border]))), 1)
+    answers['origin'] = ' '.join(words[:border])
+    if words[border:]:
+        answers['destination'] = ' '.join(words[border:])
+    return answers
+
+
+def split_watch_arguments(text: str) -> Dict[str, str]:
+    """Разбивает аргументы /watch на ответы шагов.
+
+    Формат: `<город отправления> <город прибытия> [YYYY-MM] [цена]`, например
+    `Москва Санкт-Петербург 2024-07 5000`.
+
+    Args:
+        text (str): Текст после команды.
+
+    Returns:
+        Dict[str, str]: Текст ответа по ключу шага.
+    """
+    return split_flight_arguments(text, WATCH_NUMERIC_KEYS)
+
+
+def split_anywhere_arguments(text: str) -> Dict[str, str]:
+    """Разбивает аргументы /anywhere на ответы шагов.
+
+    Формат: `<города отправления>; <города прибытия>; <месяц>`, например
+    `Москва 100 км; Сочи (Адлер) 300 км; 2024-07`.
+
+    Args:
+        text (str): Текст после команды.
+
+    Returns:
+        Dict[str, str]: Текст ответа по ключу шага.
+    """
+    parts: List[str] = [part.strip() for part in text.split(';')]
+    return {step.key: part for step, part in zip(ANYWHERE_STEPS, parts) if part}
+
+
+def flow_cities(data: Dict[str, str]) -> Tuple[CityRecord, CityRecord]:
+    """Города отправления и прибытия по кодам из состояния диалога.
+
+    Args:
+        data (Dict[str, str]): Собранные ответы диалога.
+
+    Returns:
+        Tuple[CityRecord, CityRecord]: Город отправления и город прибытия.
+    """
+    return gazetteer.get_by_code(data['origin']), gazetteer.get_by_code(data['destination'])
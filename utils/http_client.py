@@ -0,0 +1,205 @@
+import random
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests as rq
+from requests.adapters import HTTPAdapter
+
+from config_data import config
+from utils.metrics import operation
+
+# Коды ответа, после которых запрос стоит повторить
+RETRY_STATUSES: frozenset = frozenset({429, 500, 502, 503, 504})
+# Дольше этого не ждем даже если сервер просит в Retry-After
+MAX_RETRY_AFTER: float = 10.0
+
+
+class CircuitOpenError(rq.ConnectionError):
+    """Запрос не отправлен: внешний сервис недавно был недоступен."""
+
+
+class CircuitBreaker:
+    """Автомат "размыкания цепи" для одного внешнего сервиса.
+
+    После `failure_threshold` неудачных запросов подряд цепь размыкается, и в течение
+    `reset_timeout` секунд запросы сразу завершаются ошибкой, не дожидаясь таймаутов.
+    Затем пропускается один пробный запрос: при успехе цепь замыкается, при неудаче
+    снова размыкается на `reset_timeout`.
+    """
+
+    CLOSED: str = 'closed'
+    OPEN: str = 'open'
+    HALF_OPEN: str = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        """
+        Args:
+            failure_threshold (int): Количество неудач подряд, после которого цепь размыкается.
+            reset_timeout (float): Через сколько секунд пропустить пробный запрос.
+        """
+        self.failure_threshold: int = failure_threshold
+        self.reset_timeout: float = reset_timeout
+        self._lock: threading.Lock = threading.Lock()
+        self._failures: int = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_progress: bool = False
+
+    @property
+    def state(self) -> str:
+        """Текущее состояние цепи."""
+        with self._lock:
+            if self._opened_at is None:
+                return self.CLOSED
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self.OPEN
+
+    def before_request(self) -> None:
+        """Проверяет, можно ли отправить запрос.
+
+        Raises:
+            CircuitOpenError: Если цепь разомкнута или пробный запрос уже отправлен.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at >= self.reset_timeout and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return
+        raise CircuitOpenError('Сервис временно недоступен, запрос не отправлялся')
+
+    def record_success(self) -> None:
+        """Учитывает успешный запрос и замыкает цепь."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self) -> None:
+        """Учитывает неудачный запрос и при необходимости размыкает цепь."""
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_progress or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_progress = False
+
+
+class UpstreamClient:
+    """HTTP-клиент одного внешнего API.
+
+    Держит собственную requests.Session с пулом keep-alive соединений, задает таймауты
+    подключения и чтения, повторяет запрос с экспоненциальной задержкой и случайным
+    разбросом при сетевых ошибках и ответах 429/5xx, а через CircuitBreaker перестает
+    обращаться к сервису, который не отвечает.
+    """
+
+    def __init__(self, base_url: str, connect_timeout: float = config.HTTP_CONNECT_TIMEOUT,
+                 read_timeout: float = config.HTTP_READ_TIMEOUT, retries: int = config.HTTP_RETRIES,
+                 backoff: float = config.HTTP_BACKOFF, pool_size: int = config.HTTP_POOL_SIZE,
+                 breaker: Optional[CircuitBreaker] = None) -> None:
+        """
+        Args:
+            base_url (str): Адрес API без завершающего слэша, например https://api.travelpayouts.com.
+            connect_timeout (float): Таймаут подключения в секундах.
+            read_timeout (float): Таймаут ожидания ответа в секундах.
+            retries (int): Сколько раз повторять неудавшийся запрос.
+            backoff (float): Базовая задержка перед повтором в секундах, удваивается с каждой попыткой.
+            pool_size (int): Максимальное количество соединений в пуле.
+            breaker (Optional[CircuitBreaker]): Автомат размыкания цепи; по умолчанию создается новый.
+        """
+        self.base_url: str = base_url.rstrip('/')
+        # Хост API в метках метрик: эндпоинт в них - хост и путь без параметров
+        self.host: str = urlsplit(self.base_url).netloc
+        self.timeout: tuple = (connect_timeout, read_timeout)
+        self.retries: int = retries
+        self.backoff: float = backoff
+        self.breaker: CircuitBreaker = breaker or CircuitBreaker(config.CIRCUIT_FAILURE_THRESHOLD,
+                                                                 config.CIRCUIT_RESET_TIMEOUT)
+        self.session: rq.Session = rq.Session()
+        adapter: HTTPAdapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def url(self, path: str) -> str:
+        """Полный адрес эндпоинта.
+
+        Args:
+            path (str): Путь эндпоинта, начинающийся со слэша.
+
+        Returns:
+            str: Адрес запроса.
+        """
+        return self.base_url + path
+
+    def get(self, path: str, params: Optional[dict] = None, headers: Optional[dict] = None) -> rq.Response:
+        """GET-запрос с повторами.
+
+        Ответы с кодами ошибок возвращаются как есть (после исчерпания повторов), их
+        обработка остается за вызывающим кодом.
+
+        Args:
+            path (str): Путь эндпоинта, начинающийся со слэша.
+            params (Optional[dict]): Параметры строки запроса.
+            headers (Optional[dict]): Заголовки запроса.
+
+        Returns:
+            rq.Response: Ответ сервера.
+
+        Raises:
+            CircuitOpenError: Если сервис недавно был недоступен.
+            rq.RequestException: Если все попытки завершились сетевой ошибкой.
+        """
+        # Замеряется весь запрос вместе с повторами: столько ждет пользователь
+        with operation('http', self.host + path):
+            self.breaker.before_request()
+            attempt: int = 0
+            while True:
+                try:
+                    response: rq.Response = self.session.get(self.url(path), params=params, headers=headers,
+                                                             timeout=self.timeout)
+                except (rq.ConnectionError, rq.Timeout):
+                    if attempt >= self.retries:
+                        self.breaker.record_failure()
+                        raise
+                    delay: float = self._backoff_delay(attempt)
+                except Exception:
+                    # Любой другой исход тоже завершает пробный запрос, иначе полуоткрытая цепь не закроется
+                    self.breaker.record_failure()
+                    raise
+                else:
+                    if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                        if response.status_code >= 500:
+                            self.breaker.record_failure()
+                        else:
+                            self.breaker.record_success()
+                        return response
+                    delay = self._retry_after(response) or self._backoff_delay(attempt)
+                    response.close()
+                attempt += 1
+                time.sleep(delay)
+
+    def close(self) -> None:
+        """Закрывает все соединения пула."""
+        self.session.close()
+
+    def _backoff_delay(self, attempt: int) -> float:
+        # "Полный разброс": случайная задержка от нуля до экспоненциальной границы,
+        # чтобы повторы от многих пользователей не приходили к API одновременно
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    @staticmethod
+    def _retry_after(response: rq.Response) -> Optional[float]:
+        value: Optional[str] = response.headers.get('Retry-After')
+        if value is None:
+            return None
+        try:
+            return min(float(value), MAX_RETRY_AFTER)
+        except ValueError:
+            return None
+
+
+# Общие клиенты внешних API для всех обработчиков
+aviasales_client: UpstreamClient = UpstreamClient(config.AVIASALES_API_URL)
+meteosource_client: UpstreamClient = UpstreamClient(config.METEOSOURCE_API_URL)
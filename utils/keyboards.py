@@ -0,0 +1,39 @@
+from typing import List, Optional
+
+from telebot import types
+
+from database.city_search import city_matcher
+from database.gazetteer import CityRecord
+
+
+def city_suggestions_markup(text: Optional[str], limit: int = 5) -> Optional[types.ReplyKeyboardMarkup]:
+    """Клавиатура с подсказками городов, похожих на введенный текст.
+
+    Кнопки подписаны как "Москва (MOW)": нажатие отправляет этот текст следующим сообщением,
+    и город однозначно определяется по коду даже при одинаковых названиях.
+
+    Args:
+        text (Optional[str]): Текст, введенный пользователем.
+        limit (int): Максимальное количество подсказок.
+
+    Returns:
+        Optional[types.ReplyKeyboardMarkup]: Клавиатура или None, если похожих городов нет.
+    """
+    suggestions: List[CityRecord] = city_matcher.suggest(text, limit=limit)
+    if not suggestions:
+        return None
+    markup: types.ReplyKeyboardMarkup = types.ReplyKeyboardMarkup(row_width=1, resize_keyboard=True,
+                                                                  one_time_keyboard=True)
+    markup.add(*(types.KeyboardButton(f'{city.ru} ({city.code})') for city in suggestions))
+    return markup
+
+
+def location_markup() -> types.ReplyKeyboardMarkup:
+    """Клавиатура с кнопкой отправки геопозиции вместо названия города.
+
+    Returns:
+        types.ReplyKeyboardMarkup: Клавиатура с одной кнопкой.
+    """
+    markup: types.ReplyKeyboardMarkup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    markup.add(types.KeyboardButton('Отправить геопозицию', request_location=True))
+    return markup
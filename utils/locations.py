@@ -0,0 +1,38 @@
+from typing import List, Optional
+
+from telebot import types
+
+from config_data import config
+from database.city_search import city_matcher
+from database.gazetteer import CityRecord
+from database.spatial_index import spatial_index
+from utils.metrics import timed
+
+
+@timed('reference', 'location')
+def city_near(lat: float, lon: float) -> Optional[CityRecord]:
+    """Ближайший к точке город справочника, но не дальше LOCATION_MAX_DISTANCE.
+
+    Args:
+        lat (float): Широта.
+        lon (float): Долгота.
+
+    Returns:
+        Optional[CityRecord]: Найденный город или None, если рядом городов нет.
+    """
+    found: List[CityRecord] = spatial_index.nearest(lat, lon, max_distance_km=config.LOCATION_MAX_DISTANCE)
+    return found[0] if found else None
+
+
+def city_from_message(message: types.Message) -> Optional[CityRecord]:
+    """Город из сообщения: ближайший к отправленной геопозиции или по введенному названию.
+
+    Args:
+        message (types.Message): Сообщение пользователя.
+
+    Returns:
+        Optional[CityRecord]: Найденный город или None.
+    """
+    if message.location is not None:
+        return city_near(message.location.latitude, message.location.longitude)
+    return city_matcher.resolve(message.text)
@@ -0,0 +1,514 @@
+import bisect
+import functools
+import inspect
+import json
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, TextIO, Tuple
+
+import peewee as pw
+from telebot import logger, types, util
+
+from config_data import config
+
+# Границы корзин гистограмм в секундах: от поиска в памяти (десятки мкс) до медленного внешнего API
+BUCKETS: Tuple[float, ...] = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                              0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Семейства метрик: имя -> (тип, описание)
+HANDLER_SECONDS: str = 'travelbot_handler_seconds'
+HANDLER_OPERATION_SECONDS: str = 'travelbot_handler_operation_seconds_total'
+OPERATION_SECONDS: str = 'travelbot_operation_seconds'
+OPERATION_ERRORS: str = 'travelbot_operation_errors_total'
+ERRORS: str = 'travelbot_errors_total'
+FAMILIES: Dict[str, Tuple[str, str]] = {
+    HANDLER_SECONDS: ('histogram', 'Время обработки обновления по команде и шагу диалога'),
+    HANDLER_OPERATION_SECONDS: ('counter', 'Сколько секунд обработчики команды провели в запросах каждого вида'),
+    OPERATION_SECONDS: ('histogram', 'Время запросов к SQLite, справочникам, внешним API, Telegram и разметки результатов'),
+    OPERATION_ERRORS: ('counter', 'Запросы, завершившиеся исключением, по типу исключения'),
+    ERRORS: ('counter', 'Ошибки в обработчиках по команде и типу исключения'),
+}
+
+Labels = Tuple[str, ...]
+
+
+class Histogram:
+    """Гистограмма с накопительными корзинами, как в формате Prometheus."""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self) -> None:
+        # counts[i] - наблюдения не больше BUCKETS[i]; последняя ячейка - больше всех границ
+        self.counts: List[int] = [0] * (len(BUCKETS) + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Request:
+    """Обработка одного обновления: команда, шаг и сколько времени ушло на запросы каждого вида."""
+
+    __slots__ = ('handler', 'step', 'started', 'operations', 'error', 'finished', 'trace')
+
+    def __init__(self, handler: str, step: str) -> None:
+        self.handler: str = handler
+        self.step: str = step
+        self.started: float = time.perf_counter()
+        self.operations: Dict[str, float] = {}
+        self.error: Optional[str] = None
+        # Обработчик вернул управление; отправки из очереди могут завершиться и позже
+        self.finished: bool = False
+        # Запись запросов по порядку, если обновление трассируется (utils.profiler)
+        self.trace: Optional[Any] = None
+
+
+# Обновление, которое сейчас обрабатывается в этом потоке или задаче asyncio
+_current: ContextVar[Optional[Request]] = ContextVar('metrics_request', default=None)
+
+
+class MetricsRegistry:
+    """Гистограммы и счетчики процесса с выводом в текстовом формате Prometheus.
+
+    Метрики хранятся по семейству и набору значений меток; все изменения идут под одной
+    блокировкой, поэтому их можно записывать из любых потоков. Кроме собственных метрик
+    выводятся показатели, которые модули отдают сами (очередь отправки, кэши, диалоги):
+    они регистрируются через add_collector и читаются в момент запроса метрик.
+    """
+
+    def __init__(self) -> None:
+        self._lock: threading.Lock = threading.Lock()
+        self._labels: Dict[str, Tuple[str, ...]] = {
+            HANDLER_SECONDS: ('handler', 'step'), HANDLER_OPERATION_SECONDS: ('handler', 'step', 'kind'),
+            OPERATION_SECONDS: ('kind', 'name'), OPERATION_ERRORS: ('kind', 'name', 'type'),
+            ERRORS: ('handler', 'type')}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._collectors: Dict[str, Tuple[str, Callable[[], Dict[str, float]]]] = {}
+
+    def observe(self, family: str, labels: Labels, value: float) -> None:
+        """Добавляет наблюдение в гистограмму."""
+        with self._lock:
+            histogram: Optional[Histogram] = self._histograms.get((family, labels))
+            if histogram is None:
+                histogram = self._histograms[family, labels] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, family: str, labels: Labels, value: float = 1.0) -> None:
+        """Увеличивает счетчик."""
+        with self._lock:
+            self._counters[family, labels] = self._counters.get((family, labels), 0.0) + value
+
+    def finish(self, request: Request, seconds: float) -> None:
+        """Записывает время обработки обновления и время его запросов по видам одной блокировкой."""
+        with self._lock:
+            request.finished = True
+            key: Tuple[str, Labels] = (HANDLER_SECONDS, (request.handler, request.step))
+            histogram: Optional[Histogram] = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+            for kind, spent in request.operations.items():
+                self._add_spent(request, kind, spent)
+
+    def spend(self, request: Request, kind: str, seconds: float) -> None:
+        """Прибавляет время запроса к обновлению, а после завершения обработчика - сразу к счетчику команды."""
+        with self._lock:
+            # Запросы одного обновления могут идти из нескольких потоков (запросы по месяцам)
+            request.operations[kind] = request.operations.get(kind, 0.0) + seconds
+            if request.finished:
+                self._add_spent(request, kind, seconds)
+
+    def _add_spent(self, request: Request, kind: str, seconds: float) -> None:
+        counter: Tuple[str, Labels] = (HANDLER_OPERATION_SECONDS, (request.handler, request.step, kind))
+        self._counters[counter] = self._counters.get(counter, 0.0) + seconds
+
+    def add_collector(self, prefix: str, description: str, collect: Callable[[], Dict[str, float]]) -> None:
+        """Регистрирует показатели модуля; повторная регистрация с тем же префиксом заменяет прежнюю.
+
+        Args:
+            prefix (str): Префикс имен: показатель `key` выводится как `{prefix}_{key}`.
+            description (str): Описание для строк HELP.
+            collect (Callable[[], Dict[str, float]]): Текущие значения по именам.
+        """
+        with self._lock:
+            self._collectors[prefix] = (description, collect)
+
+    def histograms(self, family: str) -> Dict[Labels, Histogram]:
+        """Копии гистограмм семейства по меткам."""
+        result: Dict[Labels, Histogram] = {}
+        with self._lock:
+            for (name, labels), histogram in self._histograms.items():
+                if name == family:
+                    copy: Histogram = Histogram()
+                    copy.counts, copy.sum, copy.count = list(histogram.counts), histogram.sum, histogram.count
+                    result[labels] = copy
+        return result
+
+    def counters(self, family: str) -> Dict[Labels, float]:
+        """Значения счетчиков семейства по меткам."""
+        with self._lock:
+            return {labels: value for (name, labels), value in self._counters.items() if name == family}
+
+    def reset(self) -> None:
+        """Обнуляет гистограммы и счетчики (показатели модулей остаются)."""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus (версия 0.0.4)."""
+        with self._lock:
+            histograms: Dict[Tuple[str, Labels], Tuple[List[int], float, int]] = {
+                key: (list(histogram.counts), histogram.sum, histogram.count)
+                for key, histogram in self._histograms.items()}
+            counters: Dict[Tuple[str, Labels], float] = dict(self._counters)
+            collectors: List[Tuple[str, Tuple[str, Callable[[], Dict[str, float]]]]] = list(self._collectors.items())
+
+        lines: List[str] = []
+        for family, (kind, description) in FAMILIES.items():
+            names: Tuple[str, ...] = self._labels[family]
+            lines.append(f'# HELP {family} {description}')
+            lines.append(f'# TYPE {family} {kind}')
+            if kind == 'histogram':
+                for (name, labels), (counts, total, count) in sorted(histograms.items()):
+                    if name != family:
+                        continue
+                    prefix: str = _format_labels(names, labels)
+                    cumulative: int = 0
+                    for bound, bucket in zip(BUCKETS + (float('inf'),), counts):
+                        cumulative += bucket
+                        le: str = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{family}_bucket{{{prefix},le="{le}"}} {cumulative}')
+                    lines.append(f'{family}_sum{{{prefix}}} {total!r}')
+                    lines.append(f'{family}_count{{{prefix}}} {count}')
+            else:
+                lines.extend(f'{family}{{{_format_labels(names, labels)}}} {value!r}'
+                             for (name, labels), value in sorted(counters.items()) if name == family)
+
+        for prefix, (description, collect) in sorted(collectors):
+            try:
+                values: Dict[str, float] = collect()
+            except Exception:
+                logger.exception(f'Не удалось получить показатели {prefix}')
+                continue
+            for key, value in values.items():
+                lines.append(f'# HELP {prefix}_{key} {description}')
+                lines.append(f'# TYPE {prefix}_{key} gauge')
+                lines.append(f'{prefix}_{key} {float(value)!r}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(names: Iterable[str], values: Labels) -> str:
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Метрики процесса
+registry: MetricsRegistry = MetricsRegistry()
+
+
+class operation:
+    """Замер одного запроса: `with operation('sqlite', 'history'): ...`.
+
+    Время попадает в гистограмму travelbot_operation_seconds и в сумму по виду запроса
+    у обрабатываемого обновления, исключение - в travelbot_operation_errors_total.
+    """
+
+    __slots__ = ('kind', 'name', 'request', 'started')
+
+    def __init__(self, kind: str, name: str, request: Optional[Request] = None) -> None:
+        """
+        Args:
+            kind (str): Вид запроса: sqlite, reference, http, render или telegram.
+            name (str): Что именно запрашивается: база, справочник, эндпоинт или метод API.
+            request (Optional[Request]): Обновление, к которому относится запрос; по умолчанию текущее.
+        """
+        self.kind: str = kind
+        self.name: str = name
+        self.request: Optional[Request] = request or _current.get()
+        self.started: float = 0.0
+
+    def __enter__(self) -> 'operation':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, error_type: Optional[type], error: Optional[BaseException], traceback: Any) -> None:
+        seconds: float = time.perf_counter() - self.started
+        registry.observe(OPERATION_SECONDS, (self.kind, self.name), seconds)
+        if error_type is not None and issubclass(error_type, Exception):
+            registry.inc(OPERATION_ERRORS, (self.kind, self.name, error_type.__name__))
+        if self.request is not None:
+            registry.spend(self.request, self.kind, seconds)
+            if self.request.trace is not None:
+                self.request.trace.span(self.kind, self.name, self.started, seconds)
+
+
+def timed(kind: str, name: str) -> Callable[[Callable], Callable]:
+    """Декоратор функции или корутины, замеряющий каждый вызов как operation(kind, name)."""
+
+    def decorator(function: Callable) -> Callable:
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs) -> Any:
+                with operation(kind, name):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs) -> Any:
+            with operation(kind, name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def bind(kind: str, name: str, call: Callable[[], Any]) -> Callable[[], Any]:
+    """Запрос, который выполнится позже в другом потоке, но засчитается текущему обновлению.
+
+    Так отправки из очереди исходящих сообщений попадают в метрики команды, которая их поставила.
+    """
+    request: Optional[Request] = _current.get()
+
+    def run() -> Any:
+        with operation(kind, name, request):
+            return call()
+    return run
+
+
+def bind_async(kind: str, name: str, call: Callable[[], Awaitable[Any]]) -> Callable[[], Awaitable[Any]]:
+    """То же, что bind, для функции, возвращающей корутину."""
+    request: Optional[Request] = _current.get()
+
+    async def run() -> Any:
+        with operation(kind, name, request):
+            return await call()
+    return run
+
+
+def current_request() -> Optional[Request]:
+    """Обновление, которое сейчас обрабатывается, или None вне обработчика."""
+    return _current.get()
+
+
+def label_request(handler: str, step: str) -> None:
+    """Уточняет команду и шаг обрабатываемого обновления.
+
+    Ответ на шаг диалога приходит в общий обработчик, и только автомат диалогов знает,
+    к какой команде и шагу он относится.
+    """
+    request: Optional[Request] = _current.get()
+    if request is not None:
+        request.handler, request.step = handler, step
+
+
+def record_error(error: BaseException, log: bool = True) -> None:
+    """Учитывает ошибку обработчика и пишет ее в журнал с трассировкой.
+
+    Обработчики отвечают пользователю "Что-то пошло не так", а причина остается
+    в журнале и в счетчике travelbot_errors_total.
+
+    Args:
+        error (BaseException): Перехваченное исключение.
+        log (bool): Писать ли в журнал; исключения, вышедшие из обработчика, пишет сам telebot.
+    """
+    request: Optional[Request] = _current.get()
+    handler: str = request.handler if request is not None else ''
+    if request is not None:
+        request.error = type(error).__name__
+    registry.inc(ERRORS, (handler, type(error).__name__))
+    if log:
+        logger.error(f'Ошибка в обработчике {handler or "вне обработчика"}: {error!r}',
+                     exc_info=(type(error), error, error.__traceback__))
+
+
+def _request_labels(update: Any, handler: str, step: str, commands: bool) -> Tuple[str, str]:
+    command: Optional[str] = (util.extract_command(update.text)
+                              if commands and isinstance(update, types.Message) and update.text else None)
+    return ('/' + command, 'command') if command else (handler, step)
+
+
+def instrument_handler(function: Callable, commands: bool = False) -> Callable:
+    """Обертка обработчика telebot, замеряющая обработку каждого обновления.
+
+    Метки по умолчанию - модуль и имя функции обработчика (например, flights, process_origin);
+    у обработчиков команд - сама команда (/low) и шаг command.
+
+    Args:
+        function (Callable): Обработчик: функция или корутина, первый аргумент - обновление.
+        commands (bool): Обработчик зарегистрирован на команды.
+
+    Returns:
+        Callable: Обработчик с замером.
+    """
+    handler: str = function.__module__.rsplit('.', 1)[-1]
+    step: str = function.__name__
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def async_handler_wrapper(update: Any, *args, **kwargs) -> Any:
+            request: Request = Request(*_request_labels(update, handler, step, commands))
+            token = _current.set(request)
+            _start(request)
+            try:
+                return await function(update, *args, **kwargs)
+            except Exception as e:
+                record_error(e, log=False)
+                raise
+            finally:
+                _current.reset(token)
+                _finish(request)
+        return async_handler_wrapper
+
+    @functools.wraps(function)
+    def handler_wrapper(update: Any, *args, **kwargs) -> Any:
+        request: Request = Request(*_request_labels(update, handler, step, commands))
+        token = _current.set(request)
+        _start(request)
+        try:
+            return function(update, *args, **kwargs)
+        except Exception as e:
+            record_error(e, log=False)
+            raise
+        finally:
+            _current.reset(token)
+            _finish(request)
+    return handler_wrapper
+
+
+class RequestLog:
+    """Журнал обработанных обновлений: одна строка JSON на обновление."""
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): Файл журнала; '-' - стандартный поток ошибок.
+        """
+        self.path: str = path
+        self._lock: threading.Lock = threading.Lock()
+        self._file: Optional[TextIO] = None
+
+    def write(self, request: Request, seconds: float) -> None:
+        record: Dict[str, Any] = {'time': round(time.time(), 3), 'handler': request.handler, 'step': request.step,
+                                  'seconds': round(seconds, 6), 'error': request.error}
+        record.update((kind, round(spent, 6)) for kind, spent in request.operations.items())
+        line: str = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            if self._file is None:
+                self._file = sys.stderr if self.path == '-' else open(self.path, 'a', encoding='utf-8', buffering=1)
+            self._file.write(line)
+
+
+request_log: Optional[RequestLog] = RequestLog(config.METRICS_LOG) if config.METRICS_LOG else None
+
+
+class RequestHook:
+    """Наблюдатель за обработкой обновлений, например профилировщик (utils.profiler)."""
+
+    def started(self, request: Request) -> None:
+        """Вызывается в потоке или задаче обработчика перед его вызовом."""
+
+    def finished(self, request: Request, seconds: float) -> None:
+        """Вызывается после обработчика, когда время обработки уже записано в метрики."""
+
+
+_hooks: List[RequestHook] = []
+
+
+def add_request_hook(hook: RequestHook) -> None:
+    """Подключает наблюдателя ко всем обработчикам, обернутым instrument_handler."""
+    _hooks.append(hook)
+
+
+def _start(request: Request) -> None:
+    for hook in _hooks:
+        hook.started(request)
+
+
+def _finish(request: Request) -> None:
+    seconds: float = time.perf_counter() - request.started
+    registry.finish(request, seconds)
+    for hook in _hooks:
+        hook.finished(request, seconds)
+    if request_log is not None:
+        try:
+            request_log.write(request, seconds)
+        except OSError as e:
+            logger.error(f'Не удалось записать журнал метрик: {e}')
+
+
+class TimedSqliteDatabase(pw.SqliteDatabase):
+    """База SQLite, каждый запрос к которой замеряется как operation('sqlite', name).
+
+    Замеряется выполнение запроса до первой строки результата: у SELECT остальные строки
+    читаются уже при обходе курсора.
+    """
+
+    def __init__(self, database: str, *args, metrics_name: str = 'sqlite', **kwargs) -> None:
+        """
+        Args:
+            database (str): Путь к файлу базы данных.
+            metrics_name (str): Имя базы в метках метрик.
+        """
+        super().__init__(database, *args, **kwargs)
+        self.metrics_name: str = metrics_name
+
+    def execute_sql(self, sql: str, *args, **kwargs) -> Any:
+        with operation('sqlite', self.metrics_name):
+            return super().execute_sql(sql, *args, **kwargs)
+
+
+# Страницы HTTP-сервера метрик: путь -> функция, возвращающая текст страницы
+_routes: Dict[str, Callable[[], str]] = {'/metrics': registry.render}
+
+
+def add_route(path: str, render: Callable[[], str]) -> None:
+    """Добавляет на сервер метрик текстовую страницу, например выгрузку профилировщика."""
+    _routes[path] = render
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        render: Optional[Callable[[], str]] = _routes.get(self.path.split('?', 1)[0])
+        if render is None:
+            self.send_error(404)
+            return
+        body: bytes = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        # Prometheus опрашивает метрики каждые несколько секунд: такие запросы не пишем в журнал
+        pass
+
+
+def start_metrics_server(port: int = config.METRICS_PORT,
+                         host: str = config.METRICS_HOST) -> Optional[ThreadingHTTPServer]:
+    """Запускает в фоновом потоке HTTP-сервер с метриками по адресу /metrics (и страницами add_route).
+
+    Args:
+        port (int): Порт; 0 - сервер не запускается.
+        host (str): Адрес, на котором принимать подключения.
+
+    Returns:
+        Optional[ThreadingHTTPServer]: Запущенный сервер или None, если метрики выключены.
+    """
+    if port <= 0:
+        return None
+    server: ThreadingHTTPServer = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f'Метрики доступны на http://{host}:{port}/metrics')
+    return server
@@ -0,0 +1,171 @@
+import random
+import threading
+import time
+from operator import itemgetter
+from typing import Callable, Dict, List, Optional
+
+import requests as rq
+from telebot import logger
+
+from config_data import config
+from database.gazetteer import CityRecord, gazetteer
+from database.watches import Route, Watch, watched_routes, watches_below
+from utils.aviasales import AviasalesError, fetch_prices_for_dates, flight_cache, format_flight
+from utils.metrics import registry
+
+# Как часто (сек) перечитывать из базы список направлений, чтобы заметить новые подписки
+ROUTES_REFRESH_INTERVAL: float = 60.0
+
+
+def alert_text(watch: Watch, flight: dict) -> str:
+    """Текст уведомления о снижении цены.
+
+    Args:
+        watch (Watch): Подписка пользователя.
+        flight (dict): Самый дешевый рейс из ответа prices_for_dates.
+
+    Returns:
+        str: Текст сообщения.
+    """
+    origin: Optional[CityRecord] = gazetteer.get_by_code(watch.origin)
+    destination: Optional[CityRecord] = gazetteer.get_by_code(watch.destination)
+    origin_ru: str = origin.ru if origin else watch.origin
+    destination_ru: str = destination.ru if destination else watch.destination
+    return (f'Цена на рейсы {origin_ru} - {destination_ru} в {watch.month} опустилась до {flight["price"]} ₽ '
+            f'(ваш порог {watch.threshold} ₽)\n\n{format_flight(flight, origin_ru, destination_ru)}')
+
+
+class PriceWatcher(threading.Thread):
+    """Фоновый поток, проверяющий цены по подпискам /watch.
+
+    Подписки группируются по направлению и месяцу, поэтому сколько бы пользователей ни
+    следило за одним направлением, раз в `interval` секунд делается один запрос первой
+    страницы prices_for_dates (или берется свежий ответ из общего кэша поиска). Новые
+    направления получают случайное время первой проверки в пределах интервала, а каждая
+    следующая сдвигается на случайную долю `jitter`, чтобы проверки не собирались в пачки.
+    Уведомления уходят через `notify`, то есть через очередь отправки бота с ее лимитами.
+    """
+
+    def __init__(self, notify: Callable[[int, str], object], interval: float = config.WATCH_INTERVAL,
+                 jitter: float = config.WATCH_JITTER, rng: Optional[random.Random] = None,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """
+        Args:
+            notify (Callable[[int, str], object]): Отправка уведомления: идентификатор чата и текст.
+            interval (float): Как часто проверять одно направление, в секундах.
+            jitter (float): Доля интервала, на которую случайно сдвигается следующая проверка.
+            rng (Optional[random.Random]): Источник случайных сдвигов.
+            clock (Callable[[], float]): Источник монотонного времени.
+        """
+        super().__init__(name='price-watcher', daemon=True)
+        self.notify: Callable[[int, str], object] = notify
+        self.interval: float = interval
+        self.jitter: float = jitter
+        self.rng: random.Random = rng or random.Random()
+        self.clock: Callable[[], float] = clock
+        # Направление -> время следующей проверки по clock()
+        self._schedule: Dict[Route, float] = {}
+        self._refreshed_at: Optional[float] = None
+        self._stopped: threading.Event = threading.Event()
+        self.polls: int = 0
+        self.alerts: int = 0
+
+    def run(self) -> None:
+        wait: float = 0.0
+        while not self._stopped.wait(wait):
+            try:
+                self.tick()
+            except Exception:
+                logger.exception('Ошибка при проверке подписок на цены')
+            wait = self.next_wait()
+
+    def stop(self) -> None:
+        """Останавливает поток после текущей проверки."""
+        self._stopped.set()
+
+    def tick(self) -> List[Route]:
+        """Проверяет направления, для которых подошло время.
+
+        Returns:
+            List[Route]: Проверенные направления.
+        """
+        now: float = self.clock()
+        if self._refreshed_at is None or now - self._refreshed_at >= ROUTES_REFRESH_INTERVAL:
+            self.refresh(now)
+        due: List[Route] = sorted((route for route, at in self._schedule.items() if at <= now),
+                                  key=self._schedule.__getitem__)
+        for route in due:
+            self.check(route)
+            self._schedule[route] = self.clock() + self.interval * self.rng.uniform(1 - self.jitter,
+                                                                                      1 + self.jitter)
+        return due
+
+    def refresh(self, now: float) -> None:
+        """Перечитывает направления из базы: добавляет новые в расписание и убирает лишние.
+
+        Args:
+            now (float): Текущее время по clock().
+        """
+        routes: List[Route] = watched_routes()
+        schedule: Dict[Route, float] = {}
+        for route in routes:
+            at: Optional[float] = self._schedule.get(route)
+            schedule[route] = at if at is not None else now + self.rng.uniform(0, self.interval)
+        self._schedule = schedule
+        self._refreshed_at = now
+
+    def next_wait(self) -> float:
+        """Сколько секунд ждать до следующей проверки или перечитывания направлений."""
+        now: float = self.clock()
+        wake: float = (self._refreshed_at or now) + ROUTES_REFRESH_INTERVAL
+        if self._schedule:
+            wake = min(wake, min(self._schedule.values()))
+        return max(0.0, wake - now)
+
+    def check(self, route: Route) -> List[Watch]:
+        """Проверяет цену по направлению и уведомляет подписчиков.
+
+        Args:
+            route (Route): Направление и месяц.
+
+        Returns:
+            List[Watch]: Уведомленные подписки.
+        """
+        # Проверка подписок не считается обращением пользователя к кэшу
+        flights: Optional[List[dict]] = flight_cache.get(route, count=False)
+        if flights is None:
+            try:
+                # Рейсы отсортированы по цене, поэтому самый дешевый - на первой странице
+                flights = fetch_prices_for_dates(*route)
+            except (AviasalesError, rq.RequestException) as e:
+                # Не удалось сейчас - проверим на следующем проходе
+                logger.warning(f'Не удалось проверить цену {route}: {e}')
+                return []
+            self.polls += 1
+        if not flights:
+            return []
+
+        cheapest: dict = min(flights, key=itemgetter('price'))
+        watches: List[Watch] = watches_below(route, cheapest['price'])
+        for watch in watches:
+            self.notify(watch.chat_id, alert_text(watch, cheapest))
+        self.alerts += len(watches)
+        return watches
+
+
+def start_price_watcher(notify: Callable[[int, str], object]) -> Optional[PriceWatcher]:
+    """Запускает проверку подписок /watch, если она включена в настройках.
+
+    Args:
+        notify (Callable[[int, str], object]): Отправка уведомления: идентификатор чата и текст.
+
+    Returns:
+        Optional[PriceWatcher]: Запущенный поток или None, если проверка выключена.
+    """
+    if config.WATCH_INTERVAL <= 0:
+        return None
+    watcher: PriceWatcher = PriceWatcher(notify)
+    watcher.start()
+    registry.add_collector('travelbot_price_watch', 'Проверки подписок /watch и отправленные уведомления',
+                           lambda: {'polls': watcher.polls, 'alerts': watcher.alerts})
+    return watcher
@@ -0,0 +1,341 @@
+import asyncio
+import datetime
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from types import FrameType
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from config_data import config
+from utils.metrics import Request, RequestHook, add_request_hook, add_route
+
+# Обертки utils.metrics.instrument_handler: стек обработчика начинается сразу после них
+_WRAPPERS: frozenset = frozenset({'handler_wrapper', 'async_handler_wrapper'})
+_METRICS_MODULE: str = 'utils.metrics'
+# Сколько самых медленных трасс показывает /profile traces
+TRACES_SHOWN: int = 5
+# Максимальная длина текста одного сообщения Telegram
+MESSAGE_LIMIT: int = 4096
+
+USAGE_TEXT: str = ('Команды профилировщика:\n'
+                   '/profile - состояние\n'
+                   '/profile on [процент] - включить, со снятием стеков у указанного процента обновлений\n'
+                   '/profile off - выключить\n'
+                   '/profile traces - самые медленные сохраненные трассы\n'
+                   '/profile dump - стеки и трассы файлами в формате folded stacks (для flamegraph.pl)\n'
+                   '/profile clear - удалить сохраненные трассы')
+
+
+class Trace:
+    """Трасса одного обновления: его запросы по порядку и снятые стеки обработчика.
+
+    Отправки из очереди завершаются уже после обработчика и дописываются в трассу позже.
+    """
+
+    __slots__ = ('handler', 'step', 'started_at', 'origin', 'seconds', 'error', 'spans', 'samples',
+                 'thread', 'task')
+
+    def __init__(self, request: Request) -> None:
+        """
+        Args:
+            request (Request): Обновление, которое начал обрабатывать обработчик.
+        """
+        self.handler: str = request.handler
+        self.step: str = request.step
+        self.started_at: float = time.time()
+        self.origin: float = request.started
+        self.seconds: float = 0.0
+        self.error: Optional[str] = None
+        # (вид, имя, начало от начала обработки, длительность) в секундах
+        self.spans: List[Tuple[str, str, float, float]] = []
+        # Стек в формате folded stacks -> сколько раз он был снят
+        self.samples: Counter = Counter()
+        # Поток и задача asyncio обработчика, если у обновления снимаются стеки
+        self.thread: Optional[int] = None
+        self.task: Optional['asyncio.Task[Any]'] = None
+
+    def span(self, kind: str, name: str, started: float, seconds: float) -> None:
+        """Добавляет запрос; вызывается из utils.metrics.operation в любом потоке."""
+        self.spans.append((kind, name, started - self.origin, seconds))
+
+
+class Profiler(RequestHook):
+    """Профилировщик обработчиков: трассы запросов и выборочное снятие стеков.
+
+    Пока профилирование включено, у каждого обновления записываются все его запросы
+    (поиск города, внешние API, названия аэропортов, отправки). У доли sample_rate
+    обновлений фоновый поток еще и раз в interval секунд снимает стек обработчика:
+    для синхронного бота - стек его потока, для асинхронного - цепочку корутин его задачи,
+    поэтому видно и то, чего обработчик ждет. Трассы обновлений, обработка которых заняла
+    не меньше threshold секунд, и трассы со снятыми стеками попадают в кольцевой буфер
+    из size последних трасс. Буфер выгружается в формате folded stacks для flamegraph.pl
+    и speedscope.
+    """
+
+    def __init__(self, enabled: bool = config.PROFILE_ENABLED, sample_rate: float = config.PROFILE_SAMPLE_RATE,
+                 interval: float = config.PROFILE_INTERVAL, threshold: float = config.PROFILE_SLOW_THRESHOLD,
+                 size: int = config.PROFILE_TRACES, rng: Optional[random.Random] = None) -> None:
+        """
+        Args:
+            enabled (bool): Профилирование включено.
+            sample_rate (float): Доля обновлений, у которых снимаются стеки, от 0 до 1.
+            interval (float): Как часто (сек) снимать стеки.
+            threshold (float): С какой длительности обработки (сек) трасса сохраняется.
+            size (int): Сколько последних трасс хранить.
+            rng (Optional[random.Random]): Источник случайных чисел для выбора обновлений.
+        """
+        self.enabled: bool = enabled
+        self.sample_rate: float = sample_rate
+        self.interval: float = interval
+        self.threshold: float = threshold
+        self.traces: Deque[Trace] = deque(maxlen=size)
+        self.rng: random.Random = rng or random.Random()
+        self.traced: int = 0
+        self.sampled: int = 0
+        self._lock: threading.Lock = threading.Lock()
+        # Трассы обновлений, у которых сейчас снимаются стеки
+        self._active: Dict[int, Trace] = {}
+        self._wakeup: threading.Event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def configure(self, enabled: bool, sample_rate: Optional[float] = None) -> None:
+        """Включает или выключает профилирование и меняет долю обновлений со снятием стеков."""
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        self.enabled = enabled
+
+    def clear(self) -> None:
+        """Удаляет сохраненные трассы."""
+        with self._lock:
+            self.traces.clear()
+
+    def started(self, request: Request) -> None:
+        if not self.enabled:
+            return
+        trace: Trace = Trace(request)
+        request.trace = trace
+        self.traced += 1
+        if self.rng.random() >= self.sample_rate:
+            return
+        trace.thread = threading.get_ident()
+        trace.task = _current_task()
+        with self._lock:
+            self.sampled += 1
+            self._active[id(trace)] = trace
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name='profiler', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def finished(self, request: Request, seconds: float) -> None:
+        trace: Optional[Trace] = request.trace
+        if trace is None:
+            return
+        # Ответ на шаг диалога получает команду и шаг только внутри обработчика
+        trace.handler, trace.step, trace.seconds, trace.error = request.handler, request.step, seconds, request.error
+        with self._lock:
+            self._active.pop(id(trace), None)
+            if seconds >= self.threshold or trace.samples:
+                self.traces.append(trace)
+
+    def folded_stacks(self) -> str:
+        """Снятые стеки сохраненных трасс в формате folded stacks.
+
+        Returns:
+            str: Строки "команда;шаг;модуль:функция;... количество", корень стека - обработчик.
+        """
+        counts: Counter = Counter()
+        with self._lock:
+            for trace in self.traces:
+                for stack, count in trace.samples.items():
+                    counts[f'{trace.handler};{trace.step};{stack}'] += count
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(counts.items()))
+
+    def folded_spans(self) -> str:
+        """Запросы сохраненных трасс в формате folded stacks, ширина - микросекунды.
+
+        У каждой команды и шага собственная ширина - время обработки, не занятое запросами.
+        Запросы по нескольким месяцам идут одновременно, а отправки - после обработчика,
+        поэтому сумма запросов может быть больше времени обработки.
+
+        Returns:
+            str: Строки "команда;шаг;вид;имя микросекунды".
+        """
+        with self._lock:
+            traces: List[Trace] = list(self.traces)
+        counts: Counter = Counter()
+        for trace in traces:
+            root: str = f'{trace.handler};{trace.step}'
+            spans: List[Tuple[str, str, float, float]] = list(trace.spans)
+            inside: float = sum(seconds for _, _, offset, seconds in spans if offset < trace.seconds)
+            counts[root] += max(0, round((trace.seconds - inside) * 1e6))
+            for kind, name, _, seconds in spans:
+                counts[f'{root};{kind};{name}'] += round(seconds * 1e6)
+        return ''.join(f'{stack} {value}\n' for stack, value in sorted(counts.items()) if value)
+
+    def format_traces(self, limit: int = TRACES_SHOWN) -> str:
+        """Самые медленные сохраненные трассы: запросы по порядку с началом и длительностью.
+
+        Подряд идущие одинаковые запросы (например, отправки страниц) сворачиваются в одну строку.
+
+        Args:
+            limit (int): Сколько трасс показать.
+
+        Returns:
+            str: Текст для сообщения или страницы сервера метрик.
+        """
+        with self._lock:
+            traces: List[Trace] = sorted(self.traces, key=lambda trace: trace.seconds, reverse=True)[:limit]
+        if not traces:
+            return 'Сохраненных трасс нет'
+        blocks: List[str] = []
+        for trace in traces:
+            started: str = datetime.datetime.fromtimestamp(trace.started_at).strftime('%Y-%m-%d %H:%M:%S')
+            lines: List[str] = [f'{trace.handler} {trace.step}: {trace.seconds * 1000:.0f} мс, {started}'
+                                + (f', ошибка {trace.error}' if trace.error else '')
+                                + (f', стеков {sum(trace.samples.values())}' if trace.samples else '')]
+            for kind, name, offset, seconds, count in _collapse(sorted(trace.spans, key=lambda span: span[2])):
+                lines.append(f'  +{offset * 1000:.0f} мс {kind} {name}' + (f' x{count}' if count > 1 else '')
+                             + f': {seconds * 1000:.1f} мс')
+            blocks.append('\n'.join(lines))
+        return '\n\n'.join(blocks)
+
+    def status(self) -> str:
+        """Состояние профилировщика одной строкой для ответа на /profile."""
+        with self._lock:
+            saved: int = len(self.traces)
+        return (f'Профилирование {"включено" if self.enabled else "выключено"}: стеки у {self.sample_rate:.1%} '
+                f'обновлений раз в {self.interval * 1000:g} мс, трассы от {self.threshold:g} с. '
+                f'Трассировано обновлений: {self.traced}, со стеками: {self.sampled}, '
+                f'сохранено трасс: {saved} из {self.traces.maxlen}')
+
+    def _sample(self) -> None:
+        while True:
+            with self._lock:
+                active: List[Trace] = list(self._active.values())
+                if not active:
+                    self._wakeup.clear()
+            if not active:
+                self._wakeup.wait()
+                continue
+            frames: Dict[int, FrameType] = sys._current_frames()
+            stacks: List[Tuple[Trace, Optional[str]]] = [(trace, _stack(trace, frames)) for trace in active]
+            with self._lock:
+                for trace, stack in stacks:
+                    if stack:
+                        trace.samples[stack] += 1
+            time.sleep(self.interval)
+
+
+def _current_task() -> Optional['asyncio.Task[Any]']:
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        # Синхронный обработчик: цикла событий в этом потоке нет
+        return None
+
+
+def _stack(trace: Trace, frames: Dict[int, FrameType]) -> Optional[str]:
+    """Текущий стек обработчика трассы в формате folded stacks или None, если он уже завершился."""
+    stack: List[FrameType] = _thread_frames(frames.get(trace.thread))
+    if trace.task is not None:
+        awaiting: List[FrameType] = _coroutine_frames(trace.task)
+        if not awaiting:
+            return None
+        # Если задача сейчас выполняется, в стеке потока видны и ее синхронные вызовы,
+        # иначе - цепочка корутин до той, что ждет ответа
+        if not any(frame is awaiting[-1] for frame in stack):
+            stack = awaiting
+    for index, frame in enumerate(stack):
+        if frame.f_code.co_name in _WRAPPERS and frame.f_globals.get('__name__') == _METRICS_MODULE:
+            names: List[str] = [_frame_name(inner) for inner in stack[index + 1:]
+                                if inner.f_globals.get('__name__') != _METRICS_MODULE]
+            return ';'.join(names) or None
+    return None
+
+
+def _thread_frames(frame: Optional[FrameType]) -> List[FrameType]:
+    stack: List[FrameType] = []
+    while frame is not None:
+        stack.append(frame)
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _coroutine_frames(task: 'asyncio.Task[Any]') -> List[FrameType]:
+    stack: List[FrameType] = []
+    awaitable: Any = task.get_coro()
+    while awaitable is not None:
+        frame: Optional[FrameType] = (getattr(awaitable, 'cr_frame', None) or getattr(awaitable, 'gi_frame', None)
+                                      or getattr(awaitable, 'ag_frame', None))
+        if frame is None:
+            break
+        stack.append(frame)
+        awaitable = (getattr(awaitable, 'cr_await', None) or getattr(awaitable, 'gi_yieldfrom', None)
+                     or getattr(awaitable, 'ag_await', None))
+    return stack
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f'{frame.f_globals.get("__name__", "?")}:{getattr(code, "co_qualname", code.co_name)}'.replace(
+        '.<locals>', '')
+
+
+def _collapse(spans: List[Tuple[str, str, float, float]]) -> List[Tuple[str, str, float, float, int]]:
+    collapsed: List[Tuple[str, str, float, float, int]] = []
+    for kind, name, offset, seconds in spans:
+        if collapsed and collapsed[-1][:2] == (kind, name):
+            previous: Tuple[str, str, float, float, int] = collapsed[-1]
+            collapsed[-1] = (kind, name, previous[2], previous[3] + seconds, previous[4] + 1)
+        else:
+            collapsed.append((kind, name, offset, seconds, 1))
+    return collapsed
+
+
+def profile_command(arguments: Optional[str]) -> Tuple[str, List[Tuple[str, bytes]]]:
+    """Выполняет служебную команду /profile.
+
+    Args:
+        arguments (Optional[str]): Текст после команды: on [процент], off, traces, dump, clear или пусто.
+
+    Returns:
+        Tuple[str, List[Tuple[str, bytes]]]: Текст ответа и файлы (имя и содержимое), которые надо отправить.
+    """
+    words: List[str] = (arguments or '').split()
+    action: str = words[0].lower() if words else 'status'
+    if action == 'on' and len(words) <= 2:
+        try:
+            rate: Optional[float] = float(words[1].rstrip('%')) / 100 if len(words) == 2 else None
+        except ValueError:
+            return USAGE_TEXT, []
+        if rate is not None and not 0 <= rate <= 1:
+            return USAGE_TEXT, []
+        profiler.configure(True, rate)
+        return profiler.status(), []
+    if action == 'off' and len(words) == 1:
+        profiler.configure(False)
+        return profiler.status(), []
+    if action == 'status' and len(words) <= 1:
+        return profiler.status(), []
+    if action == 'traces' and len(words) == 1:
+        return profiler.format_traces()[:MESSAGE_LIMIT], []
+    if action == 'dump' and len(words) == 1:
+        files: List[Tuple[str, bytes]] = [(name, text.encode('utf-8')) for name, text in (
+            ('stacks.folded', profiler.folded_stacks()), ('spans.folded', profiler.folded_spans())) if text]
+        return f'Сохранено трасс: {len(profiler.traces)}' + ('' if files else ', выгружать нечего'), files
+    if action == 'clear' and len(words) == 1:
+        profiler.clear()
+        return profiler.status(), []
+    return USAGE_TEXT, []
+
+
+# Профилировщик процесса: подключен ко всем обработчикам и отдает выгрузки на сервере метрик
+profiler: Profiler = Profiler()
+add_request_hook(profiler)
+add_route('/profile/stacks', profiler.folded_stacks)
+add_route('/profile/spans', profiler.folded_spans)
+add_route('/profile/traces', lambda: profiler.format_traces(limit=len(profiler.traces)) + '\n')
@@ -0,0 +1,344 @@
+import abc
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import peewee as pw
+from telebot import Handler, TeleBot, logger
+from telebot.handler_backends import HandlerBackend
+
+from config_data import config
+from database.gazetteer import CityRecord
+from utils.metrics import TimedSqliteDatabase
+
+# Путь к базе данных шагов диалогов по умолчанию
+STATE_DB_PATH: str = os.path.join(os.path.dirname(__file__), '..', 'database', 'state.db')
+# Каталог хранилища шагов диалогов в файлах по умолчанию
+STATE_DIR_PATH: str = os.path.join(os.path.dirname(__file__), '..', 'database', 'state')
+# Как часто (в секундах) удалять из SQLite шаги, которые так и не были продолжены
+CLEANUP_INTERVAL: float = 60.0
+
+
+class StateStore(abc.ABC):
+    """Хранилище шагов диалогов, общее для всех процессов бота.
+
+    Для каждого чата хранится очередь записей (строк JSON). Реализация должна выполнять
+    pop атомарно: если два процесса одновременно забирают шаги одного чата, записи
+    достаются только одному из них. Хранилище поверх Redis укладывается в тот же
+    интерфейс: RPUSH для push, LRANGE и DEL в одной транзакции MULTI для pop, DEL для clear,
+    а срок жизни задается через EXPIRE.
+    """
+
+    def __init__(self, ttl: float = config.STATE_TTL) -> None:
+        """
+        Args:
+            ttl (float): Через сколько секунд незавершенный шаг считается брошенным.
+        """
+        self.ttl: float = ttl
+
+    @abc.abstractmethod
+    def push(self, chat_id: int, record: str) -> None:
+        """Добавляет запись в очередь чата."""
+
+    @abc.abstractmethod
+    def pop(self, chat_id: int) -> List[str]:
+        """Забирает и удаляет все не устаревшие записи чата, от старых к новым."""
+
+    @abc.abstractmethod
+    def clear(self, chat_id: int) -> None:
+        """Удаляет все записи чата."""
+
+    @abc.abstractmethod
+    def usage(self) -> Tuple[int, int]:
+        """Сколько чатов с не устаревшими записями и сколько байт занимают их записи."""
+
+
+class MemoryStateStore(StateStore):
+    """Хранилище в памяти процесса: подходит, только если чат всегда попадает в один процесс."""
+
+    def __init__(self, ttl: float = config.STATE_TTL) -> None:
+        super().__init__(ttl)
+        self._lock: threading.Lock = threading.Lock()
+        self._records: Dict[int, List[tuple]] = {}
+        self._cleaned_at: float = time.time()
+
+    def push(self, chat_id: int, record: str) -> None:
+        now: float = time.time()
+        with self._lock:
+            if now - self._cleaned_at >= CLEANUP_INTERVAL:
+                # Брошенные диалоги никто не заберет через pop, удаляем их сами
+                self._cleaned_at = now
+                for stale in [chat for chat, records in self._records.items() if records[-1][0] < now - self.ttl]:
+                    del self._records[stale]
+            self._records.setdefault(chat_id, []).append((now, record))
+
+    def pop(self, chat_id: int) -> List[str]:
+        with self._lock:
+            records: List[tuple] = self._records.pop(chat_id, [])
+        deadline: float = time.time() - self.ttl
+        return [record for created_at, record in records if created_at >= deadline]
+
+    def clear(self, chat_id: int) -> None:
+        with self._lock:
+            self._records.pop(chat_id, None)
+
+    def usage(self) -> Tuple[int, int]:
+        deadline: float = time.time() - self.ttl
+        with self._lock:
+            sizes: List[int] = [sum(len(record.encode('utf-8')) for created_at, record in records
+                                    if created_at >= deadline) for records in self._records.values()]
+        return sum(1 for size in sizes if size), sum(sizes)
+
+
+class SQLiteStateStore(StateStore):
+    """Хранилище в файле SQLite, общее для всех процессов на одной машине."""
+
+    def __init__(self, path: str = STATE_DB_PATH, ttl: float = config.STATE_TTL, table: str = 'step') -> None:
+        """
+        Args:
+            path (str): Путь к файлу базы данных.
+            ttl (float): Через сколько секунд незавершенный шаг считается брошенным.
+            table (str): Имя таблицы, чтобы несколько хранилищ могли жить в одной базе.
+        """
+        super().__init__(ttl)
+        self.table: str = table
+        self.db: pw.SqliteDatabase = TimedSqliteDatabase(path, pragmas={'journal_mode': 'wal', 'synchronous': 'normal'},
+                                                         metrics_name='state')
+        self._cleaned_at: float = 0.0
+        self.db.execute_sql(f'CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, '
+                            'chat_id INTEGER NOT NULL, record TEXT NOT NULL, created_at REAL NOT NULL)')
+        self.db.execute_sql(f'CREATE INDEX IF NOT EXISTS {table}_chat_id ON {table} (chat_id)')
+        self.db.execute_sql(f'CREATE INDEX IF NOT EXISTS {table}_created_at ON {table} (created_at)')
+
+    def push(self, chat_id: int, record: str) -> None:
+        now: float = time.time()
+        with self.db.atomic('IMMEDIATE'):
+            if now - self._cleaned_at >= CLEANUP_INTERVAL:
+                self._cleaned_at = now
+                self.db.execute_sql(f'DELETE FROM {self.table} WHERE created_at < ?', (now - self.ttl,))
+            self.db.execute_sql(f'INSERT INTO {self.table} (chat_id, record, created_at) VALUES (?, ?, ?)',
+                                (chat_id, record, now))
+
+    def pop(self, chat_id: int) -> List[str]:
+        # IMMEDIATE сразу берет блокировку на запись, поэтому чтение и удаление
+        # в двух процессах не могут перемешаться
+        with self.db.atomic('IMMEDIATE'):
+            rows: List[tuple] = self.db.execute_sql(f'SELECT record, created_at FROM {self.table} '
+                                                    'WHERE chat_id = ? ORDER BY id', (chat_id,)).fetchall()
+            if rows:
+                self.db.execute_sql(f'DELETE FROM {self.table} WHERE chat_id = ?', (chat_id,))
+        deadline: float = time.time() - self.ttl
+        return [record for record, created_at in rows if created_at >= deadline]
+
+    def clear(self, chat_id: int) -> None:
+        self.db.execute_sql(f'DELETE FROM {self.table} WHERE chat_id = ?', (chat_id,))
+
+    def usage(self) -> Tuple[int, int]:
+        chats, size = self.db.execute_sql(f'SELECT COUNT(DISTINCT chat_id), SUM(LENGTH(CAST(record AS BLOB))) '
+                                          f'FROM {self.table} WHERE created_at >= ?',
+                                          (time.time() - self.ttl,)).fetchone()
+        return chats, size or 0
+
+
+class FileStateStore(StateStore):
+    """Хранилище в каталоге: по одному JSON-файлу на чат.
+
+    Файл всегда заменяется целиком через os.replace, а pop сначала атомарно переименовывает
+    его в уникальное имя, поэтому забрать записи чата может только один процесс. push читает
+    и перезаписывает файл, поэтому записи одного чата в каждый момент должен добавлять один
+    процесс - в режиме webhook это обеспечивает закрепление чатов за процессами.
+    """
+
+    def __init__(self, directory: str = STATE_DIR_PATH, ttl: float = config.STATE_TTL) -> None:
+        """
+        Args:
+            directory (str): Каталог для файлов чатов.
+            ttl (float): Через сколько секунд незавершенный шаг считается брошенным.
+        """
+        super().__init__(ttl)
+        self.directory: str = directory
+        self._lock: threading.Lock = threading.Lock()
+        self._cleaned_at: float = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def push(self, chat_id: int, record: str) -> None:
+        path: str = self._path(chat_id)
+        now: float = time.time()
+        with self._lock:
+            if now - self._cleaned_at >= CLEANUP_INTERVAL:
+                self._cleaned_at = now
+                self._remove_stale(now - self.ttl)
+            records: List[list] = self._read(path)
+            records.append([now, record])
+            temporary: str = f'{path}.{uuid.uuid4().hex}.tmp'
+            with open(temporary, 'w', encoding='utf-8') as file:
+                json.dump(records, file, ensure_ascii=False)
+            os.replace(temporary, path)
+
+    def pop(self, chat_id: int) -> List[str]:
+        path: str = self._path(chat_id)
+        taken: str = f'{path}.{uuid.uuid4().hex}.taken'
+        try:
+            os.replace(path, taken)
+        except FileNotFoundError:
+            return []
+        records: List[list] = self._read(taken)
+        os.remove(taken)
+        deadline: float = time.time() - self.ttl
+        return [record for created_at, record in records if created_at >= deadline]
+
+    def clear(self, chat_id: int) -> None:
+        try:
+            os.remove(self._path(chat_id))
+        except FileNotFoundError:
+            pass
+
+    def usage(self) -> Tuple[int, int]:
+        deadline: float = time.time() - self.ttl
+        chats: int = 0
+        size: int = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                records: List[list] = self._read(entry.path)
+                fresh: List[str] = [record for created_at, record in records if created_at >= deadline]
+                chats += bool(fresh)
+                size += sum(len(record.encode('utf-8')) for record in fresh)
+        return chats, size
+
+    def _remove_stale(self, deadline: float) -> None:
+        # Файл меняется при каждом шаге, поэтому время изменения - время последней записи
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json') and entry.stat().st_mtime < deadline:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def _path(self, chat_id: int) -> str:
+        return os.path.join(self.directory, f'{chat_id}.json')
+
+    @staticmethod
+    def _read(path: str) -> List[list]:
+        try:
+            with open(path, encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return []
+
+
+def create_state_store(name: str = 'step', kind: str = config.STATE_STORE, path: str = config.STATE_STORE_PATH,
+                       ttl: float = config.STATE_TTL) -> StateStore:
+    """Создает хранилище по настройкам.
+
+    Args:
+        name (str): Имя хранилища: таблица в базе SQLite или подкаталог для хранилища в файлах.
+        kind (str): Тип хранилища: memory, sqlite или file.
+        path (str): Путь к базе или каталогу; пустая строка - путь по умолчанию.
+        ttl (float): Через сколько секунд запись устаревает.
+
+    Returns:
+        StateStore: Хранилище.
+
+    Raises:
+        ValueError: Если тип хранилища неизвестен.
+    """
+    if kind == 'memory':
+        return MemoryStateStore(ttl)
+    if kind == 'sqlite':
+        return SQLiteStateStore(path or STATE_DB_PATH, ttl, table=name)
+    if kind == 'file':
+        return FileStateStore(os.path.join(path or STATE_DIR_PATH, name), ttl)
+    raise ValueError(f'Неизвестный тип хранилища шагов диалогов: {kind}')
+
+
+def step_name(callback: Callable) -> str:
+    """Имя шага диалога, одинаковое во всех процессах: модуль и имя функции."""
+    return f'{callback.__module__}.{callback.__name__}'
+
+
+def _encode(value: Any) -> Any:
+    # CityRecord - кортеж, и json сохранил бы его как обычный список, поэтому помечаем его заранее
+    if isinstance(value, CityRecord):
+        return {'__city__': list(value)}
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(value: dict) -> Any:
+    if '__city__' in value:
+        return CityRecord(*value['__city__'])
+    return value
+
+
+class SharedStepBackend(HandlerBackend):
+    """Хранилище обработчиков следующего шага (register_next_step_handler) для telebot.
+
+    Вместо самой функции сохраняет ее имя и аргументы в JSON, поэтому диалог, начатый
+    в одном процессе, может продолжить любой другой. Функции шагов должны быть заранее
+    зарегистрированы через register_steps в каждом процессе.
+    """
+
+    def __init__(self, store: StateStore) -> None:
+        """
+        Args:
+            store (StateStore): Хранилище записей.
+        """
+        super().__init__()
+        self.store: StateStore = store
+        self.steps: Dict[str, Callable] = {}
+
+    def add_steps(self, *callbacks: Callable) -> None:
+        """Регистрирует функции шагов диалога."""
+        for callback in callbacks:
+            self.steps[step_name(callback)] = callback
+
+    def register_handler(self, handler_group_id: int, handler: Handler) -> None:
+        name: str = step_name(handler.callback)
+        if name not in self.steps:
+            raise ValueError(f'Шаг диалога {name} не зарегистрирован через register_steps')
+        record: str = json.dumps({'step': name, 'args': _encode(handler.args), 'kwargs': _encode(handler.kwargs)},
+                                 ensure_ascii=False)
+        self.store.push(handler_group_id, record)
+
+    def clear_handlers(self, handler_group_id: int) -> None:
+        self.store.clear(handler_group_id)
+
+    def get_handlers(self, handler_group_id: int) -> Optional[List[Handler]]:
+        handlers: List[Handler] = []
+        for record in self.store.pop(handler_group_id):
+            data: dict = json.loads(record, object_hook=_decode)
+            callback: Optional[Callable] = self.steps.get(data['step'])
+            if callback is None:
+                # Шаг мог быть сохранен предыдущей версией бота
+                logger.warning('Неизвестный шаг диалога %s, пропускаем', data['step'])
+                continue
+            handlers.append(Handler(callback, *data['args'], **data['kwargs']))
+        return handlers or None
+
+    def load_handlers(self, filename: str, del_file_after_loading: bool) -> None:
+        """Ничего не делает: шаги уже лежат в общем хранилище и не сохраняются в файл.
+
+        Вызывается из bot.load_next_step_handlers(), который нужен только FileHandlerBackend.
+        """
+
+
+def create_step_backend() -> SharedStepBackend:
+    """Хранилище обработчиков следующего шага по настройкам STATE_STORE и STATE_STORE_PATH."""
+    return SharedStepBackend(create_state_store())
+
+
+def register_steps(bot: TeleBot, *steps: Callable) -> None:
+    """Регистрирует функции шагов диалога, если бот хранит шаги через SharedStepBackend.
+
+    Args:
+        bot (TeleBot): Объект бота.
+        *steps (Callable): Функции, которые передаются в register_next_step_handler.
+    """
+    if isinstance(bot.next_step_backend, SharedStepBackend):
+        bot.next_step_backend.add_steps(*steps)
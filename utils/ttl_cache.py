@@ -0,0 +1,285 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Set, Tuple
+
+import peewee as pw
+
+from utils.metrics import TimedSqliteDatabase
+
+
+class _Flight:
+    """Загрузка значения, которую ждут все одновременные запросы одного ключа."""
+
+    def __init__(self) -> None:
+        self.done: threading.Event = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш с временем жизни записей.
+
+    Запись считается свежей в течение `ttl` секунд после сохранения (время жизни можно
+    задать и для отдельной записи). Еще `stale_ttl` секунд она может отдаваться как
+    устаревшая, пока в фоне загружается новое значение (stale-while-revalidate).
+    Одновременные промахи по одному ключу ждут одну общую загрузку. При переполнении
+    вытесняется запись, к которой дольше всего не обращались. Если указан `persist_path`,
+    записи дублируются в SQLite-файл и переживают перезапуск бота; значения в этом случае
+    должны сериализоваться в JSON. В файле тоже хранится не больше `maxsize` записей:
+    при каждой записи из него удаляются записи, которые уже нельзя отдать, и записи
+    с самым ранним сроком свежести сверх `maxsize`.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 1800.0, stale_ttl: float = 0.0,
+                 persist_path: Optional[str] = None) -> None:
+        """
+        Args:
+            maxsize (int): Максимальное количество записей в памяти и в SQLite-файле.
+            ttl (float): Время жизни свежей записи в секундах.
+            stale_ttl (float): Сколько секунд после истечения ttl запись еще можно отдавать.
+            persist_path (Optional[str]): Путь к SQLite-файлу для хранения записей между запусками.
+        """
+        self.maxsize: int = maxsize
+        self.ttl: float = ttl
+        self.stale_ttl: float = stale_ttl
+        self.hits: int = 0
+        self.misses: int = 0
+        self.stale_hits: int = 0
+        self.shared_loads: int = 0
+        self._lock: threading.RLock = threading.RLock()
+        # Ключ -> (значение, свежая до, можно отдавать до)
+        self._entries: 'OrderedDict[Hashable, Tuple[Any, float, float]]' = OrderedDict()
+        self._refreshing: Set[Hashable] = set()
+        self._loading: Dict[Hashable, _Flight] = {}
+        self._db: Optional[pw.SqliteDatabase] = None
+        if persist_path:
+            self._db = TimedSqliteDatabase(persist_path, metrics_name='cache')
+            self._db.execute_sql('CREATE TABLE IF NOT EXISTS cache_entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                                 'fresh_until REAL NOT NULL, stale_until REAL NOT NULL)')
+            # По этому индексу при каждой записи находятся лишние записи сверх maxsize
+            self._db.execute_sql('CREATE INDEX IF NOT EXISTS cache_entries_fresh_until '
+                                 'ON cache_entries (fresh_until)')
+            self._prune()
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        """Возвращает свежее значение по ключу.
+
+        Args:
+            key (Hashable): Ключ записи.
+            default (Any): Значение, если свежей записи нет.
+            count (bool): Учитывать обращение в попаданиях и промахах. Фоновые задачи
+                (например, проверка подписок) передают False, чтобы не искажать долю попаданий
+                для пользователей.
+
+        Returns:
+            Any: Сохраненное значение или default.
+        """
+        with self._lock:
+            entry: Optional[Tuple[Any, float, float]] = self._lookup(key)
+            if entry is not None and time.time() < entry[1]:
+                if count:
+                    self.hits += 1
+                return entry[0]
+            if count:
+                self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Сохраняет значение в кэш.
+
+        Args:
+            key (Hashable): Ключ записи.
+            value (Any): Значение.
+            ttl (Optional[float]): Время жизни записи; по умолчанию общее для кэша.
+        """
+        fresh_until: float = time.time() + (self.ttl if ttl is None else ttl)
+        stale_until: float = fresh_until + self.stale_ttl
+        with self._lock:
+            self._remember(key, (value, fresh_until, stale_until))
+            if self._db is not None:
+                with self._db.atomic():
+                    self._db.execute_sql('INSERT OR REPLACE INTO cache_entries (key, value, fresh_until, stale_until) '
+                                         'VALUES (?, ?, ?, ?)',
+                                         (self._db_key(key), json.dumps(value), fresh_until, stale_until))
+                    self._prune()
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Возвращает значение из кэша, при необходимости загружая его через `loader`.
+
+        Свежая запись возвращается сразу. Устаревшая, но еще допустимая запись тоже
+        возвращается сразу, а обновление запускается в фоновом потоке (одно на ключ).
+        Если записи нет, `loader` вызывается синхронно, причем одновременные запросы того же
+        ключа ждут этот же вызов. Исключения из `loader` пробрасываются всем ожидающим,
+        и в кэш ничего не попадает.
+
+        Args:
+            key (Hashable): Ключ записи.
+            loader (Callable[[], Any]): Функция загрузки значения.
+            ttl (Optional[float]): Время жизни загруженной записи; по умолчанию общее для кэша.
+
+        Returns:
+            Any: Значение из кэша или только что загруженное.
+        """
+        with self._lock:
+            entry: Optional[Tuple[Any, float, float]] = self._lookup(key)
+            if entry is not None:
+                if time.time() < entry[1]:
+                    self.hits += 1
+                    return entry[0]
+                self.stale_hits += 1
+                self._refresh_in_background(key, loader, ttl)
+                return entry[0]
+            self.misses += 1
+            flight: Optional[_Flight] = self._loading.get(key)
+            owner: bool = flight is None
+            if owner:
+                flight = self._loading[key] = _Flight()
+            else:
+                self.shared_loads += 1
+
+        if not owner:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+            self.set(key, flight.value, ttl)
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            flight.done.set()
+
+    def peek(self, key: Hashable) -> Optional[Tuple[Any, bool]]:
+        """Значение по ключу с признаком свежести, без загрузки.
+
+        Для кода, который сам загружает и обновляет значения (utils.async_http): устаревшая,
+        но еще допустимая запись возвращается с признаком False. Попадания и промахи
+        учитываются так же, как в get_or_load.
+
+        Args:
+            key (Hashable): Ключ записи.
+
+        Returns:
+            Optional[Tuple[Any, bool]]: Значение и True для свежей записи или None, если записи нет.
+        """
+        with self._lock:
+            entry: Optional[Tuple[Any, float, float]] = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.time() < entry[1]:
+                self.hits += 1
+                return entry[0], True
+            self.stale_hits += 1
+            return entry[0], False
+
+    @property
+    def persistent(self) -> bool:
+        """Записи дублируются в SQLite-файл, и обращение к кэшу может ждать диск."""
+        return self._db is not None
+
+    def remaining_ttl(self, key: Hashable) -> Optional[float]:
+        """Сколько секунд запись еще будет свежей.
+
+        Args:
+            key (Hashable): Ключ записи.
+
+        Returns:
+            Optional[float]: Оставшееся время (отрицательное для устаревшей записи)
+            или None, если записи нет.
+        """
+        with self._lock:
+            entry: Optional[Tuple[Any, float, float]] = self._entries.get(key)
+            return None if entry is None else entry[1] - time.time()
+
+    def invalidate(self, key: Hashable) -> None:
+        """Удаляет запись из кэша.
+
+        Args:
+            key (Hashable): Ключ записи.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            if self._db is not None:
+                self._db.execute_sql('DELETE FROM cache_entries WHERE key = ?', (self._db_key(key),))
+
+    def clear(self) -> None:
+        """Очищает кэш и сбрасывает счетчики."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.stale_hits = self.shared_loads = 0
+            if self._db is not None:
+                self._db.execute_sql('DELETE FROM cache_entries')
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики попаданий и промахов.
+
+        Returns:
+            Dict[str, int]: Количество попаданий, устаревших попаданий, промахов,
+            промахов, дождавшихся чужой загрузки, и записей.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'stale_hits': self.stale_hits, 'misses': self.misses,
+                    'shared_loads': self.shared_loads, 'size': len(self._entries)}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: Hashable) -> Optional[Tuple[Any, float, float]]:
+        entry: Optional[Tuple[Any, float, float]] = self._entries.get(key)
+        if entry is None and self._db is not None:
+            row: Optional[tuple] = self._db.execute_sql(
+                'SELECT value, fresh_until, stale_until FROM cache_entries WHERE key = ?',
+                (self._db_key(key),)).fetchone()
+            if row is not None:
+                entry = (json.loads(row[0]), row[1], row[2])
+                self._remember(key, entry)
+        if entry is None:
+            return None
+        if time.time() >= entry[2]:
+            self.invalidate(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remember(self, key: Hashable, entry: Tuple[Any, float, float]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _prune(self) -> None:
+        # Записи, которые уже нельзя отдать даже как устаревшие, и записи сверх maxsize
+        # с самым ранним сроком свежести. В таблице не больше maxsize + 1 строк, так что это дешево
+        self._db.execute_sql('DELETE FROM cache_entries WHERE stale_until < ?', (time.time(),))
+        self._db.execute_sql('DELETE FROM cache_entries WHERE key IN (SELECT key FROM cache_entries '
+                             'ORDER BY fresh_until DESC LIMIT -1 OFFSET ?)', (self.maxsize,))
+
+    def _refresh_in_background(self, key: Hashable, loader: Callable[[], Any], ttl: Optional[float]) -> None:
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+
+        def refresh() -> None:
+            try:
+                self.set(key, loader(), ttl)
+            except Exception:
+                # Устаревшая запись остается в кэше до конца stale_ttl, следующий запрос повторит попытку
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    @staticmethod
+    def _db_key(key: Hashable) -> str:
+        return json.dumps(key, ensure_ascii=False)
@@ -0,0 +1,67 @@
+import re
+from typing import List, Optional
+
+from config_data import config
+
+DATE_PATTERN: re.Pattern = re.compile(r'^\d{4}-\d{2}$')
+MONTH_RANGE_PATTERN: re.Pattern = re.compile(r'^(\d{4})-(\d{2})\.\.(\d{4})-(\d{2})$')
+PRICE_RANGE_PATTERN: re.Pattern = re.compile(r'^\d+-\d+$')
+
+
+def validate_date_format(date_text: str) -> bool:
+    """Проверка формата даты.
+
+    Args:
+        date_text (str): Текст с датой.
+
+    Returns:
+        bool: Результат проверки.
+    """
+    return bool(date_text and DATE_PATTERN.match(date_text))
+
+
+def validate_price_range(price_range_text: str) -> bool:
+    """Проверка формата диапазона цен.
+
+    Args:
+        price_range_text (str): Текст с диапазоном цен.
+
+    Returns:
+        bool: Результат проверки.
+    """
+    return bool(price_range_text and PRICE_RANGE_PATTERN.match(price_range_text))
+
+
+def month_range(range_text: str) -> Optional[List[str]]:
+    """Месяцы диапазона "YYYY-MM..YYYY-MM" по порядку.
+
+    Args:
+        range_text (str): Текст с диапазоном месяцев.
+
+    Returns:
+        Optional[List[str]]: Месяцы в формате YYYY-MM или None, если диапазон неверный,
+        пустой или длиннее FLIGHT_SEARCH_MAX_MONTHS.
+    """
+    match: Optional[re.Match] = MONTH_RANGE_PATTERN.match(range_text or '')
+    if not match:
+        return None
+    start_year, start_month, end_year, end_month = (int(part) for part in match.groups())
+    if not (1 <= start_month <= 12 and 1 <= end_month <= 12):
+        return None
+    first: int = start_year * 12 + start_month - 1
+    last: int = end_year * 12 + end_month - 1
+    if not 0 <= last - first < config.FLIGHT_SEARCH_MAX_MONTHS:
+        return None
+    return [f'{month // 12:04d}-{month % 12 + 1:02d}' for month in range(first, last + 1)]
+
+
+def validate_month_range(range_text: str) -> bool:
+    """Проверка месяца YYYY-MM или диапазона месяцев YYYY-MM..YYYY-MM.
+
+    Args:
+        range_text (str): Текст с месяцем или диапазоном месяцев.
+
+    Returns:
+        bool: Результат проверки.
+    """
+    return validate_date_format(range_text) or month_range(range_text) is not None
@@ -0,0 +1,217 @@
+import threading
+import time
+from collections import Counter
+from typing import List, Optional, Tuple
+
+import requests as rq
+
+from config_data import config
+from utils.http_client import meteosource_client
+from utils.metrics import registry
+from utils.ttl_cache import TTLCache
+
+DAILY_FORECAST_PATH: str = '/daily'
+RAPID_API_HOST: str = 'ai-weather-by-meteosource.p.rapidapi.com'
+
+# Точность округления координат: 2 знака - около километра, прогноз при этом не меняется
+COORDINATES_PRECISION: int = 2
+
+# Общий кэш прогнозов по координатам
+forecast_cache: TTLCache = TTLCache(maxsize=config.WEATHER_CACHE_SIZE, ttl=config.WEATHER_CACHE_TTL)
+registry.add_collector('travelbot_forecast_cache', 'Кэш прогнозов погоды', forecast_cache.stats)
+
+# Сколько раз запрашивался прогноз по каждому ключу; по нему прогреватель выбирает популярные города
+_requests_count: Counter = Counter()
+_requests_lock: threading.Lock = threading.Lock()
+
+
+def forecast_key(lat: float, lon: float) -> Tuple[float, float]:
+    """Ключ кэша прогноза: координаты, округленные до COORDINATES_PRECISION знаков.
+
+    Args:
+        lat (float): Широта.
+        lon (float): Долгота.
+
+    Returns:
+        Tuple[float, float]: Округленные широта и долгота.
+    """
+    return round(lat, COORDINATES_PRECISION), round(lon, COORDINATES_PRECISION)
+
+
+def seconds_until_local_midnight(lon: float, now: Optional[float] = None) -> float:
+    """Сколько секунд осталось до полуночи по местному солнечному времени.
+
+    После полуночи первый день прогноза становится вчерашним, поэтому запись в кэше
+    не должна жить дольше этого момента. Часовой пояс оценивается по долготе.
+
+    Args:
+        lon (float): Долгота.
+        now (Optional[float]): Текущее время (Unix time), по умолчанию time.time().
+
+    Returns:
+        float: Количество секунд до местной полуночи.
+    """
+    local_time: float = (time.time() if now is None else now) + lon / 15 * 3600
+    return 86400 - local_time % 86400
+
+
+def daily_forecast_request(lat: float, lon: float) -> Tuple[dict, dict]:
+    """Параметры и заголовки запроса к эндпоинту /daily.
+
+    Args:
+        lat (float): Широта.
+        lon (float): Долгота.
+
+    Returns:
+        Tuple[dict, dict]: Параметры строки запроса и заголовки.
+    """
+    querystring: dict = {"lat": lat, "lon": lon, "timezone": "auto", "language": "en", "units": "metric"}
+    headers: dict = {
+        "X-RapidAPI-Key": config.RAPID_API_KEY,
+        "X-RapidAPI-Host": RAPID_API_HOST
+    }
+    return querystring, headers
+
+
+def fetch_daily_forecast(lat: float, lon: float) -> dict:
+    """Запрос прогноза на 21 день к API Meteosource в обход кэша.
+
+    Args:
+        lat (float): Широта.
+        lon (float): Долгота.
+
+    Returns:
+        dict: Ответ эндпоинта /daily.
+
+    Raises:
+        rq.RequestException: Если запрос не удался или API ответил ошибкой.
+    """
+    querystring, headers = daily_forecast_request(lat, lon)
+    response: rq.Response = meteosource_client.get(DAILY_FORECAST_PATH, params=querystring, headers=headers)
+    response.raise_for_status()
+    return response.json()
+
+
+def get_daily_forecast(lat: float, lon: float) -> dict:
+    """Прогноз на 21 день с использованием общего кэша.
+
+    Запись живет WEATHER_CACHE_TTL секунд, но не дольше местной полуночи. Одновременные
+    запросы одного города ждут один общий запрос к API.
+
+    Args:
+        lat (float): Широта.
+        lon (float): Долгота.
+
+    Returns:
+        dict: Ответ эндпоинта /daily.
+
+    Raises:
+        rq.RequestException: Если запрос не удался или API ответил ошибкой.
+    """
+    key: Tuple[float, float] = forecast_key(lat, lon)
+    count_request(key)
+    return forecast_cache.get_or_load(key, lambda: fetch_daily_forecast(*key), ttl=forecast_ttl(key))
+
+
+def forecast_ttl(key: Tuple[float, float]) -> float:
+    """Время жизни записи прогноза: WEATHER_CACHE_TTL, но не дольше местной полуночи.
+
+    Args:
+        key (Tuple[float, float]): Ключ кэша прогноза.
+
+    Returns:
+        float: Время жизни в секундах.
+    """
+    return min(config.WEATHER_CACHE_TTL, seconds_until_local_midnight(key[1]))
+
+
+def count_request(key: Tuple[float, float]) -> None:
+    """Учитывает запрос прогноза для выбора популярных городов прогревателем.
+
+    Args:
+        key (Tuple[float, float]): Ключ кэша прогноза.
+    """
+    with _requests_lock:
+        _requests_count[key] += 1
+
+
+class ForecastWarmer(threading.Thread):
+    """Фоновый поток, заранее обновляющий прогнозы самых популярных городов.
+
+    Раз в `interval` секунд берет `top` самых запрашиваемых координат и загружает прогноз
+    для тех, чья запись отсутствует или истечет до следующего прохода. Счетчики запросов
+    после каждого прохода уменьшаются вдвое, чтобы популярность отражала последние запросы.
+    """
+
+    def __init__(self, interval: float, top: int) -> None:
+        """
+        Args:
+            interval (float): Пауза между проходами в секундах.
+            top (int): Сколько самых популярных городов поддерживать в кэше.
+        """
+        super().__init__(name='forecast-warmer', daemon=True)
+        self.interval: float = interval
+        self.top: int = top
+        self._stopped: threading.Event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.warm()
+
+    def stop(self) -> None:
+        """Останавливает поток после текущего прохода."""
+        self._stopped.set()
+
+    def warm(self) -> List[Tuple[float, float]]:
+        """Один проход прогрева.
+
+        Returns:
+            List[Tuple[float, float]]: Координаты, для которых прогноз был загружен.
+        """
+        with _requests_lock:
+            popular: List[Tuple[float, float]] = [key for key, _ in _requests_count.most_common(self.top)]
+            for key in list(_requests_count):
+                _requests_count[key] //= 2
+                if not _requests_count[key]:
+                    del _requests_count[key]
+
+        warmed: List[Tuple[float, float]] = []
+        for key in popular:
+            remaining: Optional[float] = forecast_cache.remaining_ttl(key)
+            if remaining is not None and remaining > self.interval:
+                continue
+            try:
+                forecast_cache.set(key, fetch_daily_forecast(*key), ttl=forecast_ttl(key))
+                warmed.append(key)
+            except rq.RequestException:
+                # Не удалось сейчас - попробуем на следующем проходе
+                continue
+        return warmed
+
+
+def start_forecast_warmer() -> Optional[ForecastWarmer]:
+    """Запускает прогреватель кэша прогнозов, если он включен в настройках.
+
+    Returns:
+        Optional[ForecastWarmer]: Запущенный поток или None, если прогрев выключен.
+    """
+    if config.WEATHER_WARMER_INTERVAL <= 0:
+        return None
+    warmer: ForecastWarmer = ForecastWarmer(config.WEATHER_WARMER_INTERVAL, config.WEATHER_WARMER_TOP)
+    warmer.start()
+    return warmer
+
+
+def format_forecast_day(city_name: str, day_data: dict) -> str:
+    """Текст сообщения с прогнозом на один день.
+
+    Args:
+        city_name (str): Название города.
+        day_data (dict): День из ответа эндпоинта /daily.
+
+    Returns:
+        str: Описание погоды для отправки пользователю.
+    """
+    return (f'Город: {city_name}\n'
+            f'Дата: {day_data["day"]}\n'
+            f'Температура воздуха: {day_data["temperature"]} °C')
@@ -0,0 +1,97 @@
+import hmac
+import json
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+from telebot import logger
+
+
+def update_chat_id(update: dict) -> Optional[int]:
+    """Идентификатор чата, к которому относится обновление Telegram.
+
+    Args:
+        update (dict): Обновление в виде JSON.
+
+    Returns:
+        Optional[int]: Идентификатор чата или None, если обновление не связано с чатом.
+    """
+    for key in ('message', 'edited_message', 'channel_post', 'edited_channel_post'):
+        if key in update:
+            return update[key]['chat']['id']
+    callback_query: Optional[dict] = update.get('callback_query')
+    if callback_query and callback_query.get('message'):
+        return callback_query['message']['chat']['id']
+    for key in ('callback_query', 'inline_query', 'my_chat_member', 'chat_member'):
+        if key in update:
+            sender: Optional[dict] = update[key].get('from') or update[key].get('chat')
+            if sender:
+                return sender['id']
+    return None
+
+
+def worker_for(update: dict, workers: int) -> int:
+    """Номер процесса-обработчика для обновления.
+
+    Все обновления одного чата попадают в один и тот же процесс, поэтому в нем остаются
+    и кэшированные страницы результатов, и порядок сообщений пользователя.
+
+    Args:
+        update (dict): Обновление в виде JSON.
+        workers (int): Количество процессов-обработчиков.
+
+    Returns:
+        int: Номер процесса от 0 до workers - 1.
+    """
+    chat_id: Optional[int] = update_chat_id(update)
+    return (chat_id if chat_id is not None else update.get('update_id', 0)) % workers
+
+
+class WebhookServer(ThreadingHTTPServer):
+    """HTTP-сервер, принимающий обновления Telegram и раздающий их процессам-обработчикам.
+
+    Сам сервер обновления не обрабатывает: он проверяет путь и секрет, определяет чат
+    и кладет тело запроса в очередь процесса, за которым закреплен этот чат.
+    """
+
+    daemon_threads: bool = True
+
+    def __init__(self, address: Tuple[str, int], path: str, secret: str,
+                 queues: List[multiprocessing.Queue]) -> None:
+        """
+        Args:
+            address (Tuple[str, int]): Адрес и порт, которые слушает сервер.
+            path (str): Путь, на который Telegram присылает обновления.
+            secret (str): Ожидаемый заголовок X-Telegram-Bot-Api-Secret-Token; пустая строка - не проверять.
+            queues (List[multiprocessing.Queue]): Очереди процессов-обработчиков.
+        """
+        super().__init__(address, _WebhookRequestHandler)
+        self.webhook_path: str = path
+        self.secret: str = secret
+        self.queues: List[multiprocessing.Queue] = queues
+
+
+class _WebhookRequestHandler(BaseHTTPRequestHandler):
+    server: WebhookServer
+
+    def do_POST(self) -> None:
+        if self.path != self.server.webhook_path:
+            self.send_error(404)
+            return
+        secret: str = self.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if self.server.secret and not hmac.compare_digest(secret, self.server.secret):
+            self.send_error(403)
+            return
+        body: str = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        try:
+            update: dict = json.loads(body)
+        except ValueError:
+            self.send_error(400)
+            return
+        self.server.queues[worker_for(update, len(self.server.queues))].put(body)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug('webhook: ' + format, *args)